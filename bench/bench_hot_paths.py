@@ -0,0 +1,38 @@
+"""
+Benchmarks of the queries and pages which are requested most often. Each is run
+against synthetic results at the sizes given by the ``--sizes`` option. The
+fragment cache is disabled and so pages are rendered on each request.
+
+"""
+import pytest
+
+from psephology import query, resultset
+from psephology.model import result_storage
+
+def bench_constituency_winners(benchmark, app_context, size):
+    if result_storage() != 'normalized':
+        pytest.skip('constituency_winners() requires normalized storage')
+    rows = benchmark(lambda: query.constituency_winners().all())
+    assert len(rows) == size
+
+def bench_resultset_winners(benchmark, app_context, size):
+    rows = benchmark(resultset.winners)
+    assert len(rows) == size
+
+def bench_party_totals(benchmark, app_context, size):
+    rows = benchmark(lambda: query.party_totals().all())
+    assert len(rows) > 0
+
+def bench_api_constituencies(benchmark, client, size):
+    r = benchmark(client.get, '/api/constituencies')
+    assert r.status_code == 200
+    assert len(r.json['constituencies']) == size
+
+def bench_ui_summary(benchmark, client, size):
+    r = benchmark(client.get, '/summary')
+    assert r.status_code == 200
+
+def bench_ui_export_results(benchmark, client, size):
+    r = benchmark(client.get, '/export/results')
+    assert r.status_code == 200
+    assert r.data.count(b'\n') == size - 1
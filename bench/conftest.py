@@ -0,0 +1,75 @@
+"""
+Fixtures for the benchmark suite. Each benchmark is run against databases of
+synthetic results created by :py:mod:`synthetic` at each of the sizes given by
+the ``--sizes`` option.
+
+"""
+import pytest
+
+from psephology.app import create_app
+from psephology.model import db, rebuild_current_results
+
+import synthetic
+
+def pytest_addoption(parser):
+    parser.addoption(
+        '--sizes', default='650',
+        help='comma-separated numbers of constituencies to benchmark with')
+    parser.addoption(
+        '--parties', type=int, default=synthetic.PARTY_COUNT,
+        help='number of parties in the synthetic results')
+    parser.addoption(
+        '--seed', type=int, default=0,
+        help='seed for the synthetic results')
+    parser.addoption(
+        '--storage', default='normalized', choices=['normalized', 'packed'],
+        help='RESULT_STORAGE used for the current results')
+
+def pytest_generate_tests(metafunc):
+    if 'size' in metafunc.fixturenames:
+        sizes = [
+            int(s) for s in metafunc.config.getoption('sizes').split(',')]
+        metafunc.parametrize('size', sizes, scope='session')
+
+@pytest.fixture(scope='session')
+def app(size, request, tmp_path_factory):
+    """An application whose database holds size synthetic constituencies. The
+    fragment cache and slow query log are disabled so that every request
+    renders its response. Current results are stored as given by the
+    ``--storage`` option.
+
+    """
+    path = tmp_path_factory.mktemp('db-{}'.format(size)) / 'db.sqlite'
+
+    class Config:
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///{}'.format(path)
+        FRAGMENT_CACHE_SIZE = 0
+        SLOW_QUERY_THRESHOLD = None
+        RESULT_STORAGE = request.config.getoption('storage')
+
+    app = create_app(config_object=Config)
+    with app.app_context():
+        db.create_all()
+        synthetic.load(
+            db.session, size, party_count=request.config.getoption('parties'),
+            seed=request.config.getoption('seed'))
+        if app.config['RESULT_STORAGE'] != 'normalized':
+            rebuild_current_results()
+            db.session.commit()
+        db.session.remove()
+    return app
+
+@pytest.fixture
+def app_context(app):
+    """An application context for app which is torn down after the
+    benchmark.
+
+    """
+    with app.app_context():
+        yield
+        db.session.remove()
+
+@pytest.fixture
+def client(app):
+    """A test client for app."""
+    return app.test_client()
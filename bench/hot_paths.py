@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""
+Run the hot path benchmarks in bench_hot_paths.py and save or compare against
+baselines. Baselines are JSON files written by pytest-benchmark to
+bench/baselines. Comparing fails, and the script exits with a non-zero status,
+if the median time of any benchmark has increased by more than the threshold.
+
+Usage:
+    hot_paths.py save [--sizes=SIZES] [--parties=N] [--storage=STORAGE]
+        [--name=NAME]
+    hot_paths.py compare [--sizes=SIZES] [--parties=N] [--storage=STORAGE]
+        [--threshold=PERCENT] [<baseline>]
+
+Options:
+    -h --help               Show a usage summary
+    --sizes=SIZES           Comma-separated numbers of constituencies
+                            [default: 650,10000,100000]
+    --parties=N             Number of parties [default: 40]
+    --storage=STORAGE       RESULT_STORAGE, "normalized" or "packed"
+                            [default: normalized]
+    --name=NAME             Name of the saved baseline [default: baseline]
+    --threshold=PERCENT     Maximum permitted increase in median time, as a
+                            whole number of percent
+                            [default: 10]
+    <baseline>              Baseline to compare against, as a run number or
+                            prefix of its file name [default: the latest]
+
+"""
+import os
+import sys
+
+import docopt
+import pytest
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+#: Directory holding saved baselines
+BASELINES_DIR = os.path.join(BENCH_DIR, 'baselines')
+
+def main():
+    opts = docopt.docopt(__doc__)
+    args = [
+        '-c', os.path.join(BENCH_DIR, 'pytest.ini'),
+        '--rootdir', BENCH_DIR,
+        '--sizes', opts['--sizes'],
+        '--parties', opts['--parties'],
+        '--storage', opts['--storage'],
+        '--benchmark-storage', 'file://' + BASELINES_DIR,
+        os.path.join(BENCH_DIR, 'bench_hot_paths.py'),
+    ]
+    if opts['save']:
+        args.append('--benchmark-save=' + opts['--name'])
+    else:
+        args.extend([
+            '--benchmark-compare' + (
+                '=' + opts['<baseline>'] if opts['<baseline>'] else ''),
+            '--benchmark-compare-fail=median:{}%'.format(opts['--threshold']),
+        ])
+    return pytest.main(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
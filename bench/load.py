@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+
+"""
+Generate a mixed load of reads and imports and report throughput, latency
+percentiles and errors for each kind of request.
+
+Readers repeatedly request pages chosen at random from --paths. Writers
+repeatedly POST batches of synthetic results to /api/import, each round
+replacing the result of every constituency. Readers and writers run in separate
+processes, as they would when served by several gunicorn workers.
+
+By default, each process drives the application through Flask's test client
+using a shared SQLite database of synthetic results created for the run. When
+passed --serve, the script serves the application over HTTP from a
+multi-threaded local server instead. When passed --url, the script makes
+requests over HTTP to an already running server. The synthetic parties are
+added to its database before the run and so it should be a database whose
+results may be overwritten.
+
+Usage:
+    load.py [--url=URL | --serve] [--readers=N] [--writers=N]
+        [--duration=SECONDS] [--constituencies=N] [--parties=N]
+        [--batch=LINES] [--paths=PATHS]
+
+Options:
+    -h --help               Show a usage summary
+    --url=URL               Base URL of a running server
+    --serve                 Serve the application over HTTP locally
+    --readers=N             Number of reader processes [default: 4]
+    --writers=N             Number of writer processes [default: 1]
+    --duration=SECONDS      Duration of the run in seconds [default: 10]
+    --constituencies=N      Number of synthetic constituencies [default: 650]
+    --parties=N             Number of synthetic parties [default: 40]
+    --batch=LINES           Result lines per import [default: 100]
+    --paths=PATHS           Comma-separated paths requested by readers.
+                            Defaults to the API's party totals,
+                            constituencies and stats and the summary page.
+
+"""
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import docopt
+
+from psephology.app import create_app
+from psephology.model import db
+
+import synthetic
+
+#: Path to which writers POST results
+IMPORT_PATH = '/api/import'
+
+#: Paths requested by readers if --paths is not given
+DEFAULT_PATHS = [
+    '/api/party_totals', '/api/constituencies', '/api/stats', '/summary',
+]
+
+def main():
+    opts = docopt.docopt(__doc__)
+    paths = (
+        opts['--paths'].split(',') if opts['--paths'] is not None else
+        DEFAULT_PATHS
+    )
+    settings = dict(
+        duration=float(opts['--duration']),
+        constituencies=int(opts['--constituencies']),
+        parties=int(opts['--parties']),
+        batch=int(opts['--batch']),
+    )
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        server = None
+        if opts['--url'] is not None:
+            target = ('http', opts['--url'].rstrip('/'))
+            add_parties(make_transport(target), settings['parties'])
+        else:
+            path = os.path.join(tmpdir, 'db.sqlite')
+            create_database(
+                path, settings['constituencies'], settings['parties'])
+            target = ('client', path)
+            if opts['--serve']:
+                server, url = serve(path)
+                target = ('http', url)
+
+        try:
+            samples = run(
+                target, paths, int(opts['--readers']), int(opts['--writers']),
+                settings)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.join()
+
+    report(samples, settings['duration'])
+
+def make_app(path):
+    """Create an application using the database at path. Exceptions raised by
+    views are propagated so that they may be reported.
+
+    """
+    class Config:
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+        PROPAGATE_EXCEPTIONS = True
+    return create_app(config_object=Config)
+
+def create_database(path, constituency_count, party_count):
+    """Create a database at path holding synthetic results."""
+    app = make_app(path)
+    with app.app_context():
+        db.create_all()
+        synthetic.load(db.session, constituency_count, party_count)
+        db.session.remove()
+
+def serve(path):
+    """Serve the application using the database at path from a new process.
+    Returns the process and the base URL of the server.
+
+    """
+    urls = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_serve, args=(path, urls))
+    process.start()
+    return process, urls.get()
+
+def _serve(path, urls):
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, make_app(path), threaded=True)
+    urls.put('http://127.0.0.1:{}'.format(server.server_port))
+    server.serve_forever()
+
+def add_parties(transport, party_count):
+    """Add the synthetic parties via transport."""
+    body = json.dumps(dict(parties=[
+        dict(id=code, name=name)
+        for code, name in synthetic.parties(party_count)
+    ])).encode('utf8')
+    status, data = transport.request(
+        'POST', '/api/parties', body, 'application/json')
+    if status != 200:
+        raise RuntimeError('Failed to add parties: {} {!r}'.format(
+            status, data[:200]))
+
+class ClientTransport:
+    """Makes requests via the test client of an application using the database
+    at path.
+
+    """
+    def __init__(self, path):
+        self.client = make_app(path).test_client()
+
+    def request(self, method, path, data=None, content_type=None):
+        """Make a request and return the status code and body."""
+        r = self.client.open(
+            path, method=method, data=data, content_type=content_type)
+        return r.status_code, r.data
+
+class HTTPTransport:
+    """Makes requests over HTTP to the server at base_url."""
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def request(self, method, path, data=None, content_type=None):
+        """Make a request and return the status code and body."""
+        req = urllib.request.Request(
+            self.base_url + path, data=data, method=method)
+        if content_type is not None:
+            req.add_header('Content-Type', content_type)
+        try:
+            with urllib.request.urlopen(req) as r:
+                return r.status, r.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+def make_transport(target):
+    """Return a transport for target, a (kind, location) pair where kind is
+    'client' or 'http'.
+
+    """
+    kind, location = target
+    return ClientTransport(location) if kind == 'client' \
+        else HTTPTransport(location)
+
+def run(target, paths, readers, writers, settings):
+    """Run readers and writers against target for the configured duration.
+    Returns a list of (request, latency, error) samples where error is None for
+    successful requests.
+
+    """
+    samples = multiprocessing.Queue()
+    ready = multiprocessing.Barrier(readers + writers + 1)
+    processes = [
+        multiprocessing.Process(
+            target=_read, args=(target, paths, idx, settings, ready, samples))
+        for idx in range(readers)
+    ] + [
+        multiprocessing.Process(
+            target=_write, args=(target, idx, settings, ready, samples))
+        for idx in range(writers)
+    ]
+    for p in processes:
+        p.start()
+    ready.wait()
+
+    results = []
+    for _ in processes:
+        results.extend(samples.get())
+    for p in processes:
+        p.join()
+    return results
+
+def _timed(transport, name, method, path, data=None, content_type=None):
+    # Make a request and return a sample for it
+    start = time.perf_counter()
+    try:
+        status, body = transport.request(method, path, data, content_type)
+        error = None if status == 200 else _classify(status, body)
+    except Exception as e:
+        error = _classify_exception(e)
+    return name, time.perf_counter() - start, error
+
+def _classify(status, body):
+    # The message is only present in the body if the server reports it
+    if b'database is locked' in body:
+        return 'database is locked'
+    return 'HTTP {}'.format(status)
+
+def _classify_exception(e):
+    if 'database is locked' in str(e):
+        return 'database is locked'
+    return type(e).__name__
+
+def _read(target, paths, idx, settings, ready, samples):
+    transport = make_transport(target)
+    rng = random.Random(idx)
+    results = []
+    ready.wait()
+    deadline = time.monotonic() + settings['duration']
+    while time.monotonic() < deadline:
+        path = rng.choice(paths)
+        results.append(_timed(transport, 'GET ' + path, 'GET', path))
+    samples.put(results)
+
+def _write(target, idx, settings, ready, samples):
+    # Each round imports new results for every constituency in batches. The
+    # seed differs between writers and rounds so that every import changes
+    # the results.
+    transport = make_transport(target)
+    results = []
+    ready.wait()
+    deadline = time.monotonic() + settings['duration']
+    round_ = 0
+    while time.monotonic() < deadline:
+        round_ += 1
+        lines = list(synthetic.result_lines(
+            settings['constituencies'], settings['parties'],
+            seed=(idx + 1) * 1000003 + round_))
+        for start in range(0, len(lines), settings['batch']):
+            if time.monotonic() >= deadline:
+                break
+            body = '\n'.join(lines[start:start+settings['batch']])
+            results.append(_timed(
+                transport, 'POST ' + IMPORT_PATH, 'POST', IMPORT_PATH,
+                body.encode('utf8'), 'text/plain'))
+    samples.put(results)
+
+def percentile(values, p):
+    """Return the p-th percentile of a sorted list of values by the nearest
+    rank method.
+
+    """
+    return values[min(len(values) - 1, int(p / 100. * len(values)))]
+
+def report(samples, duration):
+    """Print throughput, latency percentiles and errors for each request."""
+    latencies = collections.defaultdict(list)
+    errors = collections.defaultdict(collections.Counter)
+    for name, latency, error in samples:
+        if error is None:
+            latencies[name].append(latency)
+        else:
+            errors[name][error] += 1
+
+    print('{:<28} {:>8} {:>8} {:>9} {:>9} {:>9} {:>8}'.format(
+        'request', 'ok', 'req/s', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)',
+        'errors'))
+    for name in sorted(set(latencies) | set(errors)):
+        values = sorted(latencies[name])
+        error_count = sum(errors[name].values())
+        error_rate = 100. * error_count / (len(values) + error_count)
+        if len(values) > 0:
+            p50, p95, p99 = (
+                '{:.1f}'.format(1e3 * percentile(values, p))
+                for p in (50, 95, 99))
+        else:
+            p50 = p95 = p99 = '-'
+        print('{:<28} {:>8} {:>8.1f} {:>9} {:>9} {:>9} {:>7.1f}%'.format(
+            name, len(values), len(values) / duration, p50, p95, p99,
+            error_rate))
+
+    for name in sorted(errors):
+        for error, count in errors[name].most_common():
+            print('{}: {} x {}'.format(name, count, error))
+
+if __name__ == '__main__':
+    main()
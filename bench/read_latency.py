@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+"""
+Measure the latency of reading results while results are being imported
+concurrently. The benchmark is run once with the SQLite pragma profile from
+the default configuration and once with SQLite's own defaults. Readers and
+the writer run in separate processes, as they would when served by several
+gunicorn workers.
+
+Usage:
+    read_latency.py [--readers=N] [--duration=SECONDS] [<results>]
+
+Options:
+    -h --help               Show a usage summary
+    --readers=N             Number of concurrent reader processes [default: 4]
+    --duration=SECONDS      Duration of each run in seconds [default: 10]
+    <results>               Results file to import
+                            [default: test-data/ge2017_results.txt]
+
+"""
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+import docopt
+
+from psephology.app import create_app
+from psephology.model import db, import_results, Party
+
+PARTIES = [
+    ('C', 'Conservative Party'), ('L', 'Labour Party'),
+    ('UKIP', 'UKIP'), ('LD', 'Liberal Democrats'), ('G', 'Green Party'),
+    ('SNP', 'SNP'),
+]
+
+def main():
+    opts = docopt.docopt(__doc__)
+    readers = int(opts['--readers'])
+    duration = float(opts['--duration'])
+    with open(opts['<results>'] or 'test-data/ge2017_results.txt') as f:
+        lines = f.read().splitlines()
+
+    print('{:<10} {:>8} {:>10} {:>10} {:>10} {:>8} {:>8}'.format(
+        'profile', 'reads', 'p50 (ms)', 'p95 (ms)', 'max (ms)', 'imports',
+        'errors'))
+    for name, pragmas in [('default', None), ('none', {})]:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'db.sqlite')
+            latencies, imports, errors = run(
+                path, lines, pragmas, readers, duration)
+        latencies.sort()
+        print('{:<10} {:>8} {:>10.1f} {:>10.1f} {:>10.1f} {:>8} {:>8}'.format(
+            name, len(latencies),
+            1e3 * statistics.median(latencies),
+            1e3 * latencies[int(0.95 * (len(latencies) - 1))],
+            1e3 * latencies[-1], imports, errors))
+
+def make_app(path, pragmas):
+    """Create an application using the database at path. If pragmas is not
+    None, it overrides the SQLITE_PRAGMAS configuration.
+
+    """
+    class Config:
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + path
+    if pragmas is not None:
+        Config.SQLITE_PRAGMAS = pragmas
+        Config.SQLITE_READ_ONLY_VIEWS = False
+    return create_app(config_object=Config)
+
+def run(path, lines, pragmas, readers, duration):
+    """Run the benchmark against a fresh database at path. Returns a list of
+    read latencies in seconds, the number of imports and the number of errors.
+
+    """
+    app = make_app(path, pragmas)
+    with app.app_context():
+        db.create_all()
+        for code, name in PARTIES:
+            db.session.add(Party(code=code, name=name))
+        import_results(lines)
+        db.session.commit()
+
+    results = multiprocessing.Queue()
+    deadline = time.time() + duration
+    processes = [
+        multiprocessing.Process(
+            target=_write, args=(path, pragmas, lines, deadline, results))
+    ] + [
+        multiprocessing.Process(
+            target=_read, args=(path, pragmas, deadline, results))
+        for _ in range(readers)
+    ]
+    for p in processes:
+        p.start()
+
+    latencies, imports, errors = [], 0, 0
+    for _ in processes:
+        kind, values, process_errors = results.get()
+        if kind == 'read':
+            latencies.extend(values)
+        else:
+            imports += values
+        errors += process_errors
+    for p in processes:
+        p.join()
+
+    return latencies, imports, errors
+
+def _read(path, pragmas, deadline, results):
+    client = make_app(path, pragmas).test_client()
+    latencies, errors = [], 0
+    while time.time() < deadline:
+        start = time.monotonic()
+        r = client.get('/api/constituencies')
+        if r.status_code == 200:
+            latencies.append(time.monotonic() - start)
+        else:
+            errors += 1
+    results.put(('read', latencies, errors))
+
+def _write(path, pragmas, lines, deadline, results):
+    # Repeatedly re-import the results. Each import replaces the result for
+    # every constituency.
+    imports, errors = 0, 0
+    with make_app(path, pragmas).app_context():
+        while time.time() < deadline:
+            try:
+                import_results(lines)
+                db.session.commit()
+                imports += 1
+            except Exception:
+                db.session.rollback()
+                errors += 1
+    results.put(('write', imports, errors))
+
+if __name__ == '__main__':
+    main()
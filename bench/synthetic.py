@@ -0,0 +1,117 @@
+"""
+Seeded generator of synthetic election results used by the benchmarks.
+
+Results are deterministic for a given seed so that runs of a benchmark on
+different revisions see identical data. Each constituency is contested by a
+random subset of the parties and no two parties in a constituency receive the
+same number of votes so that every constituency has a single winner.
+
+"""
+import datetime
+import random
+
+from sqlalchemy import insert
+
+from psephology.io import canonical_constituency_name
+from psephology.model import (
+    Constituency, Generation, Party, PartyTotal, ResultVersion,
+    VersionedVoting, Voting
+)
+
+#: Default number of parties
+PARTY_COUNT = 40
+
+#: Number of constituencies inserted at a time by :py:func:`load`
+LOAD_BATCH_SIZE = 5000
+
+def parties(party_count=PARTY_COUNT):
+    """Return a list of (code, name) pairs for party_count parties."""
+    return [
+        ('P{:02d}'.format(idx), 'Synthetic Party {}'.format(idx))
+        for idx in range(party_count)
+    ]
+
+def results(constituency_count, party_count=PARTY_COUNT, seed=0):
+    """Yield a (name, results) pair for each of constituency_count
+    constituencies where results is a list of vote count, party code pairs as
+    returned by :py:func:`psephology.io.parse_result_line`.
+
+    """
+    rng = random.Random(seed)
+    codes = [code for code, _ in parties(party_count)]
+    for idx in range(constituency_count):
+        standing = rng.sample(
+            codes, rng.randint(min(3, party_count), min(12, party_count)))
+        counts = rng.sample(range(100, 50000), len(standing))
+        yield (
+            'Constituency {:06d}'.format(idx),
+            list(zip(counts, standing))
+        )
+
+def result_lines(constituency_count, party_count=PARTY_COUNT, seed=0):
+    """Yield results from :py:func:`results` as lines in the results format
+    accepted by ``/api/import``.
+
+    """
+    for name, votes in results(constituency_count, party_count, seed):
+        yield ', '.join(
+            [name] + ['{}, {}'.format(count, code) for count, code in votes])
+
+def load(session, constituency_count, party_count=PARTY_COUNT, seed=0):
+    """Add the parties and results from :py:func:`results` to an empty
+    database via session and commit. Rows are inserted directly rather than via
+    :py:func:`psephology.model.import_results` so that large databases may be
+    created quickly. The party totals are computed as they are inserted.
+
+    """
+    party_ids = dict(
+        (code, idx + 1) for idx, (code, _) in enumerate(parties(party_count)))
+    session.execute(insert(Party.__table__), [
+        dict(id=party_ids[code], code=code, name=name)
+        for code, name in parties(party_count)])
+    generation = Generation()
+    session.add(generation)
+    session.flush()
+
+    now = datetime.datetime.utcnow()
+    vote_totals = dict((id, 0) for id in party_ids.values())
+    seat_totals = dict(vote_totals)
+
+    constituencies, versions, votings, versioned_votings = [], [], [], []
+
+    def _flush():
+        if len(constituencies) == 0:
+            return
+        session.execute(insert(Constituency.__table__), constituencies)
+        session.execute(insert(ResultVersion.__table__), versions)
+        session.execute(insert(Voting.__table__), votings)
+        session.execute(insert(VersionedVoting.__table__), versioned_votings)
+        for rows in (constituencies, versions, votings, versioned_votings):
+            del rows[:]
+
+    for idx, (name, votes) in enumerate(
+            results(constituency_count, party_count, seed)):
+        id = idx + 1
+        constituencies.append(dict(
+            id=id, name=name, canonical_name=canonical_constituency_name(name)))
+        versions.append(dict(
+            id=id, constituency_id=id, created_at=now,
+            generation_id=generation.id))
+        for count, code in votes:
+            votings.append(dict(
+                count=count, party_id=party_ids[code], constituency_id=id))
+            versioned_votings.append(dict(
+                count=count, party_id=party_ids[code], version_id=id))
+            vote_totals[party_ids[code]] += count
+        seat_totals[party_ids[max(votes)[1]]] += 1
+
+        if len(constituencies) >= LOAD_BATCH_SIZE:
+            _flush()
+    _flush()
+
+    session.execute(insert(PartyTotal.__table__), [
+        dict(party_id=id, vote_count=vote_totals[id],
+             seat_count=seat_totals[id])
+        for id in vote_totals
+    ])
+    session.commit()
@@ -70,6 +70,17 @@ def run_migrations_online():
                                 poolclass=pool.NullPool)
 
     connection = engine.connect()
+
+    # Batch mode rebuilds a SQLite table by copying it and dropping the
+    # original. With foreign keys enforced, dropping the original deletes every
+    # row which refers to it via ON DELETE CASCADE. Enforcement is turned off
+    # for the migration, which must be done outside of a transaction, and the
+    # constraints are checked before committing instead.
+    is_sqlite = connection.dialect.name == 'sqlite'
+    if is_sqlite:
+        connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        connection.commit()
+
     context.configure(connection=connection,
                       target_metadata=target_metadata,
                       process_revision_directives=process_revision_directives,
@@ -78,9 +89,24 @@ def run_migrations_online():
     try:
         with context.begin_transaction():
             context.run_migrations()
+            if is_sqlite:
+                check_sqlite_foreign_keys(connection)
     finally:
         connection.close()
 
+def check_sqlite_foreign_keys(connection):
+    """Raise RuntimeError if any row of a SQLite database refers to a row
+    which does not exist.
+
+    """
+    violations = connection.exec_driver_sql(
+        'PRAGMA foreign_key_check').fetchall()
+    if len(violations) > 0:
+        raise RuntimeError('Foreign key violations after migration: {}'.format(
+            ', '.join(
+                '{} row {} refers to missing {}'.format(table, rowid, parent)
+                for table, rowid, parent, _ in violations[:10])))
+
 if context.is_offline_mode():
     run_migrations_offline()
 else:
@@ -0,0 +1,144 @@
+"""add integer party keys
+
+Revision ID: 88df686cd6ac
+Revises: b0ba580c25b2
+Create Date: 2026-10-19 17:12:40.218305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '88df686cd6ac'
+down_revision = 'b0ba580c25b2'
+branch_labels = None
+depends_on = None
+
+
+# Parties become keyed by an integer with the existing text key kept as the
+# party's code. Changing the type of a primary key and of every column which
+# refers to it is not possible in place and so each table is renamed, re-created
+# with the new type and its rows copied across, mapping codes to keys via the
+# parties table. Renaming a table updates references to it from other tables and
+# so the old tables continue to refer only to each other until they are dropped.
+
+def _parties(party_key):
+    # Columns of the parties table keyed by party_key, 'integer' or 'code'
+    columns = [
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('code', sa.Text(), nullable=False),
+    ] if party_key == 'integer' else [
+        sa.Column('id', sa.Text(), nullable=False),
+    ]
+    return columns + [
+        sa.Column('name', sa.Text(), nullable=True),
+        sa.Column('generation_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['generation_id'], ['generations.id'], name='fk_parties_generation_id_generations', ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'),
+    ] + ([sa.UniqueConstraint('code')] if party_key == 'integer' else [])
+
+
+def _referring_tables(party_id_type):
+    # A (name, columns, indexes) tuple for each table which refers to parties.
+    # The party_id column is always last.
+    def _party_id(**kwargs):
+        return sa.Column('party_id', party_id_type, nullable=False, **kwargs)
+
+    def _party_fk():
+        return sa.ForeignKeyConstraint(['party_id'], ['parties.id'], ondelete='CASCADE')
+
+    return [
+        ('votings', [
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.Column('constituency_id', sa.Integer(), nullable=False),
+            _party_id(),
+            sa.ForeignKeyConstraint(['constituency_id'], ['constituencies.id'], ondelete='CASCADE'),
+            _party_fk(),
+            sa.PrimaryKeyConstraint('id'),
+        ], ['constituency_id', 'party_id']),
+        ('versioned_votings', [
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.Column('version_id', sa.Integer(), nullable=False),
+            _party_id(),
+            sa.ForeignKeyConstraint(['version_id'], ['result_versions.id'], ondelete='CASCADE'),
+            _party_fk(),
+            sa.PrimaryKeyConstraint('id'),
+        ], ['version_id', 'party_id']),
+        ('party_totals', [
+            sa.Column('vote_count', sa.Integer(), nullable=False),
+            sa.Column('seat_count', sa.Integer(), nullable=False),
+            _party_id(),
+            _party_fk(),
+            sa.PrimaryKeyConstraint('party_id'),
+        ], []),
+        ('region_party_totals', [
+            sa.Column('region_id', sa.Integer(), nullable=False),
+            sa.Column('vote_count', sa.Integer(), nullable=False),
+            sa.Column('seat_count', sa.Integer(), nullable=False),
+            _party_id(),
+            sa.ForeignKeyConstraint(['region_id'], ['regions.id'], ondelete='CASCADE'),
+            _party_fk(),
+            sa.PrimaryKeyConstraint('region_id', 'party_id'),
+        ], []),
+        ('party_total_snapshots', [
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('vote_count', sa.Integer(), nullable=False),
+            sa.Column('seat_count', sa.Integer(), nullable=False),
+            _party_id(),
+            _party_fk(),
+            sa.PrimaryKeyConstraint('id'),
+        ], ['created_at', 'party_id']),
+    ]
+
+
+def _rebuild(party_key, party_id_type, copy_parties, party_expression,
+             party_join):
+    # Re-create parties and the tables which refer to them. copy_parties
+    # copies rows from _parties_old to parties. For the other tables,
+    # party_expression gives the new party_id of a row in terms of the parties
+    # table given by party_join.
+    op.drop_index('ix_parties_generation_id', table_name='parties')
+    op.rename_table('parties', '_parties_old')
+    op.create_table('parties', *_parties(party_key))
+    op.create_index('ix_parties_generation_id', 'parties', ['generation_id'], unique=False)
+    op.execute(copy_parties)
+
+    for name, columns, indexes in _referring_tables(party_id_type):
+        for column in indexes:
+            op.drop_index('ix_{}_{}'.format(name, column), table_name=name)
+        op.rename_table(name, '_{}_old'.format(name))
+        op.create_table(name, *columns)
+        for column in indexes:
+            op.create_index('ix_{}_{}'.format(name, column), name, [column], unique=False)
+
+        names = [c.name for c in columns if isinstance(c, sa.Column)]
+        op.execute(
+            'INSERT INTO {name} ({columns}) SELECT {values}, {party} '
+            'FROM _{name}_old AS old JOIN {join}'.format(
+                name=name, columns=', '.join(names),
+                values=', '.join('old.' + n for n in names[:-1]),
+                party=party_expression, join=party_join))
+        op.drop_table('_{}_old'.format(name))
+
+    op.drop_table('_parties_old')
+
+
+def upgrade():
+    _rebuild(
+        'integer', sa.Integer(),
+        'INSERT INTO parties (code, name, generation_id) '
+        'SELECT id, name, generation_id FROM _parties_old ORDER BY id',
+        'parties.id', 'parties ON parties.code = old.party_id')
+
+
+def downgrade():
+    _rebuild(
+        'code', sa.Text(),
+        'INSERT INTO parties (id, name, generation_id) '
+        'SELECT code, name, generation_id FROM _parties_old',
+        '_parties_old.code', '_parties_old ON _parties_old.id = old.party_id')
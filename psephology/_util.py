@@ -1,5 +1,6 @@
 """Utility functions."""
 import base64
+import datetime
 import os
 from urllib.parse import urlparse, urljoin
 
@@ -21,3 +22,41 @@ try:
     from secrets import token_urlsafe
 except ImportError:
     token_urlsafe = _token_urlsafe
+
+# Formats accepted by parse_timestamp(). Tried in order.
+_TIMESTAMP_FORMATS = [
+    '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M',
+    '%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M',
+    '%Y-%m-%d',
+]
+
+def format_cursor(created_at, id):
+    """Format a (created_at, id) pair as an opaque cursor string suitable for
+    use in a URL. The inverse of :py:func:`.parse_cursor`.
+
+    """
+    return '{}_{}'.format(created_at.strftime('%Y-%m-%dT%H:%M:%S.%f'), id)
+
+def parse_cursor(value):
+    """Parse a cursor formatted by :py:func:`.format_cursor` into a
+    (created_at, id) pair. Raises ValueError if the cursor is invalid.
+
+    """
+    created_at, _, id = value.rpartition('_')
+    return parse_timestamp(created_at), int(id)
+
+def parse_timestamp(value):
+    """Parse an ISO 8601-style timestamp into a naive datetime in UTC. A
+    trailing "Z" is permitted. Raises ValueError if the timestamp cannot be
+    parsed.
+
+    """
+    value = value.strip()
+    if value.endswith('Z'):
+        value = value[:-1]
+    for fmt in _TIMESTAMP_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError('Invalid timestamp: {}'.format(value))
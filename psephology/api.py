@@ -4,69 +4,436 @@ API.
 
 """
 
-from flask import Blueprint, jsonify, request, abort, flash
+import io
+import json
+
+from flask import (
+    Blueprint, Response, current_app, jsonify, request, abort, flash
+)
 from sqlalchemy.orm import joinedload
 
-from psephology.model import db, import_results, Constituency, Voting
-from psephology import query
+from psephology.cache import fragment_response, get_cache
+from psephology.io import (
+    canonical_constituency_name, open_decompressed, result_records
+)
+from psephology.model import (
+    db, current_generation, current_results, delete_parties, error_message,
+    latest_generation, read_only, resolve_constituencies, result_storage,
+    upsert_parties, Constituency, ImportProfile, Party, PartyTotalSnapshot,
+    Voting, Region, Nation
+)
+from psephology import query, resultset
+from psephology.coordinator import get_coordinator
+from psephology.search import search_constituencies
+from psephology.stream import get_broker
+from psephology._util import format_cursor, parse_cursor, parse_timestamp
 
 blueprint = Blueprint('api', __name__)
 
+# Results formats accepted by /import keyed by MIME type. Other bodies are
+# treated as text.
+_IMPORT_FORMATS = {
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+}
+
+def _as_of_arg():
+    """Return the "as_of" query argument as a datetime or None if it is not
+    present. Aborts with a 400 Bad Request error if it cannot be parsed.
+
+    """
+    return _timestamp_arg('as_of')
+
+def _since_arg():
+    """Return the "since" query argument as an integer generation number or
+    None if it is not present. Aborts with a 400 Bad Request error if it is not
+    an integer.
+
+    """
+    since = request.args.get('since')
+    if since is None:
+        return None
+    try:
+        return int(since)
+    except ValueError:
+        abort(400)
+
+def _timestamp_arg(name):
+    """Return the named query argument as a datetime or None if it is not
+    present. Aborts with a 400 Bad Request error if it cannot be parsed.
+
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return parse_timestamp(value)
+    except ValueError:
+        abort(400)
+
 @blueprint.route('/stats')
+@read_only
 def stats():
     return jsonify(
         constituency_count=Constituency.query.count(),
     )
 
 @blueprint.route('/party_totals')
+@read_only
 def party_totals():
+    as_of = _as_of_arg()
+    region_name = request.args.get('region')
+    nation_name = request.args.get('nation')
+
+    since = _since_arg()
+
+    if region_name is None and nation_name is None:
+        # Read the generation *before* the totals so that any change committed
+        # in between is reported again next time rather than being missed.
+        generation = latest_generation() if as_of is None else None
+
+        q = query.party_totals(as_of=as_of)
+        totals = {}
+        if since is not None:
+            if as_of is not None:
+                abort(400)
+
+            # Parties which may have changed but now have no constituencies
+            # still need to be reported.
+            affected = Party.query.filter(
+                Party.id.in_(query.affected_party_ids(since)))
+            totals = dict(
+                (party.code, dict(name=party.name, constituency_count=0))
+                for party in affected
+            )
+            q = q.filter(Party.id.in_(query.affected_party_ids(since)))
+
+        totals.update(
+            (party.code, dict(
+                name=party.name,
+                constituency_count=constituency_count
+            ))
+            for party, constituency_count in q
+        )
+
+        response = dict(party_totals=totals)
+        if generation is not None:
+            response['generation'] = generation
+        return jsonify(response)
+
+    # Regional totals are pre-computed for the current results only
+    if as_of is not None or since is not None:
+        abort(400)
+
+    region, nation = None, None
+    if region_name is not None:
+        region = Region.query.filter(Region.name==region_name).first()
+        if region is None:
+            abort(404)
+    if nation_name is not None:
+        nation = Nation.query.filter(Nation.name==nation_name).first()
+        if nation is None:
+            abort(404)
+
     return jsonify(
         party_totals=dict([
-            (party.id, dict(
+            (party.code, dict(
                 name=party.name,
-                constituency_count=constituency_count
+                constituency_count=constituency_count,
+                vote_count=vote_count,
             ))
-            for party, constituency_count in query.party_totals()
+            for party, constituency_count, vote_count
+            in query.region_party_totals(region=region, nation=nation)
         ])
     )
 
+@blueprint.route('/party_votes')
+@read_only
+def party_votes():
+    results = query.party_vote_totals().all()
+    total_votes = sum(vote_count for _, vote_count, _ in results)
+    return jsonify(
+        party_votes=dict([
+            (party.code, dict(
+                name=party.name,
+                vote_count=vote_count,
+                constituency_count=constituency_count,
+                share_percentage=(
+                    (100. * vote_count) / total_votes
+                    if total_votes > 0 else None
+                ),
+            ))
+            for party, vote_count, constituency_count in results
+        ]),
+        total_votes=total_votes,
+    )
+
+@blueprint.route('/party_votes/history')
+@read_only
+def party_votes_history():
+    history = []
+    q = query.party_total_history(since=_timestamp_arg('since')).options(
+        joinedload(PartyTotalSnapshot.party))
+    for snapshot in q:
+        if len(history) == 0 or history[-1][0] != snapshot.created_at:
+            history.append((snapshot.created_at, {}))
+        history[-1][1][snapshot.party.code] = snapshot.vote_count
+
+    return jsonify(
+        history=[
+            dict(timestamp=created_at.isoformat() + 'Z', vote_counts=counts)
+            for created_at, counts in history
+        ]
+    )
+
 @blueprint.route('/constituencies')
+@read_only
 def constituencies():
-    q = query.constituency_winners().options(joinedload(Voting.party))
-    return jsonify(
+    as_of = _as_of_arg()
+    since = _since_arg()
+    if as_of is not None and since is not None:
+        abort(400)
+
+    # See party_totals() for why the generation is read first
+    generation = latest_generation() if as_of is None else None
+
+    q = query.constituency_winner_columns(as_of=as_of)
+    if since is not None:
+        q = q.filter(
+            Constituency.id.in_(query.changed_constituency_ids(since)))
+
+    response = dict(
         constituencies=[
             dict(
-                name=c.name,
+                id=r.id,
+                slug=r.slug,
+                name=r.name,
                 party=dict(
-                    name=v.party.name, id=v.party.id
-                ) if v is not None else None,
-                maximum_votes=max_v,
-                total_votes=tot_v,
-                share_percentage=(
-                    (100. * max_v) / tot_v
-                    if max_v is not None else None
-                ),
+                    name=r.party_name, id=r.party_code
+                ) if r.party_code is not None else None,
+                maximum_votes=r.max_vote_count,
+                total_votes=r.total_vote_count,
+                share_percentage=r.share_percentage,
             )
-            for c, v, max_v, tot_v in q
+            for r in resultset.winners(q)
         ]
     )
+    if generation is not None:
+        response['generation'] = generation
+    return jsonify(response)
+
+@blueprint.route('/constituencies/<id_or_slug>')
+@read_only
+def constituency(id_or_slug):
+    if id_or_slug.isdigit():
+        c = db.session.get(Constituency, int(id_or_slug))
+    else:
+        c = resolve_constituencies([id_or_slug]).get(
+            canonical_constituency_name(id_or_slug))
+    if c is None:
+        abort(404)
+
+    # The response is cached until this constituency is re-imported or a party
+    # changes.
+    fragment = get_cache().get_or_put(
+        'constituency:{}'.format(c.id), query.constituency_result_key(c.id),
+        lambda: json.dumps(_constituency_detail(c)))
+    return fragment_response(fragment, 'application/json')
+
+def _constituency_detail(c):
+    votings = _constituency_votings(c)
+    total = sum(count for count, _ in votings)
+
+    def _share(count):
+        return (100. * count) / total if total > 0 else None
+
+    results, rank = [], 0
+    for idx, (count, party) in enumerate(votings):
+        # Equal counts have equal rank
+        if idx == 0 or count != votings[idx-1][0]:
+            rank = idx + 1
+        results.append(dict(
+            party=dict(name=party.name, id=party.code),
+            count=count,
+            share_percentage=_share(count),
+            rank=rank,
+        ))
+
+    margin = None
+    if len(votings) > 0:
+        margin = votings[0][0] - (
+            votings[1][0] if len(votings) > 1 else 0)
+
+    return dict(
+        id=c.id,
+        name=c.name,
+        slug=c.slug,
+        results=results,
+        winner=results[0]['party'] if len(results) > 0 else None,
+        total_votes=total if len(votings) > 0 else None,
+        margin=margin,
+        margin_percentage=_share(margin) if margin is not None else None,
+    )
+
+def _constituency_votings(c):
+    # Return the current result for c as a list of vote count, Party pairs in
+    # the order given by query.constituency_result().
+    if result_storage() != 'packed':
+        return [
+            (v.count, v.party) for v in
+            query.constituency_result(c.id).options(joinedload(Voting.party))
+        ]
+
+    # Sorting is stable and so equal counts remain in the order they were
+    # imported
+    results = sorted(
+        current_results([c])[c], key=lambda r: r[0], reverse=True)
+    parties = dict(
+        (p.id, p) for p in
+        Party.query.filter(Party.id.in_([id for _, id in results])))
+    return [(count, parties[id]) for count, id in results]
+
+@blueprint.route('/constituencies/search')
+@read_only
+def constituencies_search():
+    q = request.args.get('q', '')
+    try:
+        limit = min(int(request.args.get('limit', 10)), 50)
+    except ValueError:
+        abort(400)
+
+    return jsonify(
+        results=[
+            dict(id=r.id, name=r.name, match=r.match)
+            for r in search_constituencies(q, limit=limit)
+        ]
+    )
+
+@blueprint.route('/parties')
+@read_only
+def parties():
+    return jsonify(
+        parties=[
+            dict(id=party.code, name=party.name)
+            for party in Party.query.order_by(Party.code)
+        ]
+    )
+
+@blueprint.route('/parties', methods=['POST'])
+def parties_upsert():
+    # Expect {"parties": [{"id": ..., "name": ...}, ...]}
+    body = request.get_json(silent=True)
+    try:
+        pairs = [(p['id'], p['name']) for p in body['parties']]
+        if not all(isinstance(v, str) for pair in pairs for v in pair):
+            raise TypeError()
+    except (KeyError, TypeError):
+        abort(400)
+
+    try:
+        updated = upsert_parties(pairs)
+    except ValueError as e:
+        return jsonify(error=error_message(e)), 400
+    generation = current_generation()
+    db.session.commit()
+
+    return jsonify(
+        parties=[dict(id=party.code, name=party.name) for party in updated],
+        generation=generation.id,
+    )
+
+@blueprint.route('/parties', methods=['DELETE'])
+def parties_delete():
+    codes = request.args.getlist('id')
+    if len(codes) == 0:
+        abort(400)
+    try:
+        delete_parties(codes)
+    except ValueError as e:
+        return jsonify(error=error_message(e)), 400
+    generation = current_generation()
+    db.session.commit()
+
+    return jsonify(deleted=codes, generation=generation.id)
+
+@blueprint.route('/log')
+@read_only
+def log():
+    try:
+        limit = min(int(request.args.get('limit', 50)), 100)
+        before = request.args.get('before')
+        before = parse_cursor(before) if before is not None else None
+    except ValueError:
+        abort(400)
+    if limit < 1:
+        abort(400)
+
+    entries, next_before = query.log_page(before=before, limit=limit)
+    return jsonify(
+        entries=[
+            dict(
+                id=e.id, created_at=e.created_at.isoformat() + 'Z',
+                message=e.message
+            )
+            for e in entries
+        ],
+        next=format_cursor(*next_before) if next_before is not None else None,
+    )
+
+@blueprint.route('/stream')
+def stream():
+    broker = get_broker()
+    keepalive = current_app.config['STREAM_KEEPALIVE']
+    subscription = broker.subscribe()
+
+    def generate():
+        try:
+            # Ask clients to wait a little before reconnecting
+            yield 'retry: 2000\n\n'
+            while not subscription.dropped:
+                event = subscription.get(timeout=keepalive)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield 'event: results\ndata: {}\n\n'.format(json.dumps(event))
+        finally:
+            broker.unsubscribe(subscription)
+
+    return Response(
+        generate(), mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @blueprint.route('/import', methods=['POST'])
 def import_():
-    # Interpret incoming data as UTF-8 text. If this fails, abort with a 400 Bad
-    # Request error.
+    # Interpret incoming data as UTF-8 text, decompressing it if necessary. If
+    # this fails, abort with a 400 Bad Request error. The body is read as it is
+    # imported and JSON and NDJSON bodies are split into records as they are
+    # read. Each record is parsed when it is imported so that malformed records
+    # are reported as diagnostics.
+    format_ = _IMPORT_FORMATS.get(request.mimetype, 'text')
+    profile = ImportProfile()
     try:
-        results = request.data.decode('utf8').strip().splitlines()
+        stream = open_decompressed(
+            request.stream,
+            content_encoding=request.headers.get('Content-Encoding'),
+            max_ratio=current_app.config['IMPORT_MAX_COMPRESSION_RATIO'])
+        records, parser = result_records(
+            io.TextIOWrapper(stream, encoding='utf8'), format_)
+        diagnostics = get_coordinator().submit(
+            records,
+            suggest_matches=current_app.config['IMPORT_SUGGEST_MATCHES'],
+            parser=parser, profile=profile,
+            max_diagnostics=current_app.config['IMPORT_MAX_DIAGNOSTICS'])
     except UnicodeDecodeError:
         abort(400)
-
-    diagnostics = import_results(results)
-    db.session.commit()
+    except ValueError as e:
+        return jsonify(error=error_message(e)), 400
 
     return jsonify(
         diagnostics=[
             dict(line=d.line, message=d.message, line_number=d.line_number)
             for d in diagnostics
         ],
-        line_count=len(results),
+        line_count=profile.counts['parse'],
+        stages=profile.as_dict(),
     )
@@ -8,8 +8,9 @@ from flask import Flask
 
 from .api import blueprint as api
 from .ui import blueprint as ui
-from .model import db, migrate
+from .model import db, migrate, configure_sqlite
 from .cli import cli
+from . import cache, coordinator, metrics, slowlog, stream
 
 def create_app(config_filename=None, config_object=None):
     """
@@ -30,7 +31,13 @@ def create_app(config_filename=None, config_object=None):
         app.config.from_object(config_object)
 
     db.init_app(app)
+    configure_sqlite(app)
     migrate.init_app(app, db, render_as_batch=True)
+    stream.init_app(app)
+    coordinator.init_app(app)
+    cache.init_app(app)
+    metrics.init_app(app)
+    slowlog.init_app(app)
 
     app.register_blueprint(ui)
     app.register_blueprint(api, url_prefix='/api')
@@ -0,0 +1,196 @@
+"""
+The :py:mod:`.cache` module provides a cache for rendered fragments of pages.
+
+Results only change when they are imported and so parts of pages which are
+rendered from results may be re-used until the next import. Fragments are keyed
+by a name, usually that of the template which renders them, and the data
+generation from which they were rendered. Since the generation is read from
+the database, fragments cached in one process are never used after another
+process has imported new results. Fragments which depend on only part of the
+data may use a narrower key in place of the generation, such as the id of the
+latest result version for a single constituency, so long as it increases
+whenever that data changes.
+
+Each application has a single :py:class:`.FragmentCache` which may be retrieved
+via :py:func:`.get_cache`. The cache holds at most ``FRAGMENT_CACHE_SIZE``
+bytes, evicting the least recently used fragments first. If
+``FRAGMENT_CACHE_COMPRESS`` is True, a gzip-compressed copy of each fragment is
+also kept so that whole responses may be sent without compressing them on each
+request.
+
+"""
+import collections
+import gzip
+import threading
+
+from flask import Response, current_app, render_template, request
+from markupsafe import Markup
+
+from .model import latest_generation
+
+#: Key in app.extensions used to store the cache
+_EXTENSION_KEY = 'psephology_fragment_cache'
+
+class CachedFragment:
+    """A single cached fragment.
+
+    .. py:attribute:: text
+
+        Fragment as a string.
+
+    .. py:attribute:: gzipped
+
+        Fragment encoded as UTF-8 and gzip-compressed or None if compressed
+        variants are not being kept.
+
+    """
+    __slots__ = ['text', 'gzipped']
+
+    def __init__(self, text, gzipped=None):
+        self.text = text
+        self.gzipped = gzipped
+
+    def __len__(self):
+        # Approximate size in bytes
+        return len(self.text) + (
+            len(self.gzipped) if self.gzipped is not None else 0)
+
+class FragmentCache:
+    """A size-bounded least recently used cache of rendered fragments.
+
+    :param max_size: maximum total size of cached fragments in bytes. If zero,
+        nothing is cached.
+    :param compress: if True, keep a gzip-compressed variant of each fragment
+
+    """
+    def __init__(self, max_size=8*1024*1024, compress=False):
+        self.max_size = max_size
+        self.compress = compress
+        self._lock = threading.Lock()
+        self._fragments = collections.OrderedDict()
+        self._generations = {}
+        self._size = 0
+
+    def __len__(self):
+        return len(self._fragments)
+
+    @property
+    def size(self):
+        """Total size of cached fragments in bytes."""
+        return self._size
+
+    def get(self, name, generation):
+        """Return the :py:class:`.CachedFragment` for name rendered from
+        generation or None if there is none. The generation may be any value
+        which may be compared with the generations of other fragments with the
+        same name.
+
+        """
+        with self._lock:
+            fragment = self._fragments.get((name, generation))
+            if fragment is not None:
+                self._fragments.move_to_end((name, generation))
+            return fragment
+
+    def put(self, name, generation, text):
+        """Add text as the fragment for name rendered from generation and
+        return a :py:class:`.CachedFragment`. Fragments for name from earlier
+        generations are discarded. If a fragment from a later generation has
+        already been cached, text is not cached.
+
+        """
+        fragment = CachedFragment(
+            text,
+            gzip.compress(text.encode('utf8')) if self.compress else None
+        )
+        if len(fragment) > self.max_size:
+            return fragment
+
+        with self._lock:
+            cached_generation = self._generations.get(name)
+            if cached_generation is not None:
+                if cached_generation > generation:
+                    return fragment
+                self._discard((name, cached_generation))
+
+            self._fragments[(name, generation)] = fragment
+            self._generations[name] = generation
+            self._size += len(fragment)
+
+            while self._size > self.max_size:
+                self._discard(next(iter(self._fragments)))
+
+        return fragment
+
+    def get_or_put(self, name, generation, render):
+        """Return the :py:class:`.CachedFragment` for name rendered from
+        generation. If it is not cached, call render() to produce the text of
+        the fragment and cache it.
+
+        """
+        fragment = self.get(name, generation)
+        if fragment is None:
+            fragment = self.put(name, generation, render())
+        return fragment
+
+    def clear(self):
+        """Discard all cached fragments."""
+        with self._lock:
+            self._fragments.clear()
+            self._generations.clear()
+            self._size = 0
+
+    def _discard(self, key):
+        fragment = self._fragments.pop(key, None)
+        if fragment is None:
+            return
+        self._size -= len(fragment)
+        if self._generations.get(key[0]) == key[1]:
+            del self._generations[key[0]]
+
+def init_app(app):
+    """Create the fragment cache for app according to its configuration."""
+    app.extensions[_EXTENSION_KEY] = FragmentCache(
+        max_size=app.config.get('FRAGMENT_CACHE_SIZE', 8*1024*1024),
+        compress=app.config.get('FRAGMENT_CACHE_COMPRESS', False))
+
+def get_cache(app=None):
+    """Return the :py:class:`.FragmentCache` for app. If app is None, the
+    current application is used.
+
+    """
+    app = app if app is not None else current_app
+    return app.extensions[_EXTENSION_KEY]
+
+def cached_fragment(name, render):
+    """Return the :py:class:`.CachedFragment` for name rendered from the latest
+    generation, calling render() to produce its text if it is not cached.
+
+    """
+    return get_cache().get_or_put(name, latest_generation(), render)
+
+def fragment_response(fragment, mimetype):
+    """Return a :py:class:`flask.Response` whose body is a
+    :py:class:`.CachedFragment`. If the fragment has a compressed variant and
+    the client accepts gzip encoding, the compressed variant is sent.
+
+    """
+    if fragment.gzipped is not None and 'gzip' in request.accept_encodings:
+        response = Response(fragment.gzipped, mimetype=mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(fragment.text, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    return response
+
+def render_fragment(template_name, context):
+    """Render template_name as a fragment, caching the result. The template is
+    only rendered if there is no fragment for it from the latest generation.
+    context is a callable returning a dictionary of template variables. It is
+    only called if the template must be rendered. Returns the fragment as
+    :py:class:`markupsafe.Markup`.
+
+    """
+    fragment = cached_fragment(
+        template_name, lambda: render_template(template_name, **context()))
+    return Markup(fragment.text)
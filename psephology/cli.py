@@ -1,16 +1,243 @@
+import cProfile
+import csv
+import io
+import logging
+import time
+import tracemalloc
+
 import click
+from flask import current_app
 from flask.cli import with_appcontext
 
-from .model import import_results, db
+from .model import (
+    import_results, add_constituency_alias, resolve_constituencies,
+    assign_constituency_region, rebuild_region_party_totals,
+    rebuild_party_totals, rebuild_current_results, upsert_parties,
+    delete_parties, error_message, Constituency, ImportProfile, Party, db
+)
+from .io import (
+    canonical_constituency_name, guess_results_format, open_decompressed,
+    result_records
+)
+from .retention import prune_log, prune_slow_queries, incremental_vacuum
 
 cli = click.Group('psephology', help='Commands specific to psephology')
 
 @cli.command('importresults')
-@click.argument('results_file', type=click.File('r'))
+@click.argument('results_file', type=click.File('rb'))
+@click.option('--suggest-matches/--no-suggest-matches', default=None,
+    help='Report unknown constituencies which are similar to existing ones '
+    'rather than creating them. Defaults to the IMPORT_SUGGEST_MATCHES '
+    'configuration value.')
+@click.option('--format', 'format_',
+    type=click.Choice(['text', 'json', 'ndjson']), default=None,
+    help='Format of RESULTS_FILE. Defaults to "json" for files ending in '
+    '".json", "ndjson" for files ending in ".ndjson" or ".jsonl" and "text" '
+    'otherwise.')
+@click.option('--profile', is_flag=True,
+    help='Print the time spent in each stage of the import.')
+@click.option('--cprofile', 'cprofile_path', default=None,
+    type=click.Path(dir_okay=False, writable=True),
+    help='Write cProfile statistics for the import to this file. They may be '
+    'read with the pstats module.')
+@click.option('--tracemalloc', 'tracemalloc_path', default=None,
+    type=click.Path(dir_okay=False, writable=True),
+    help='Write a tracemalloc snapshot of memory allocated during the import '
+    'to this file. It may be read with tracemalloc.Snapshot.load().')
+@with_appcontext
+def importresults(results_file, suggest_matches, format_, profile,
+                  cprofile_path, tracemalloc_path):
+    """Ingest a results file into the database.
+
+    RESULTS_FILE may be compressed with gzip, bzip2 or xz.
+
+    """
+    if suggest_matches is None:
+        suggest_matches = current_app.config.get(
+            'IMPORT_SUGGEST_MATCHES', False)
+    filename = getattr(results_file, 'name', '')
+    if format_ is None:
+        format_ = guess_results_format(filename)
+
+    import_profile = ImportProfile()
+    profiler = cProfile.Profile() if cprofile_path is not None else None
+    if tracemalloc_path is not None:
+        tracemalloc.start()
+    if profiler is not None:
+        profiler.enable()
+
+    try:
+        stream = open_decompressed(
+            results_file, filename=filename,
+            max_ratio=current_app.config.get('IMPORT_MAX_COMPRESSION_RATIO'))
+        results, parser = result_records(
+            io.TextIOWrapper(stream, encoding='utf8'), format_)
+        diagnostics = import_results(
+            results, suggest_matches=suggest_matches, parser=parser,
+            profile=import_profile)
+        for diagnostic in diagnostics:
+            logging.warning(str(diagnostic))
+        start = time.perf_counter()
+        db.session.commit()
+        import_profile.record('commit', start, import_profile.counts['parse'])
+    except UnicodeDecodeError:
+        raise click.ClickException('Results file is not valid UTF-8')
+    except ValueError as e:
+        raise click.ClickException(error_message(e))
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(cprofile_path)
+        if tracemalloc_path is not None:
+            tracemalloc.take_snapshot().dump(tracemalloc_path)
+            tracemalloc.stop()
+
+    if profile:
+        _echo_import_profile(import_profile)
+
+def _echo_import_profile(profile):
+    """Print a table of the time spent in each stage of an import."""
+    total = sum(profile.timings.values())
+    click.echo('{:<10} {:>10} {:>7} {:>10}'.format(
+        'stage', 'seconds', '%', 'lines'), err=True)
+    for stage in profile.STAGES:
+        seconds = profile.timings[stage]
+        click.echo('{:<10} {:>10.3f} {:>6.1f}% {:>10}'.format(
+            stage, seconds, 100. * seconds / total if total > 0 else 0.,
+            profile.counts[stage]), err=True)
+    click.echo('{:<10} {:>10.3f}'.format('total', total), err=True)
+
+@cli.command('addalias')
+@click.argument('alias')
+@click.argument('constituency')
+@with_appcontext
+def addalias(alias, constituency):
+    """Record ALIAS as an alternative name for CONSTITUENCY."""
+    c = resolve_constituencies([constituency]).get(
+        canonical_constituency_name(constituency))
+    if c is None:
+        raise click.ClickException(
+            'No such constituency: {}'.format(constituency))
+    try:
+        add_constituency_alias(alias, c)
+    except ValueError as e:
+        raise click.ClickException(error_message(e))
+    db.session.commit()
+
+@cli.command('importregions')
+@click.argument('regions_file', type=click.File('r'))
+@with_appcontext
+def importregions(regions_file):
+    """Assign constituencies to regions and nations.
+
+    REGIONS_FILE is a CSV file with a header row. The "constituency_name",
+    "region_name" and "country_name" columns are used. Constituencies which do
+    not yet exist are created.
+
+    """
+    reader = csv.DictReader(regions_file)
+    rows = list(reader)
+    constituencies = resolve_constituencies(
+        [row['constituency_name'] for row in rows])
+    for row_idx, row in enumerate(rows):
+        name = row['constituency_name']
+        key = canonical_constituency_name(name)
+        constituency = constituencies.get(key)
+        if constituency is None:
+            constituency = Constituency(name=name)
+            db.session.add(constituency)
+            constituencies[key] = constituency
+        try:
+            assign_constituency_region(
+                constituency, row['region_name'], row['country_name'])
+        except ValueError as e:
+            logging.warning('%s: %s', row_idx + 2, error_message(e))
+    db.session.commit()
+
+@cli.command('upsertparties')
+@click.argument('parties_file', type=click.File('r'))
 @with_appcontext
-def importresults(results_file):
-    """Ingest a results file into the database."""
-    diagnostics = import_results(results_file)
-    for diagnostic in diagnostics:
-        logging.warning(str(diagnostic))
+def upsertparties(parties_file):
+    """Create or rename parties.
+
+    PARTIES_FILE is a CSV file with a header row. The "code" and "name" columns
+    are used. Either every party is created or updated or, if there is an
+    error, none are.
+
+    """
+    reader = csv.DictReader(parties_file)
+    try:
+        upsert_parties((row['code'], row['name']) for row in reader)
+    except ValueError as e:
+        raise click.ClickException(error_message(e))
     db.session.commit()
+
+@cli.command('deleteparties')
+@click.argument('codes', nargs=-1, required=True)
+@with_appcontext
+def deleteparties(codes):
+    """Delete the parties with codes CODES. Parties with results cannot be
+    deleted.
+
+    """
+    try:
+        delete_parties(codes)
+    except ValueError as e:
+        raise click.ClickException(error_message(e))
+    db.session.commit()
+
+@cli.command('listparties')
+@with_appcontext
+def listparties():
+    """List party codes and names as CSV."""
+    writer = csv.writer(click.get_text_stream('stdout'))
+    writer.writerow(['code', 'name'])
+    for party in Party.query.order_by(Party.code):
+        writer.writerow([party.code, party.name])
+
+@cli.command('rebuildtotals')
+@with_appcontext
+def rebuildtotals():
+    """Re-compute pre-computed totals from the current results."""
+    rebuild_party_totals()
+    rebuild_region_party_totals()
+    db.session.commit()
+
+@cli.command('rebuildresults')
+@with_appcontext
+def rebuildresults():
+    """Re-create the current results from the result history in the form
+    set by RESULT_STORAGE. Run this after changing RESULT_STORAGE."""
+    rebuild_current_results()
+    db.session.commit()
+
+@cli.command('prunelog')
+@click.option('--days', type=int, default=None,
+    help='Delete log entries older than this many days. Defaults to the '
+    'LOG_RETENTION_DAYS configuration value.')
+@click.option('--archive', type=click.Path(dir_okay=False), default=None,
+    help='Append deleted entries to this gzip-compressed JSON lines file. '
+    'Defaults to the LOG_ARCHIVE_PATH configuration value.')
+@click.option('--vacuum-pages', type=int, default=None,
+    help='Maximum number of free pages to return to the operating system. '
+    'Defaults to the LOG_VACUUM_PAGES configuration value. Zero returns all '
+    'free pages.')
+@with_appcontext
+def prunelog(days, archive, vacuum_pages):
+    """Archive and delete old log entries and delete old slow queries."""
+    config = current_app.config
+    days = days if days is not None else config.get('LOG_RETENTION_DAYS', 30)
+    archive = (
+        archive if archive is not None else config.get('LOG_ARCHIVE_PATH'))
+    vacuum_pages = (
+        vacuum_pages if vacuum_pages is not None else
+        config.get('LOG_VACUUM_PAGES', 0)
+    )
+
+    count = prune_log(days, archive_path=archive)
+    logging.info('Deleted %s log entries', count)
+    count = prune_slow_queries(days)
+    logging.info('Deleted %s slow queries', count)
+    free_pages = incremental_vacuum(pages=vacuum_pages)
+    if free_pages is not None:
+        logging.info('%s free pages remain', free_pages)
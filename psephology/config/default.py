@@ -8,3 +8,96 @@ should be enabled only in development should go into the config.dev module.
 SITE_NAME='Psephology'
 SQLALCHEMY_TRACK_MODIFICATIONS=False
 DEBUG=False
+
+# If True, result lines for unknown constituencies which are similar to an
+# existing constituency are reported as diagnostics rather than creating a new
+# constituency.
+IMPORT_SUGGEST_MATCHES=False
+
+# Seconds for which an import waits for other concurrent imports to arrive so
+# that they may be committed together in a single transaction. An import only
+# waits if others are already waiting and imports are only coalesced within one
+# process.
+IMPORT_COALESCE_WINDOW=0.05
+
+# Compressed imports are rejected once their decompressed size exceeds this
+# multiple of their compressed size. This protects workers against small
+# uploads which decompress to exhaust memory. Set to None to disable the limit.
+IMPORT_MAX_COMPRESSION_RATIO=100
+
+# At most this many diagnostics are returned for an import so that a large file
+# of malformed lines cannot exhaust memory. Further diagnostics are counted and
+# summarised by a final diagnostic. Set to None to return every diagnostic.
+IMPORT_MAX_DIAGNOSTICS=1000
+
+# How the current result of each constituency is stored. Use "normalized" for
+# one row per party or "packed" for a single row per constituency holding the
+# encoded votes along with the winner, total and margin. Packed results are
+# replaced with one statement per constituency and listed without aggregation.
+# The result history is stored in the same way in either case. After changing
+# this for an existing database, run the rebuildresults command.
+RESULT_STORAGE='normalized'
+
+# If True, request latency, SQL statement counts and import throughput are
+# recorded and exposed in the Prometheus text format at /metrics.
+METRICS_ENABLED=True
+
+# SQL statements which take longer than this many seconds to execute are
+# recorded and listed at /slow-queries. Set to None to disable recording. If
+# SLOW_QUERY_EXPLAIN is True, the plan of slow SELECT statements is recorded too
+# at the cost of running EXPLAIN QUERY PLAN for each. The most recent
+# SLOW_QUERY_RING_SIZE slow queries are also kept in memory by each process.
+SLOW_QUERY_THRESHOLD=0.5
+SLOW_QUERY_EXPLAIN=False
+SLOW_QUERY_RING_SIZE=100
+
+# Broker used to push live results to /api/stream subscribers. Use "memory" for
+# a single process or "file" to share events between processes via the spool
+# file at STREAM_BROKER_PATH.
+STREAM_BROKER='memory'
+STREAM_BROKER_PATH=None
+
+# Maximum number of pending events for a stream subscriber before it is dropped
+STREAM_QUEUE_SIZE=100
+
+# Seconds between keep-alive comments sent to idle stream subscribers
+STREAM_KEEPALIVE=15
+
+# Maximum size in bytes of the cache of rendered page fragments. Set to 0 to
+# disable the cache.
+FRAGMENT_CACHE_SIZE=8*1024*1024
+
+# If True, keep a gzip-compressed copy of each cached fragment which is sent to
+# clients which accept it when the fragment makes up the whole response.
+FRAGMENT_CACHE_COMPRESS=True
+
+# Pragmas applied to each new SQLite connection in order. Write-ahead logging
+# allows readers to proceed while an import is being committed. The busy
+# timeout, in milliseconds, is set first so that enabling WAL waits for any
+# lock. Incremental auto-vacuum only takes effect for new databases; see the
+# prunelog command. The cache size is in KiB when negative. Set to {} to use
+# SQLite's defaults.
+SQLITE_PRAGMAS={
+    'busy_timeout': 5000,
+    'auto_vacuum': 'INCREMENTAL',
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -65536,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
+# If True, views which only read from a SQLite database run with the
+# query_only pragma set.
+SQLITE_READ_ONLY_VIEWS=True
+
+# Number of log entries shown on each page of the log
+LOG_PAGE_SIZE=50
+
+# Defaults for the prunelog command. Log entries older than LOG_RETENTION_DAYS
+# days are deleted. If LOG_ARCHIVE_PATH is not None, they are first appended to
+# the gzip-compressed file at that path. At most LOG_VACUUM_PAGES free pages
+# are then returned to the operating system; 0 returns all of them.
+LOG_RETENTION_DAYS=30
+LOG_ARCHIVE_PATH=None
+LOG_VACUUM_PAGES=0
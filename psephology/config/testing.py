@@ -8,3 +8,6 @@ logging.warning('USING TESTING CONFIGURATION')
 SQLALCHEMY_DATABASE_URI='sqlite:///:memory:'
 TESTING = True
 SECRET_KEY = 'not-very-secret'
+
+# Tests which record slow queries configure their own threshold
+SLOW_QUERY_THRESHOLD = None
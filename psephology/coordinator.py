@@ -0,0 +1,183 @@
+"""
+The :py:mod:`.coordinator` module coalesces concurrent imports into a single
+database transaction.
+
+When several feeds post results at the same moment, importing each in its own
+transaction means that they serialise on the database's write lock. Instead,
+each import is submitted to the application's :py:class:`.ImportCoordinator`.
+The first caller to arrive becomes the *leader* for a group. Imports which
+arrive while a group is being committed wait to form the next group. If other
+imports are already waiting when a leader takes over, it waits for a short
+window to collect any more which arrive in the meantime. Otherwise it starts
+importing at once so that an import which does not compete with any other is
+not delayed. The leader imports every result in the group within one
+transaction.
+
+Imports are only coalesced with others submitted to the same coordinator and
+so only within one process. Imports received by separate worker processes are
+committed in separate transactions.
+
+Imports within a group are applied in the order in which they were submitted
+and so, as with separate transactions, the last result submitted for a
+constituency wins. Each caller receives the diagnostics for its own results.
+Each import is applied within a SAVEPOINT so that one which fails is rolled back
+without affecting the others in its group.
+
+Submitted lines are not copied. They are consumed, a batch at a time, by the
+thread which imports the group and so an import submitted via the coordinator
+uses no more memory than one made by calling :py:func:`.import_results`
+directly.
+
+"""
+import sys
+import threading
+import time
+
+from flask import current_app
+
+from .metrics import observe_import
+from .model import (
+    db, import_results, savepoint, snapshot_party_totals, ImportProfile
+)
+
+#: Key in app.extensions used to store the coordinator
+_EXTENSION_KEY = 'psephology_import_coordinator'
+
+class _Job:
+    # A single submitted import
+    def __init__(self, lines, suggest_matches, parser, profile,
+                 max_diagnostics):
+        self.lines = lines
+        self.suggest_matches = suggest_matches
+        self.parser = parser
+        self.profile = profile
+        self.max_diagnostics = max_diagnostics
+        self.done = False
+        self.diagnostics = None
+        self.exc_info = None
+
+class ImportCoordinator:
+    """Coalesces imports submitted from concurrent threads into a single
+    transaction.
+
+    :param window: seconds for which a group leader waits for other imports to
+        arrive before importing the group if other imports are already
+        waiting. If zero, only imports which arrive while a previous group is
+        being committed are coalesced.
+
+    """
+    def __init__(self, window=0.05):
+        self.window = window
+        self._condition = threading.Condition()
+        self._pending = []
+        self._busy = False
+
+    def submit(self, lines, suggest_matches=False, session=None, parser=None,
+               profile=None, max_diagnostics=None):
+        """Import an iterable of result lines and commit them to the database,
+        possibly along with the lines from other calls. Blocks until the lines
+        have been committed and returns a list of :py:class:`.Diagnostic`
+        instances for lines. The arguments have the same meaning as those of
+        :py:func:`.import_results`. If profile is not None, the time taken to
+        commit the group is recorded as the "commit" stage.
+
+        The lines are consumed as they are imported, possibly by another
+        thread, and so must not depend on state which is local to the calling
+        thread such as the Flask request context.
+
+        If importing the lines raises an exception, it is re-raised in the
+        calling thread. An exception raised by one caller's lines is not
+        raised in other callers.
+
+        """
+        job = _Job(lines, suggest_matches, parser, profile, max_diagnostics)
+
+        with self._condition:
+            self._pending.append(job)
+            while self._busy and not job.done:
+                self._condition.wait()
+            if not job.done:
+                # This thread leads the next group
+                self._busy = True
+                contended = len(self._pending) > 1
+
+        if not job.done:
+            try:
+                if self.window > 0 and contended:
+                    time.sleep(self.window)
+                with self._condition:
+                    group, self._pending = self._pending, []
+                self._run(group, session)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+        if job.exc_info is not None:
+            raise job.exc_info[1].with_traceback(job.exc_info[2])
+        return job.diagnostics
+
+    def _run(self, group, session):
+        session = session if session is not None else db.session
+        try:
+            self._import(group, session)
+        except Exception:
+            # The group could not be committed. Its lines have been consumed
+            # and so the failure is reported to every caller.
+            session.rollback()
+            exc_info = sys.exc_info()
+            for job in group:
+                if job.exc_info is None:
+                    job.exc_info, job.diagnostics = exc_info, None
+        finally:
+            for job in group:
+                job.done = True
+
+    def _import(self, group, session):
+        start = time.perf_counter()
+        profiles = [ImportProfile() for job in group]
+        for job, profile in zip(group, profiles):
+            try:
+                with savepoint(session):
+                    job.diagnostics = import_results(
+                        job.lines, session=session,
+                        suggest_matches=job.suggest_matches, snapshot=False,
+                        parser=job.parser, profile=profile,
+                        max_diagnostics=job.max_diagnostics)
+            except Exception:
+                job.exc_info = sys.exc_info()
+
+        imported = [
+            (job, profile) for job, profile in zip(group, profiles)
+            if job.exc_info is None
+        ]
+        if len(imported) == 0:
+            session.rollback()
+            return
+
+        snapshot_party_totals(session=session)
+        commit_start = time.perf_counter()
+        session.commit()
+
+        # Each job shares the commit of the group
+        for job, profile in imported:
+            profile.record('commit', commit_start, profile.counts['parse'])
+            if job.profile is not None:
+                job.profile.update(profile)
+        observe_import(
+            sum(profile.counts['parse'] for _, profile in imported),
+            sum(len(job.diagnostics) for job, _ in imported),
+            time.perf_counter() - start)
+
+def init_app(app):
+    """Create the import coordinator for app according to its configuration."""
+    app.extensions[_EXTENSION_KEY] = ImportCoordinator(
+        window=app.config.get('IMPORT_COALESCE_WINDOW', 0.05))
+
+def get_coordinator(app=None):
+    """Return the :py:class:`.ImportCoordinator` for app. If app is None, the
+    current application is used.
+
+    """
+    app = app if app is not None else current_app
+    return app.extensions[_EXTENSION_KEY]
@@ -2,7 +2,60 @@
 The :py:mod:`.io` module provides functions which can be used to parse external
 data formats used by Psephology.
 
+Results may be given as comma-separated lines, parsed by
+:py:func:`.parse_result_line`, or as JSON records of the form::
+
+    {"constituency": "Ynys Môn", "results": [{"party": "L", "count": 10}]}
+
+JSON records are parsed by :py:func:`.parse_json_result`. They may be given one
+per line (`NDJSON <http://ndjson.org/>`_) or as a single JSON array, which is
+split into records by :py:func:`.iter_json_records`.
+
+Uploaded files may be compressed with gzip, bzip2 or xz. They are decompressed
+as they are read by :py:func:`.open_decompressed`.
+
 """
+import bz2
+import gzip
+import io
+import json
+import lzma
+import re
+import unicodedata
+import zlib
+
+#: Number of characters read at a time by :py:func:`.iter_json_records`
+JSON_CHUNK_SIZE = 64 * 1024
+
+#: Number of decompressed bytes which :py:func:`.open_decompressed` allows
+#: before applying its limit on the compression ratio. Small files of repeated
+#: lines may otherwise exceed a sensible ratio.
+DECOMPRESSED_SIZE_ALLOWANCE = 1024 * 1024
+
+# Compression formats keyed by Content-Encoding, filename suffix and the magic
+# bytes which start the compressed data.
+_CONTENT_ENCODINGS = {
+    'identity': None, 'gzip': 'gzip', 'x-gzip': 'gzip', 'bzip2': 'bzip2',
+    'x-bzip2': 'bzip2', 'xz': 'xz', 'x-xz': 'xz',
+}
+_SUFFIXES = {'.gz': 'gzip', '.bz2': 'bzip2', '.xz': 'xz'}
+_MAGIC = [(b'\x1f\x8b', 'gzip'), (b'BZh', 'bzip2'), (b'\xfd7zXZ\x00', 'xz')]
+_OPENERS = {'gzip': gzip.open, 'bzip2': bz2.open, 'xz': lzma.open}
+
+def canonical_constituency_name(name):
+    """Return a canonical form of a constituency name which can be used to
+    match names from different sources. The canonical form ignores case,
+    diacritics, punctuation and whitespace and treats "&" as "and". For
+    example, "Ynys Môn" and "ynys  mon" have the same canonical form as do
+    "Brighton, Kemptown" and "Brighton Kemptown".
+
+    """
+    # ASCII names, the common case, have no diacritics to remove
+    if not name.isascii():
+        decomposed = unicodedata.normalize('NFKD', name)
+        name = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    name = name.casefold().replace('&', ' and ')
+    return ' '.join(re.sub(r'[\W_]+', ' ', name).split())
 
 def parse_result_line(line):
     """Take a line consisting of a constituency name and vote count, party id
@@ -33,3 +86,272 @@ def parse_result_line(line):
     # The remaining items are assumed to be to be the constituency name. Note we
     # need to reverse the results in order to preserve the order we were given.
     return ','.join(items), results[::-1]
+
+def parse_json_result(text):
+    """Take the JSON text of a single result record and return the constituency
+    name and a list of results as a pair in the same form as
+    :py:func:`.parse_result_line`. Raises ValueError if text is not valid JSON
+    or does not describe a result.
+
+    """
+    try:
+        record = json.loads(text)
+    except ValueError as e:
+        raise ValueError('Invalid JSON: %s', e.msg)
+
+    if not isinstance(record, dict):
+        raise ValueError('Result must be an object')
+    cn = record.get('constituency')
+    if not isinstance(cn, str):
+        raise ValueError('"constituency" must be a string')
+    results = record.get('results', [])
+    if not isinstance(results, list):
+        raise ValueError('"results" must be a list')
+
+    parsed = []
+    for result in results:
+        if not isinstance(result, dict):
+            raise ValueError('Each result must be an object')
+        party_id, count = result.get('party'), result.get('count')
+        if not isinstance(party_id, str):
+            raise ValueError('"party" must be a string')
+        # Note that bool is a subclass of int
+        if not isinstance(count, int) or isinstance(count, bool) or count < 0:
+            raise ValueError(
+                '"count" for party "%s" must be a non-negative integer',
+                party_id)
+        parsed.append((count, party_id.strip()))
+
+    return cn.strip(), parsed
+
+def iter_json_records(fileobj, chunk_size=None):
+    """Take a file-like object containing either a single JSON object or a JSON
+    array of objects and yield the JSON text of each object in turn. The file
+    is read incrementally and so the whole array is never decoded at once.
+    Each record is checked only for being well-formed JSON; it may be parsed
+    via :py:func:`.parse_json_result`.
+
+    Raises ValueError if the file is not a JSON object or array. Since the end
+    of a malformed element cannot be found, the records following it are not
+    yielded.
+
+    """
+    chunk_size = chunk_size if chunk_size is not None else JSON_CHUNK_SIZE
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+
+    def _fill():
+        # Read more input, returning False if there was none
+        nonlocal buf, pos, eof
+        chunk = fileobj.read(chunk_size) if not eof else ''
+        if chunk == '':
+            eof = True
+            return False
+        buf, pos = buf[pos:] + chunk, 0
+        return True
+
+    def _skip_space():
+        # Advance past whitespace, returning the next character or '' at EOF
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not _fill():
+                return ''
+
+    def _value():
+        # Decode the value at pos, reading more input until it is complete
+        nonlocal pos
+        while True:
+            try:
+                _, end = decoder.raw_decode(buf, pos)
+            except ValueError as e:
+                if eof or not _fill():
+                    raise ValueError('Invalid JSON: %s', e.msg)
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(buf) and not eof and _fill():
+                continue
+            text, pos = buf[pos:end], end
+            return text
+
+    c = _skip_space()
+    if c == '{':
+        yield _value()
+        if _skip_space() != '':
+            raise ValueError('Unexpected data after JSON object')
+        return
+    if c != '[':
+        raise ValueError('Expected a JSON object or array')
+    pos += 1
+
+    if _skip_space() == ']':
+        pos += 1
+    else:
+        while True:
+            _skip_space()
+            yield _value()
+            c = _skip_space()
+            pos += 1
+            if c == ']':
+                break
+            if c != ',':
+                raise ValueError('Expected "," or "]" in JSON array')
+
+    if _skip_space() != '':
+        raise ValueError('Unexpected data after JSON array')
+
+def result_records(fileobj, format='text'):
+    """Take a text file-like object containing results in format, one of
+    "text", "json" or "ndjson", and return an iterable of records along with a
+    function which parses each record. The parser is suitable for passing to
+    :py:func:`.import_results`. The file is read as the records are iterated
+    over. Blank lines are skipped in NDJSON files and at the start and end of
+    text files.
+
+    """
+    if format == 'text':
+        return iter_result_lines(fileobj), parse_result_line
+    if format == 'json':
+        return iter_json_records(fileobj), parse_json_result
+    if format == 'ndjson':
+        return (
+            (line for line in iter_result_lines(fileobj) if line.strip() != ''),
+            parse_json_result
+        )
+    raise ValueError('Unknown results format "%s"', format)
+
+def iter_result_lines(fileobj):
+    """Take a text file-like object and yield its lines without line endings.
+    As with the text body of an import, leading and trailing blank lines are
+    skipped. The file is read incrementally.
+
+    """
+    blank = []
+    started = False
+    for line in fileobj:
+        line = line.rstrip('\r\n')
+        if line.strip() == '':
+            if started:
+                blank.append(line)
+            continue
+        started = True
+        yield from blank
+        blank = []
+        yield line
+
+def guess_results_format(filename):
+    """Return the format of a results file judging by its filename. Files
+    ending in ".json" are "json", those ending in ".ndjson" or ".jsonl" are
+    "ndjson" and all others are "text". Any suffix indicating that the file is
+    compressed, such as ".gz", is ignored.
+
+    """
+    for suffix in _SUFFIXES:
+        if filename.endswith(suffix):
+            filename = filename[:-len(suffix)]
+    if filename.endswith('.json'):
+        return 'json'
+    if filename.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'text'
+
+def open_decompressed(fileobj, content_encoding=None, filename=None,
+                      max_ratio=None):
+    """Take a binary file-like object and return a binary file-like object
+    from which its decompressed contents may be read.
+
+    The compression format is taken from content_encoding, the value of a
+    ``Content-Encoding`` header, if given. Otherwise it is guessed from the
+    suffix of filename, if given, and then from the first few bytes of the file.
+    Uncompressed files are read unchanged. Raises ValueError if
+    content_encoding is not supported.
+
+    Data is decompressed as it is read. If max_ratio is not None and more than
+    :py:data:`.DECOMPRESSED_SIZE_ALLOWANCE` bytes have been read, reading raises
+    ValueError once the size of the decompressed data exceeds max_ratio times
+    the size of the compressed data read. Reading corrupt compressed data also
+    raises ValueError.
+
+    """
+    source = _CountingReader(fileobj)
+
+    if content_encoding is not None:
+        key = content_encoding.strip().lower()
+        if key not in _CONTENT_ENCODINGS:
+            raise ValueError(
+                'Unsupported content encoding "%s"', content_encoding)
+        compression = _CONTENT_ENCODINGS[key]
+    else:
+        compression = None
+        if filename is not None:
+            for suffix, c in _SUFFIXES.items():
+                if filename.endswith(suffix):
+                    compression = c
+        if compression is None:
+            prefix = source.peek(max(len(magic) for magic, _ in _MAGIC))
+            for magic, c in _MAGIC:
+                if prefix.startswith(magic):
+                    compression = c
+
+    if compression is None:
+        return io.BufferedReader(source)
+    return io.BufferedReader(_DecompressingReader(
+        _OPENERS[compression](io.BufferedReader(source), 'rb'),
+        source, max_ratio))
+
+class _CountingReader(io.RawIOBase):
+    # Reads from a file-like object, counting the bytes read and allowing the
+    # first few bytes to be peeked at.
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self._prefix = b''
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def peek(self, size):
+        while len(self._prefix) < size:
+            data = self._fileobj.read(size - len(self._prefix))
+            if not data:
+                break
+            self._prefix += data
+        return self._prefix
+
+    def readinto(self, b):
+        if self._prefix:
+            data, self._prefix = self._prefix[:len(b)], self._prefix[len(b):]
+        else:
+            data = self._fileobj.read(len(b))
+        b[:len(data)] = data
+        self.count += len(data)
+        return len(data)
+
+class _DecompressingReader(io.RawIOBase):
+    # Reads from a decompressing file object, enforcing a limit on the ratio
+    # of decompressed to compressed bytes.
+    def __init__(self, fileobj, source, max_ratio):
+        self._fileobj = fileobj
+        self._source = source
+        self._max_ratio = max_ratio
+        self._count = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        try:
+            n = self._fileobj.readinto(b)
+        except (OSError, EOFError, zlib.error, lzma.LZMAError) as e:
+            raise ValueError('Invalid compressed data: %s', e)
+        self._count += n
+        if (self._max_ratio is not None
+                and self._count > DECOMPRESSED_SIZE_ALLOWANCE
+                and self._count > self._max_ratio * self._source.count):
+            raise ValueError(
+                'Decompressed data is more than %s times larger than the '
+                'compressed data', self._max_ratio)
+        return n
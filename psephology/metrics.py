@@ -0,0 +1,306 @@
+"""
+The :py:mod:`.metrics` module records where time is spent serving requests and
+exposes the measurements at ``/metrics`` in the `Prometheus text format`_.
+
+For each endpoint the following are recorded:
+
+* the number of requests by method and status code;
+* a histogram of request latency;
+* a histogram of the number of SQL statements executed per request and the
+  total time spent executing them.
+
+SQL statements are counted via SQLAlchemy's cursor execution events on the
+application's engine. The number of result lines imported and the time taken to
+import them are also recorded so that import throughput may be derived.
+
+Measurements are kept in memory by each process. When running more than one
+worker, each must be scraped separately. Instrumentation is enabled by the
+``METRICS_ENABLED`` configuration value.
+
+.. _Prometheus text format:
+    https://prometheus.io/docs/instrumenting/exposition_formats/
+
+"""
+import bisect
+import threading
+import time
+
+from flask import Response, current_app, g, has_request_context, request
+from sqlalchemy import event as sqlalchemy_event
+
+from .model import db
+
+#: Key in app.extensions used to store the metrics
+_EXTENSION_KEY = 'psephology_metrics'
+
+#: Content type of the Prometheus text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+#: Default histogram buckets for durations in seconds
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+
+#: Histogram buckets for the number of SQL statements per request
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+class Counter:
+    """A monotonically increasing value for each combination of label values.
+
+    :param name: metric name
+    :param help: human-readable description
+    :param labels: sequence of label names
+
+    """
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        # Metrics without labels are reported even before they change
+        self._values = {} if len(self.labels) > 0 else {(): 0}
+
+    def inc(self, label_values=(), amount=1):
+        """Increase the value for label_values, a tuple of values in the same
+        order as the label names, by amount.
+
+        """
+        with self._lock:
+            self._values[label_values] = (
+                self._values.get(label_values, 0) + amount)
+
+    def value(self, label_values=()):
+        """Return the current value for label_values."""
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def samples(self):
+        """Yield (suffix, labels, value) tuples for each sample."""
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield '', dict(zip(self.labels, label_values)), value
+
+class Histogram:
+    """A distribution of observed values for each combination of label values.
+    Observations are counted in cumulative buckets in the same way as a
+    Prometheus histogram.
+
+    :param name: metric name
+    :param help: human-readable description
+    :param labels: sequence of label names
+    :param buckets: increasing sequence of bucket upper bounds
+
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}
+        if len(self.labels) == 0:
+            self._values[()] = [[0] * (len(self.buckets) + 1), 0, 0]
+
+    def observe(self, value, label_values=()):
+        """Record an observation of value for label_values."""
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [
+                    [0] * (len(self.buckets) + 1), 0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, label_values=()):
+        """Return the number of observations for label_values."""
+        with self._lock:
+            state = self._values.get(label_values)
+            return state[2] if state is not None else 0
+
+    def samples(self):
+        """Yield (suffix, labels, value) tuples for each sample."""
+        with self._lock:
+            items = sorted(
+                (k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        for label_values, (counts, total, count) in items:
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(
+                    self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield '_bucket', dict(labels, le=_format_value(bound)), \
+                    cumulative
+            yield '_sum', labels, total
+            yield '_count', labels, count
+
+class Metrics:
+    """The metrics recorded for an application.
+
+    .. py:attribute:: requests
+
+        :py:class:`.Counter` of requests by endpoint, method and status.
+
+    .. py:attribute:: request_duration
+
+        :py:class:`.Histogram` of request latency by endpoint.
+
+    .. py:attribute:: request_statements
+
+        :py:class:`.Histogram` of SQL statements per request by endpoint.
+
+    .. py:attribute:: statement_duration
+
+        :py:class:`.Counter` of time spent executing SQL by endpoint.
+
+    .. py:attribute:: import_lines
+
+        :py:class:`.Counter` of result lines imported.
+
+    .. py:attribute:: import_diagnostics
+
+        :py:class:`.Counter` of diagnostics reported by imports.
+
+    .. py:attribute:: import_duration
+
+        :py:class:`.Histogram` of the time taken to import and commit results.
+
+    """
+    def __init__(self):
+        self.requests = Counter(
+            'psephology_requests_total', 'Requests handled.',
+            ('endpoint', 'method', 'status'))
+        self.request_duration = Histogram(
+            'psephology_request_duration_seconds',
+            'Time taken to handle requests.', ('endpoint',))
+        self.request_statements = Histogram(
+            'psephology_request_sql_statements',
+            'SQL statements executed per request.', ('endpoint',),
+            buckets=STATEMENT_BUCKETS)
+        self.statement_duration = Counter(
+            'psephology_sql_duration_seconds_total',
+            'Time spent executing SQL statements.', ('endpoint',))
+        self.import_lines = Counter(
+            'psephology_import_lines_total', 'Result lines imported.')
+        self.import_diagnostics = Counter(
+            'psephology_import_diagnostics_total',
+            'Diagnostics reported by imports.')
+        self.import_duration = Histogram(
+            'psephology_import_duration_seconds',
+            'Time taken to import and commit results.')
+
+    def all(self):
+        """Return a list of every metric."""
+        return [
+            self.requests, self.request_duration, self.request_statements,
+            self.statement_duration, self.import_lines,
+            self.import_diagnostics, self.import_duration,
+        ]
+
+    def render(self):
+        """Return all metrics in the Prometheus text format."""
+        lines = []
+        for metric in self.all():
+            lines.append('# HELP {} {}'.format(metric.name, metric.help))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            for suffix, labels, value in metric.samples():
+                lines.append('{}{}{} {}'.format(
+                    metric.name, suffix, _format_labels(labels),
+                    _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+def _format_labels(labels):
+    if len(labels) == 0:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', r'\\').replace(
+            '"', r'\"').replace('\n', r'\n'))
+        for k, v in labels.items()
+    ) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def init_app(app):
+    """Instrument app according to its configuration and add the ``/metrics``
+    endpoint.
+
+    """
+    if not app.config.get('METRICS_ENABLED', False):
+        return
+
+    metrics = Metrics()
+    app.extensions[_EXTENSION_KEY] = metrics
+
+    @app.before_request
+    def _start_request():
+        g._metrics_start = time.perf_counter()
+        g._metrics_statements = 0
+        g._metrics_statement_time = 0.
+
+    @app.after_request
+    def _finish_request(response):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return response
+        endpoint = request.endpoint or 'none'
+        metrics.requests.inc(
+            (endpoint, request.method, str(response.status_code)))
+        metrics.request_duration.observe(
+            time.perf_counter() - start, (endpoint,))
+        metrics.request_statements.observe(
+            g.pop('_metrics_statements'), (endpoint,))
+        metrics.statement_duration.inc(
+            (endpoint,), g.pop('_metrics_statement_time'))
+        return response
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                               executemany):
+        conn.info['_metrics_start'] = time.perf_counter()
+
+    def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        if has_request_context() and '_metrics_start' in g:
+            g._metrics_statements += 1
+            g._metrics_statement_time += (
+                time.perf_counter() - conn.info['_metrics_start'])
+
+    with app.app_context():
+        sqlalchemy_event.listen(
+            db.engine, 'before_cursor_execute', _before_cursor_execute)
+        sqlalchemy_event.listen(
+            db.engine, 'after_cursor_execute', _after_cursor_execute)
+
+    app.add_url_rule('/metrics', 'metrics', _metrics_view)
+
+def _metrics_view():
+    return Response(get_metrics().render(), content_type=CONTENT_TYPE)
+
+def get_metrics(app=None):
+    """Return the :py:class:`.Metrics` for app or None if it is not
+    instrumented. If app is None, the current application is used.
+
+    """
+    app = app if app is not None else current_app
+    return app.extensions.get(_EXTENSION_KEY)
+
+def observe_import(line_count, diagnostic_count, duration):
+    """Record an import of line_count lines which produced diagnostic_count
+    diagnostics and took duration seconds to import and commit. Does nothing if
+    the current application is not instrumented.
+
+    """
+    metrics = get_metrics()
+    if metrics is None:
+        return
+    metrics.import_lines.inc(amount=line_count)
+    metrics.import_diagnostics.inc(amount=diagnostic_count)
+    metrics.import_duration.observe(duration)
@@ -11,17 +11,28 @@ UI/API method fails.
 
 """
 
+import contextlib
 import datetime
+import difflib
+import functools
+import operator
+import struct
+import time
+import weakref
 from sqlite3 import Connection as SQLite3Connection
 
+from flask import current_app, has_app_context
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.engine import Engine
-from sqlalchemy import event as sqlalchemy_event, MetaData
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    event as sqlalchemy_event, delete, desc, func, insert, tuple_, MetaData
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import relationship, validates, Session
 from sqlalchemy.sql.schema import DEFAULT_NAMING_CONVENTION
 
-from psephology.io import parse_result_line
+from psephology.io import parse_result_line, canonical_constituency_name
 
 # Create the shared database and migration singletons.
 db = SQLAlchemy(
@@ -30,17 +41,30 @@ db = SQLAlchemy(
 migrate = Migrate()
 
 class Party(db.Model):
-    """A political party. Each party is primarily keyed by its abbreviation. In
-    addition, the name of a political party should be unique.
+    """A political party. Each party is identified by its abbreviation, or
+    "code", but is keyed by an integer so that the many records which refer to
+    a party store and compare integers rather than strings. In addition, the
+    name of a political party should be unique.
 
     .. py:attribute:: id
 
-        String primary key. This is the party "code" such as "C" or "LD".
+        Integer primary key.
+
+    .. py:attribute:: code
+
+        Unique party "code" such as "C" or "LD". Parties are identified by
+        their code in result lines and by the API.
 
     .. py:attribute:: name
 
         Human-readable "long" name for the party.
 
+    .. py:attribute:: generation_id
+
+        Integer primary key id of the :py:class:`.Generation` in which this
+        party was last created or changed via :py:func:`.upsert_parties` or
+        None if it has not been.
+
     .. py:attribute:: votings
 
         Sequence of :py:class:`.Voting` instances associated with this party.
@@ -48,10 +72,14 @@ class Party(db.Model):
     """
     __tablename__ = 'parties'
 
-    id = db.Column(db.Text, primary_key=True)
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.Text, unique=True, nullable=False)
     name = db.Column(db.Text, unique=True)
+    generation_id = db.Column(db.Integer,
+        db.ForeignKey('generations.id', ondelete='SET NULL'), index=True)
 
     votings = relationship('Voting', back_populates='party')
+    generation = relationship('Generation', back_populates='parties')
 
 class Constituency(db.Model):
     """A constituency. Essentially this is a mapping between a numeric id and a
@@ -65,18 +93,275 @@ class Constituency(db.Model):
 
         Human-readable name. Must be unique.
 
+    .. py:attribute:: canonical_name
+
+        Canonical form of name as returned by
+        :py:func:`psephology.io.canonical_constituency_name`. This is set
+        automatically when name is set. It is unique and is used to match
+        constituency names when importing results.
+
+    .. py:attribute:: aliases
+
+        Sequence of :py:class:`.ConstituencyAlias` instances giving alternative
+        names for this constituency.
+
+    .. py:attribute:: region_id
+
+        Integer primary key id of the region containing this constituency or
+        None if the constituency has not been assigned to a region.
+
+    .. py:attribute:: region
+
+        :py:class:`.Region` instance for containing region or None.
+
     .. py:attribute:: votings
 
         Sequence of :py:class:`.Voting` instances associated with this
-        constituency.
+        constituency. These form the *current* result for the constituency.
+
+    .. py:attribute:: result_versions
+
+        Sequence of :py:class:`.ResultVersion` instances recording every result
+        which has been imported for this constituency, oldest first.
+
+    .. py:attribute:: slug
+
+        The canonical name with spaces replaced by hyphens, suitable for use in
+        URLs, or None if there is no canonical name. Since hyphens are ignored
+        by :py:func:`psephology.io.canonical_constituency_name`, the slug may
+        be passed to :py:func:`.resolve_constituencies`.
 
     """
     __tablename__ = 'constituencies'
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.Text, unique=True, nullable=False)
+    canonical_name = db.Column(db.Text, unique=True, index=True)
+    region_id = db.Column(db.Integer,
+        db.ForeignKey('regions.id', ondelete='SET NULL'), index=True)
 
+    aliases = relationship('ConstituencyAlias', back_populates='constituency')
+    region = relationship('Region', back_populates='constituencies')
     votings = relationship('Voting', back_populates='constituency')
+    result_versions = relationship('ResultVersion',
+        back_populates='constituency', order_by='ResultVersion.id')
+
+    @validates('name')
+    def _set_canonical_name(self, key, name):
+        self.canonical_name = (
+            canonical_constituency_name(name) if name is not None else None)
+        return name
+
+    @property
+    def slug(self):
+        if self.canonical_name is None:
+            return None
+        return self.canonical_name.replace(' ', '-')
+
+class ConstituencyAlias(db.Model):
+    """An alternative name for a constituency. Aliases are used to match
+    constituency names from result feeds which differ from the name recorded
+    in the database by more than the differences ignored by
+    :py:func:`psephology.io.canonical_constituency_name`.
+
+    .. py:attribute:: id
+
+        Integer primary key.
+
+    .. py:attribute:: canonical_name
+
+        Canonical form of the alternative name. Must be unique.
+
+    .. py:attribute:: constituency_id
+
+        Integer primary key id of associated constituency.
+
+    .. py:attribute:: constituency
+
+        :py:class:`.Constituency` instance for associated constituency.
+
+    """
+    __tablename__ = 'constituency_aliases'
+
+    id = db.Column(db.Integer, primary_key=True)
+    canonical_name = db.Column(db.Text, unique=True, index=True,
+        nullable=False)
+    constituency_id = db.Column(db.Integer,
+        db.ForeignKey('constituencies.id', ondelete='CASCADE'),
+        nullable=False, index=True)
+
+    constituency = relationship('Constituency', back_populates='aliases')
+
+class Nation(db.Model):
+    """A nation, such as "Scotland". Nations are divided into regions.
+
+    .. py:attribute:: id
+
+        Integer primary key.
+
+    .. py:attribute:: name
+
+        Human-readable name. Must be unique.
+
+    .. py:attribute:: regions
+
+        Sequence of :py:class:`.Region` instances within this nation.
+
+    """
+    __tablename__ = 'nations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.Text, unique=True, nullable=False)
+
+    regions = relationship('Region', back_populates='nation',
+        order_by='Region.name')
+
+class Region(db.Model):
+    """A region within a nation, such as "North East". Regions are made up of
+    constituencies. A nation which is not divided into regions has a single
+    region of the same name.
+
+    .. py:attribute:: id
+
+        Integer primary key.
+
+    .. py:attribute:: name
+
+        Human-readable name. Must be unique.
+
+    .. py:attribute:: nation_id
+
+        Integer primary key id of the containing nation.
+
+    .. py:attribute:: nation
+
+        :py:class:`.Nation` instance for the containing nation.
+
+    .. py:attribute:: constituencies
+
+        Sequence of :py:class:`.Constituency` instances within this region.
+
+    .. py:attribute:: party_totals
+
+        Sequence of :py:class:`.RegionPartyTotal` instances giving the
+        current totals for each party within this region.
+
+    """
+    __tablename__ = 'regions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.Text, unique=True, nullable=False)
+    nation_id = db.Column(db.Integer,
+        db.ForeignKey('nations.id', ondelete='CASCADE'),
+        nullable=False, index=True)
+
+    nation = relationship('Nation', back_populates='regions')
+    constituencies = relationship('Constituency', back_populates='region')
+    party_totals = relationship('RegionPartyTotal', back_populates='region')
+
+class RegionPartyTotal(db.Model):
+    """Pre-computed totals for a party within a region. These are maintained
+    incrementally as results are imported and as constituencies are assigned
+    to regions so that regional summaries need not aggregate the
+    :py:class:`.Voting` table. :py:func:`.rebuild_region_party_totals` may be
+    used to re-compute them from scratch.
+
+    .. py:attribute:: region_id
+
+        Integer primary key id of the region.
+
+    .. py:attribute:: party_id
+
+        Integer primary key id of the party.
+
+    .. py:attribute:: vote_count
+
+        Total number of votes cast for the party within the region.
+
+    .. py:attribute:: seat_count
+
+        Number of constituencies within the region won by the party.
+
+    """
+    __tablename__ = 'region_party_totals'
+
+    region_id = db.Column(db.Integer,
+        db.ForeignKey('regions.id', ondelete='CASCADE'), primary_key=True)
+    party_id = db.Column(db.Integer,
+        db.ForeignKey('parties.id', ondelete='CASCADE'), primary_key=True)
+    vote_count = db.Column(db.Integer, nullable=False, default=0)
+    seat_count = db.Column(db.Integer, nullable=False, default=0)
+
+    region = relationship('Region', back_populates='party_totals')
+    party = relationship('Party')
+
+class PartyTotal(db.Model):
+    """Pre-computed national totals for a party. These are maintained
+    incrementally as results are imported so that national vote totals need
+    not aggregate the :py:class:`.Voting` table.
+    :py:func:`.rebuild_party_totals` may be used to re-compute them from
+    scratch.
+
+    .. py:attribute:: party_id
+
+        Integer primary key id of the party.
+
+    .. py:attribute:: vote_count
+
+        Total number of votes cast for the party.
+
+    .. py:attribute:: seat_count
+
+        Number of constituencies won by the party.
+
+    """
+    __tablename__ = 'party_totals'
+
+    party_id = db.Column(db.Integer,
+        db.ForeignKey('parties.id', ondelete='CASCADE'), primary_key=True)
+    vote_count = db.Column(db.Integer, nullable=False, default=0)
+    seat_count = db.Column(db.Integer, nullable=False, default=0)
+
+    party = relationship('Party')
+
+class PartyTotalSnapshot(db.Model):
+    """A copy of a :py:class:`.PartyTotal` taken at the end of an import. All
+    snapshots taken at the end of one import share the same creation time.
+    Together they form a time series of the national totals.
+
+    .. py:attribute:: id
+
+        Integer primary key.
+
+    .. py:attribute:: created_at
+
+        Date and time at which this snapshot was taken in UTC.
+
+    .. py:attribute:: party_id
+
+        Integer primary key id of the party.
+
+    .. py:attribute:: vote_count
+
+        Total number of votes cast for the party at the time of the snapshot.
+
+    .. py:attribute:: seat_count
+
+        Number of constituencies won by the party at the time of the snapshot.
+
+    """
+    __tablename__ = 'party_total_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False,
+            default=datetime.datetime.utcnow, index=True)
+    party_id = db.Column(db.Integer,
+        db.ForeignKey('parties.id', ondelete='CASCADE'), nullable=False,
+        index=True)
+    vote_count = db.Column(db.Integer, nullable=False)
+    seat_count = db.Column(db.Integer, nullable=False)
+
+    party = relationship('Party')
 
 class Voting(db.Model):
     """A record of a number of votes cast for a particular party within a
@@ -100,7 +385,7 @@ class Voting(db.Model):
 
     .. py:attribute:: party_id
 
-        String primary key id of associated party.
+        Integer primary key id of associated party.
 
     .. py:attribute:: party
 
@@ -113,16 +398,219 @@ class Voting(db.Model):
     count = db.Column(db.Integer, nullable=False)
     constituency_id = db.Column(db.Integer,
         db.ForeignKey('constituencies.id', ondelete='CASCADE'),
-        nullable=False)
-    party_id = db.Column(db.Text,
+        nullable=False, index=True)
+    party_id = db.Column(db.Integer,
         db.ForeignKey('parties.id', ondelete='CASCADE'),
-        nullable=False)
+        nullable=False, index=True)
 
     constituency = relationship('Constituency',
         back_populates='votings')
     party = relationship('Party',
         back_populates='votings')
 
+class PackedResult(db.Model):
+    """The current result for a constituency held in a single row. These are
+    used in place of :py:class:`.Voting` records when the ``RESULT_STORAGE``
+    configuration value is "packed" (see :py:func:`.result_storage`). The votes
+    are encoded by :py:func:`.pack_results` and the winner and counts derived
+    from them are stored alongside so that listings need not decode them.
+
+    .. py:attribute:: constituency_id
+
+        Integer primary key id of the constituency.
+
+    .. py:attribute:: votes
+
+        Vote count, party id pairs in the order they were imported as encoded
+        by :py:func:`.pack_results`.
+
+    .. py:attribute:: winner_party_id
+
+        Integer primary key id of the winning party or None if there were no
+        votes. A tie is won by the first party listed.
+
+    .. py:attribute:: max_vote_count
+
+        Number of votes for the winning party or None if there were no votes.
+
+    .. py:attribute:: total_vote_count
+
+        Total number of votes cast or None if there were no votes.
+
+    .. py:attribute:: margin
+
+        Number of votes by which the winning party beat the second-placed
+        party, or the winning vote count if only one party stood, or None if
+        there were no votes.
+
+    """
+    __tablename__ = 'packed_results'
+
+    constituency_id = db.Column(db.Integer,
+        db.ForeignKey('constituencies.id', ondelete='CASCADE'),
+        primary_key=True)
+    votes = db.Column(db.LargeBinary, nullable=False)
+    winner_party_id = db.Column(db.Integer,
+        db.ForeignKey('parties.id', ondelete='CASCADE'), index=True)
+    max_vote_count = db.Column(db.Integer)
+    total_vote_count = db.Column(db.Integer)
+    margin = db.Column(db.Integer)
+
+    constituency = relationship('Constituency')
+    winner = relationship('Party')
+
+class Generation(db.Model):
+    """A data generation. Each database transaction which replaces one or more
+    constituency results or changes parties creates a new generation. The ids
+    of committed generations increase monotonically and are never re-used.
+    Clients may use them to ask for only those results which have changed since
+    a generation they have already seen and caches may use them to tell when
+    cached data is stale.
+
+    .. py:attribute:: id
+
+        Integer primary key. This is the generation number.
+
+    .. py:attribute:: created_at
+
+        Date and time at which this generation was created in UTC. When
+        creating an instance, this defaults to the current date and time.
+
+    .. py:attribute:: result_versions
+
+        Sequence of :py:class:`.ResultVersion` instances created in this
+        generation.
+
+    .. py:attribute:: parties
+
+        Sequence of :py:class:`.Party` instances last changed in this
+        generation.
+
+    """
+    __tablename__ = 'generations'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False,
+            default=datetime.datetime.utcnow)
+
+    result_versions = relationship('ResultVersion',
+        back_populates='generation')
+    parties = relationship('Party', back_populates='generation')
+
+class ResultVersion(db.Model):
+    """A single imported result for a constituency. Result versions are only
+    ever appended; importing a new result for a constituency adds a new version
+    rather than modifying an existing one. This allows the state of the results
+    at some point in the past to be reconstructed.
+
+    The current result for a constituency is also materialised as
+    :py:class:`.Voting` rows, or as a :py:class:`.PackedResult` row, so that
+    the common case of asking for the latest results does not need to consult
+    the history.
+
+    .. py:attribute:: id
+
+        Integer primary key. Versions for a constituency are ordered by id.
+
+    .. py:attribute:: created_at
+
+        Date and time at which this version was imported in UTC. When creating
+        an instance, this defaults to the current date and time.
+
+    .. py:attribute:: constituency_id
+
+        Integer primary key id of associated constituency.
+
+    .. py:attribute:: constituency
+
+        :py:class:`.Constituency` instance for associated constituency.
+
+    .. py:attribute:: generation_id
+
+        Integer primary key id of the :py:class:`.Generation` in which this
+        version was created. Versions created before generations were recorded
+        may have a generation id of None.
+
+    .. py:attribute:: generation
+
+        :py:class:`.Generation` instance for associated generation.
+
+    .. py:attribute:: votings
+
+        Sequence of :py:class:`.VersionedVoting` instances making up this
+        result.
+
+    """
+    __tablename__ = 'result_versions'
+    __table_args__ = (
+        db.Index('ix_result_versions_constituency_id_created_at',
+            'constituency_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False,
+            default=datetime.datetime.utcnow, index=True)
+    constituency_id = db.Column(db.Integer,
+        db.ForeignKey('constituencies.id', ondelete='CASCADE'),
+        nullable=False)
+
+    generation_id = db.Column(db.Integer,
+        db.ForeignKey('generations.id', ondelete='CASCADE'), index=True)
+
+    constituency = relationship('Constituency',
+        back_populates='result_versions')
+    generation = relationship('Generation',
+        back_populates='result_versions')
+    votings = relationship('VersionedVoting',
+        back_populates='version')
+
+class VersionedVoting(db.Model):
+    """A record of a number of votes cast for a particular party as part of a
+    :py:class:`.ResultVersion`. This mirrors :py:class:`.Voting` except that
+    it is associated with a result version rather than directly with a
+    constituency.
+
+    .. py:attribute:: id
+
+        Integer primary key.
+
+    .. py:attribute:: count
+
+        Number of votes cast.
+
+    .. py:attribute:: version_id
+
+        Integer primary key id of associated result version.
+
+    .. py:attribute:: version
+
+        :py:class:`.ResultVersion` instance for associated result version.
+
+    .. py:attribute:: party_id
+
+        Integer primary key id of associated party.
+
+    .. py:attribute:: party
+
+        :py:class:`.Party` instance for associated party.
+
+    """
+    __tablename__ = 'versioned_votings'
+
+    id = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    version_id = db.Column(db.Integer,
+        db.ForeignKey('result_versions.id', ondelete='CASCADE'),
+        nullable=False, index=True)
+    party_id = db.Column(db.Integer,
+        db.ForeignKey('parties.id', ondelete='CASCADE'),
+        nullable=False, index=True)
+
+    version = relationship('ResultVersion',
+        back_populates='votings')
+    party = relationship('Party')
+
 class LogEntry(db.Model):
     """A record of some log-worthy text.
 
@@ -147,24 +635,310 @@ class LogEntry(db.Model):
             default=datetime.datetime.utcnow, index=True)
     message = db.Column(db.Text)
 
+class SlowQuery(db.Model):
+    """A record of an SQL statement which took longer than the
+    ``SLOW_QUERY_THRESHOLD`` configuration value to execute. See
+    :py:mod:`.slowlog`.
+
+    .. py:attribute:: id
+
+        Integer primary key.
+
+    .. py:attribute:: created_at
+
+        Date and time at which the statement finished executing in UTC.
+
+    .. py:attribute:: duration
+
+        Time taken to execute the statement in seconds.
+
+    .. py:attribute:: statement
+
+        SQL text of the statement.
+
+    .. py:attribute:: parameters
+
+        Textual representation of the statement's parameters.
+
+    .. py:attribute:: endpoint
+
+        Endpoint of the request which executed the statement or None if it was
+        not executed while handling a request.
+
+    .. py:attribute:: plan
+
+        Output of ``EXPLAIN QUERY PLAN`` for the statement, one step per line,
+        or None if it was not recorded.
+
+    """
+    __tablename__ = 'slow_queries'
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False,
+            default=datetime.datetime.utcnow, index=True)
+    duration = db.Column(db.Float, nullable=False)
+    statement = db.Column(db.Text, nullable=False)
+    parameters = db.Column(db.Text)
+    endpoint = db.Column(db.String, index=True)
+    plan = db.Column(db.Text)
+
 def log(message):
     """Convenience function to log a message to the database."""
     db.session.add(LogEntry(message=message))
 
-def _query_valid_party_codes(session=None):
-    """Return a set of valid party codes."""
+def _query_party_ids(session=None):
+    """Return a dictionary mapping party code to party id."""
+    session = session if session is not None else db.session
+    return dict(session.query(Party.code, Party.id))
+
+#: Cached party ids for each engine as a (generation, ids, codes) tuple
+_party_ids_cache = weakref.WeakKeyDictionary()
+
+def party_ids(session=None):
+    """Return a dictionary mapping each valid party code to the integer id of
+    that party. The dictionary is shared and must not be modified. It is cached
+    until the latest generation changes. Since :py:func:`.upsert_parties` and
+    :py:func:`.delete_parties` create a new generation, changes made by them in
+    any process are seen once they are committed. Parties added directly to the
+    database are not seen until the next generation. The cache is only filled
+    by a session which has not written to the database in its current
+    transaction so that uncommitted parties are never shared.
+
+    """
+    return _cached_party_ids(session)[0]
+
+def valid_party_codes(session=None):
+    """Return a frozenset of valid party codes. The set is cached in the same
+    way as :py:func:`.party_ids`.
+
+    """
+    return _cached_party_ids(session)[1]
+
+def _cached_party_ids(session):
+    # Return the party ids and codes as a pair, querying them if necessary
+    session = session if session is not None else db.session
+    engine = session.get_bind()
+    generation = latest_generation(session)
+
+    cached = _party_ids_cache.get(engine)
+    if cached is not None and cached[0] == generation:
+        return cached[1:]
+
+    ids = _query_party_ids(session)
+    codes = frozenset(ids)
+
+    # Changes made within this transaction, including a new generation, may yet
+    # be rolled back. Since the cache is shared by every session, it is only
+    # filled from a transaction which can see nothing but committed parties.
+    if not _has_uncommitted_changes(session):
+        _party_ids_cache[engine] = (generation, ids, codes)
+
+    return ids, codes
+
+def _has_uncommitted_changes(session):
+    # Has session changed the database, or does it have changes pending, within
+    # its current transaction?
+    return (
+        session.info.get(_WRITTEN_KEY, False) or len(session.new) > 0 or
+        len(session.dirty) > 0 or len(session.deleted) > 0
+    )
+
+def upsert_parties(parties, session=None):
+    """Create or update parties from an iterable of (code, name) pairs. If a
+    party with a given code exists, its name is replaced. Raises ValueError
+    with an informative message, having made no changes, if any code or name is
+    empty or repeated or if a name is already used by a party not being
+    updated. Names may be swapped between the parties being updated. Returns a
+    list of the :py:class:`.Party` instances created or updated.
+
+    A new :py:class:`.Generation` is created so that anything cached from the
+    previous generation, such as :py:func:`.valid_party_codes` and rendered
+    summaries, is invalidated when the session is committed.
+
+    """
+    session = session if session is not None else db.session
+    parties = [(code.strip(), name.strip()) for code, name in parties]
+
+    codes, names = set(), set()
+    for code, name in parties:
+        if code == '' or name == '':
+            raise ValueError('Party code and name cannot be empty')
+        if code in codes:
+            raise ValueError('Party code "%s" is repeated', code)
+        if name in names:
+            raise ValueError('Party name "%s" is repeated', name)
+        codes.add(code)
+        names.add(name)
+
+    existing = dict(
+        (p.code, p)
+        for p in session.query(Party).filter(Party.code.in_(codes)))
+    conflict = (
+        session.query(Party)
+        .filter(Party.name.in_(names), Party.code.notin_(codes))
+        .first()
+    )
+    if conflict is not None:
+        raise ValueError(
+            'Party name "%s" is already used by party "%s"',
+            conflict.name, conflict.code)
+
+    # Names may move between the parties being updated, as when two parties
+    # swap names. Renaming them one at a time would briefly give two parties the
+    # same name and so, if any name moves, the names being replaced are first
+    # cleared.
+    holders = dict((p.name, p) for p in existing.values())
+    if any(holders.get(name, existing.get(code)) is not existing.get(code)
+           for code, name in parties):
+        for code, name in parties:
+            party = existing.get(code)
+            if party is not None and party.name != name:
+                party.name = None
+        session.flush()
+
+    generation = current_generation(session)
+    updated = []
+    for code, name in parties:
+        party = existing.get(code)
+        if party is None:
+            party = Party(code=code)
+            session.add(party)
+        party.name = name
+        party.generation = generation
+        updated.append(party)
+    return updated
+
+def delete_parties(codes, session=None):
+    """Delete the parties with the given codes. Raises ValueError with an
+    informative message, having made no changes, if a party does not exist or
+    has any results. Like :py:func:`.upsert_parties`, a new
+    :py:class:`.Generation` is created.
+
+    """
     session = session if session is not None else db.session
-    return set(p.id for p in Party.query)
+    codes = set(codes)
+
+    parties = session.query(Party).filter(Party.code.in_(codes)).all()
+    missing = codes - set(p.code for p in parties)
+    if len(missing) > 0:
+        raise ValueError('Party "%s" does not exist', sorted(missing)[0])
+
+    used = (
+        session.query(Party.code)
+        .join(VersionedVoting, VersionedVoting.party_id == Party.id)
+        .filter(Party.id.in_([p.id for p in parties]))
+        .first()
+    )
+    if used is not None:
+        raise ValueError('Party "%s" has results', used[0])
+
+    current_generation(session)
+    for party in parties:
+        session.delete(party)
+
+#: Key in session.info used to record constituencies with new results
+_CHANGED_KEY = 'psephology_changed_constituencies'
+
+#: Key in session.info used to record the generation for this transaction
+_GENERATION_KEY = 'psephology_generation'
+
+#: Key in session.info used to hold pre-computed totals used in a transaction
+_TOTALS_KEY = 'psephology_totals'
+
+#: Key in session.info set once a transaction has written to the database
+_WRITTEN_KEY = 'psephology_written'
+
+#: Number of result lines which are processed together by
+#: :py:func:`.import_results`. Constituencies for all lines in a batch are
+#: resolved with a single query and their results written with a few bulk
+#: statements.
+IMPORT_BATCH_SIZE = 500
+
+#: Minimum similarity ratio, as computed by :py:mod:`difflib`, for a known
+#: constituency to be suggested as a match for an unknown one.
+SUGGESTION_CUTOFF = 0.8
+
+#: Greatest vote count which may be imported. Counts are stored as unsigned
+#: 32-bit integers by :py:func:`.pack_results`.
+MAX_VOTE_COUNT = 2**32 - 1
+
+#: Supported values of the ``RESULT_STORAGE`` configuration value
+RESULT_STORAGE_MODES = ('normalized', 'packed')
+
+def result_storage():
+    """Return how current results are stored, as set by the
+    ``RESULT_STORAGE`` configuration value of the current application. If
+    "normalized", each result is held as one :py:class:`.Voting` record per
+    party. If "packed", each result is held as a single
+    :py:class:`.PackedResult` record. Outside of an application context,
+    "normalized" is returned. The result history is held as
+    :py:class:`.VersionedVoting` records in either case.
+
+    Raises ValueError if the configuration value is not one of
+    :py:data:`.RESULT_STORAGE_MODES`.
+
+    """
+    if not has_app_context():
+        return 'normalized'
+    storage = current_app.config.get('RESULT_STORAGE', 'normalized')
+    if storage not in RESULT_STORAGE_MODES:
+        raise ValueError('Unknown result storage "{}"'.format(storage))
+    return storage
+
+def pack_results(results):
+    """Encode results, a list of vote count, party id pairs, as bytes. Each
+    pair is stored as two little-endian unsigned 32-bit integers, party id
+    first, in the order given.
+
+    """
+    return struct.pack(
+        '<{}I'.format(2 * len(results)),
+        *[v for count, party_id in results for v in (party_id, count)])
+
+def unpack_results(data):
+    """Decode bytes returned by :py:func:`.pack_results` into a list of vote
+    count, party id pairs.
+
+    """
+    values = struct.unpack('<{}I'.format(len(data) // 4), data)
+    return list(zip(values[1::2], values[0::2]))
+
+def _packed_row(constituency_id, results):
+    """Return a tuple of values for the columns of the
+    :py:class:`.PackedResult` row holding results, a list of vote count, party
+    id pairs, in the order of :py:data:`._PACKED_COLUMNS`.
+
+    """
+    if len(results) == 0:
+        return (constituency_id, pack_results(results), None, None, None, None)
+    counts = sorted((count for count, _ in results), reverse=True)
+    return (
+        constituency_id, pack_results(results), _winner(results), counts[0],
+        sum(counts), counts[0] - (counts[1] if len(counts) > 1 else 0))
+
+#: Columns of :py:class:`.PackedResult` in the order returned by
+#: :py:func:`._packed_row`
+_PACKED_COLUMNS = (
+    'constituency_id', 'votes', 'winner_party_id', 'max_vote_count',
+    'total_vote_count', 'margin'
+)
 
 def add_constituency_result_line(line, valid_codes=None, session=None):
-    """Add in a result from a constituency. Any previous result is removed. If
-    there is an error, ValueError is raised with an informative message.
+    """Add in a result from a constituency. Any previous result is replaced as
+    the current result but is retained as a :py:class:`.ResultVersion` in the
+    result history. If there is an error, ValueError is raised with an
+    informative message and the current result is left untouched.
+
+    The constituency is matched by canonical name (see
+    :py:func:`psephology.io.canonical_constituency_name`) against both
+    constituency names and :py:class:`.ConstituencyAlias` records. If there is
+    no match, a new constituency is created.
 
     Session is the database session to use. If None, the global db.session is
     used.
 
     If valid_codes is non-None, it is a set containing the party codes which are
-    allowed in this database. If None, this set is queried from the database.
+    allowed in this database. If None, :py:func:`.valid_party_codes` is used.
 
     The session is not commit()-ed.
 
@@ -172,7 +946,7 @@ def add_constituency_result_line(line, valid_codes=None, session=None):
     session = session if session is not None else db.session
     valid_codes = (
         valid_codes if valid_codes is not None else
-        _query_valid_party_codes(session)
+        valid_party_codes(session)
     )
 
     cn, results = parse_result_line(line)
@@ -182,28 +956,691 @@ def add_constituency_result_line(line, valid_codes=None, session=None):
         raise ValueError('Constituency name cannot be empty')
 
     # Get the constituency or create one if necessary
-    constituency = Constituency.query.filter(Constituency.name==cn).first()
+    constituency = resolve_constituencies([cn], session=session).get(
+        canonical_constituency_name(cn))
     if constituency is None:
         constituency = Constituency(name=cn)
         session.add(constituency)
 
-    # Delete any prior voting records for this constituency
-    Voting.query.filter(Voting.constituency_id==constituency.id).delete()
+    results = _validate_result(results, valid_codes, party_ids(session))
+    _replace_result(constituency, results, session)
+
+def _validate_result(results, valid_codes, ids):
+    """Raise ValueError if results, a list of vote count, party code pairs, has
+    more than one result for a party, refers to a party not in valid_codes or
+    has a count outside of the range 0 to :py:data:`.MAX_VOTE_COUNT`.
+    Otherwise return a list of vote count, party id pairs using ids, a
+    dictionary as returned by :py:func:`.party_ids`, to map codes to ids.
 
+    """
     # Is there one result per party?
     if len(results) != len(set(p for _, p in results)):
         raise ValueError('Multiple results for one party')
 
+    # Are all of the parties known?
+    for _, code in results:
+        if code not in valid_codes:
+            raise ValueError('Party code "%s" is unknown', code)
+
+    # Can every count be stored whichever result storage is used?
+    for count, _ in results:
+        if count < 0 or count > MAX_VOTE_COUNT:
+            raise ValueError(
+                'Vote count %s is not between 0 and %s', count, MAX_VOTE_COUNT)
+
+    return [(count, ids[code]) for count, code in results]
+
+def _replace_result(constituency, results, session):
+    """Replace the current result for a constituency with results, a list of
+    vote count, party id pairs which has been checked by
+    :py:func:`._validate_result`.
+
+    """
+    previous = current_results([constituency], session=session).get(
+        constituency, [])
+
+    # Delete any prior voting records for this constituency. The previous
+    # result is retained in the result history. Flush first so that a new
+    # constituency has an id.
+    session.flush()
+    packed = result_storage() == 'packed'
+    if packed:
+        _upsert_rows(
+            session, PackedResult.__table__, _PACKED_COLUMNS,
+            [_packed_row(constituency.id, results)])
+    else:
+        Voting.query.filter(Voting.constituency_id==constituency.id).delete()
+
+    # Append a new version to the result history
+    version = ResultVersion(
+        constituency=constituency, generation=current_generation(session))
+    session.add(version)
+
     # Now add a voting record for each result
     for count, party_id in results:
-        if party_id not in valid_codes:
-            raise ValueError('Party code "{}" is unknown'.format(party_id))
-        session.add(Voting(
-            count=count, party_id=party_id, constituency=constituency))
+        if not packed:
+            session.add(Voting(
+                count=count, party_id=party_id, constituency=constituency))
+        session.add(VersionedVoting(
+            count=count, party_id=party_id, version=version))
+
+    # Note that the constituency has changed in this transaction
+    session.info.setdefault(_CHANGED_KEY, set()).add(constituency.id)
+
+    _update_totals(constituency.region_id, previous, results, session)
+
+def _write_results(replacements, previous, session, profile):
+    """Replace the current results for a batch of constituencies using bulk
+    statements rather than ORM instances so that nothing is kept in the
+    session. replacements is a list of (constituency id, region id, results)
+    tuples in the order in which the results were imported where results is a
+    list of vote count, party id pairs which has been checked by
+    :py:func:`._validate_result`. If a constituency appears more than once, the
+    last result becomes current and every result is added to the history.
+
+    previous is a dictionary mapping constituency id to the current result for
+    that constituency. It is updated with the new results.
+
+    """
+    if len(replacements) == 0:
+        return
+
+    # Flush any pending changes, including the generation for this
+    # transaction, so that they are not interleaved with the rows below.
+    generation = current_generation(session)
+    session.flush()
+    start = time.perf_counter()
+
+    # Delete the prior voting records for every constituency at once. The
+    # previous results are retained in the result history. Packed results are
+    # replaced in place below.
+    packed = result_storage() == 'packed'
+    if not packed:
+        session.execute(delete(Voting.__table__).where(
+            Voting.__table__.c.constituency_id.in_(
+                set(r[0] for r in replacements))))
+    start = profile.record('delete', start, len(replacements))
+
+    # Append a new version to the result history for each result. Only this
+    # transaction adds versions to its generation and ids increase in the
+    # order in which rows are inserted and so the ids of the new versions are
+    # the greatest in the generation.
+    now = datetime.datetime.utcnow()
+    _insert_rows(
+        session, ResultVersion.__table__,
+        ('created_at', 'constituency_id', 'generation_id'),
+        [(now, r[0], generation.id) for r in replacements])
+    version_ids = [
+        id for id, in
+        session.query(ResultVersion.id)
+        .filter(ResultVersion.generation_id == generation.id)
+        .order_by(desc(ResultVersion.id))
+        .limit(len(replacements))
+    ]
+    version_ids.reverse()
+
+    current = {}
+    versioned_votings = []
+    for version_id, (constituency_id, region_id, results) in zip(
+            version_ids, replacements):
+        versioned_votings.extend(
+            (count, version_id, party_id) for count, party_id in results)
+        current[constituency_id] = (region_id, results)
+
+    # Changes to the pre-computed totals are summed over the batch and applied
+    # once rather than updating the ORM instances for every result. Only the
+    # change from the previous result to the last result in the batch matters
+    # for each constituency.
+    deltas = {}
+    for constituency_id, (region_id, results) in current.items():
+        for key in (None, region_id) if region_id is not None else (None,):
+            _sum_total_deltas(
+                deltas, key, previous.get(constituency_id, []), -1)
+            _sum_total_deltas(deltas, key, results, 1)
+        previous[constituency_id] = results
+    _apply_total_deltas(deltas, session)
+
+    if packed:
+        _upsert_rows(
+            session, PackedResult.__table__, _PACKED_COLUMNS, [
+                _packed_row(constituency_id, results)
+                for constituency_id, (_, results) in current.items()
+            ])
+    else:
+        _insert_rows(
+            session, Voting.__table__,
+            ('count', 'constituency_id', 'party_id'), [
+                (count, constituency_id, party_id)
+                for constituency_id, (_, results) in current.items()
+                for count, party_id in results
+            ])
+    _insert_rows(
+        session, VersionedVoting.__table__,
+        ('count', 'version_id', 'party_id'), versioned_votings)
+
+    # Note that the constituencies have changed in this transaction
+    session.info.setdefault(_CHANGED_KEY, set()).update(current)
+
+    profile.record('insert', start, len(replacements))
+
+def _insert_constituencies(names, session):
+    """Insert a constituency for each item of names, a dictionary mapping
+    canonical name to name. Returns a dictionary mapping canonical name to
+    (id, region id) pairs for the new constituencies.
+
+    """
+    if len(names) == 0:
+        return {}
+    table = Constituency.__table__
+    rows = [dict(name=name, canonical_name=key) for key, name in names.items()]
+    if not session.get_bind().dialect.insert_executemany_returning:
+        session.execute(table.insert(), rows)
+        return _resolve_constituency_ids(set(names), session)
+    result = session.execute(
+        table.insert().returning(table.c.canonical_name, table.c.id), rows)
+    return dict((key, (id, None)) for key, id in result)
+
+def _insert_rows(session, table, columns, rows):
+    """Insert rows, a list of tuples of values for columns, into table with a
+    single statement. For databases whose driver takes positional parameters,
+    such as SQLite, the tuples are passed to the driver directly rather than
+    being converted to a dictionary per row. They are only re-ordered if
+    columns are not in the order in which they appear in table. Values are
+    converted by the bind processor of their column's type, if any, as
+    SQLAlchemy would. Column defaults are not applied.
+
+    """
+    _execute_insert(session, insert(table), table, columns, rows)
+
+def _upsert_rows(session, table, columns, rows):
+    """Like :py:func:`._insert_rows` but rows whose primary key is already
+    present in table replace the existing row. On databases other than SQLite
+    and PostgreSQL, the existing rows are deleted first.
+
+    """
+    if len(rows) == 0:
+        return
+    dialect = session.get_bind().dialect
+    dialect_insert = _DIALECT_INSERTS.get(dialect.name)
+    if dialect_insert is None:
+        key = [columns.index(c.key) for c in table.primary_key.columns]
+        session.execute(delete(table).where(
+            tuple_(*table.primary_key.columns).in_(
+                [tuple(row[idx] for idx in key) for row in rows])))
+        _insert_rows(session, table, columns, rows)
+        return
+
+    statement = dialect_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=list(table.primary_key.columns),
+        set_=dict(
+            (key, statement.excluded[key]) for key in columns
+            if not table.c[key].primary_key))
+    _execute_insert(session, statement, table, columns, rows)
+
+#: Functions returning an INSERT statement which supports upserts for each
+#: dialect which has them
+_DIALECT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+def _execute_insert(session, statement, table, columns, rows):
+    """Execute statement, an INSERT statement for table, with rows as for
+    :py:func:`._insert_rows`.
+
+    """
+    if len(rows) == 0:
+        return
+    dialect = session.get_bind().dialect
+    processors = [
+        (idx, table.c[key].type.bind_processor(dialect))
+        for idx, key in enumerate(columns)
+    ]
+    processors = [(idx, p) for idx, p in processors if p is not None]
+    if len(processors) > 0:
+        rows = [_process_row(row, processors) for row in rows]
+
+    compiled = statement.compile(dialect=dialect, column_keys=columns)
+    if compiled.positional:
+        order = [columns.index(key) for key in compiled.positiontup]
+        if order != list(range(len(columns))):
+            rows = list(map(operator.itemgetter(*order), rows))
+    else:
+        rows = [dict(zip(columns, row)) for row in rows]
+    session.connection().exec_driver_sql(str(compiled), rows)
+
+def _process_row(row, processors):
+    row = list(row)
+    for idx, processor in processors:
+        row[idx] = processor(row[idx])
+    return tuple(row)
+
+def _update_totals(region_id, previous, results, session):
+    """Replace previous with results in the pre-computed national totals and,
+    if region_id is not None, the totals for that region. Both are lists of
+    vote count, party id pairs.
+
+    """
+    _update_party_totals(previous, -1, session)
+    _update_party_totals(results, 1, session)
+    if region_id is not None:
+        _update_region_party_totals(region_id, previous, -1, session)
+        _update_region_party_totals(region_id, results, 1, session)
+
+def current_generation(session=None):
+    """Return the :py:class:`.Generation` for the current transaction in
+    session, creating it if necessary.
+
+    """
+    session = session if session is not None else db.session
+    generation = session.info.get(_GENERATION_KEY)
+    if generation is None:
+        generation = Generation()
+        session.add(generation)
+        session.info[_GENERATION_KEY] = generation
+    return generation
+
+def latest_generation(session=None):
+    """Return the number of the most recently committed generation or 0 if no
+    generation has been committed.
+
+    """
+    session = session if session is not None else db.session
+    return session.query(func.max(Generation.id)).scalar() or 0
+
+@contextlib.contextmanager
+def savepoint(session=None):
+    """Context manager which runs its block within a SAVEPOINT in the current
+    transaction of session. If the block raises an exception, only the changes
+    made within the block are rolled back and the exception is re-raised. The
+    transaction itself is neither committed nor rolled back. If session is
+    None, the global db.session is used.
+
+    """
+    session = session if session is not None else db.session
+
+    # The sqlite3 module only begins a transaction before a statement which
+    # changes data. A SAVEPOINT outside of a transaction would begin one of its
+    # own which would be committed as soon as the savepoint was released.
+    dbapi_connection = session.connection().connection.dbapi_connection
+    if isinstance(dbapi_connection, SQLite3Connection) and \
+            not dbapi_connection.in_transaction:
+        dbapi_connection.execute('BEGIN')
+
+    changed = changed_constituencies(session)
+    had_generation = _GENERATION_KEY in session.info
+    nested = session.begin_nested()
+    try:
+        yield
+    except BaseException:
+        nested.rollback()
+
+        # Forget what was recorded about the transaction within the block
+        session.info[_CHANGED_KEY] = changed
+        session.info.pop(_TOTALS_KEY, None)
+        if not had_generation:
+            session.info.pop(_GENERATION_KEY, None)
+        raise
+    nested.commit()
+
+def changed_constituencies(session=None):
+    """Return a set of the ids of the constituencies whose results have been
+    replaced within session since it was last committed or rolled back.
+
+    """
+    session = session if session is not None else db.session
+    return set(session.info.get(_CHANGED_KEY, set()))
+
+def current_results(constituencies, session=None):
+    """Return the current results for a sequence of
+    :py:class:`.Constituency` instances with a single query. Returns a
+    dictionary keyed by constituency whose values are lists of vote count,
+    party id pairs. Constituencies with no results, including those not yet
+    added to the database, map to an empty list.
+
+    """
+    session = session if session is not None else db.session
+    by_id = _current_results_by_id(
+        [c.id for c in constituencies if c.id is not None], session)
+    return dict((c, by_id.get(c.id, [])) for c in constituencies)
+
+def _current_results_by_id(constituency_ids, session):
+    """Return a dictionary mapping each of constituency_ids to its current
+    result as a list of vote count, party id pairs. Constituencies with no
+    results are not present.
+
+    """
+    results = {}
+    if len(constituency_ids) == 0:
+        return results
+
+    if result_storage() == 'packed':
+        q = (
+            session.query(PackedResult.constituency_id, PackedResult.votes)
+            .filter(PackedResult.constituency_id.in_(constituency_ids))
+        )
+        for constituency_id, votes in q:
+            if len(votes) > 0:
+                results[constituency_id] = unpack_results(votes)
+        return results
+
+    q = (
+        session.query(Voting.constituency_id, Voting.count, Voting.party_id)
+        .filter(Voting.constituency_id.in_(constituency_ids))
+        .order_by(Voting.id)
+    )
+    for constituency_id, count, party_id in q:
+        results.setdefault(constituency_id, []).append((count, party_id))
+    return results
+
+def _winner(results):
+    """Return the winning party id from a list of vote count, party id pairs or
+    None if there are no results. A tie is won by the first party listed.
+
+    """
+    if len(results) == 0:
+        return None
+    return max(results, key=lambda r: r[0])[1]
+
+def _get_total(model, key, session, **kwargs):
+    """Return the pre-computed total of type model with primary key key,
+    creating it with zero counts and the keyword arguments if necessary.
+
+    Totals are held in session.info until the end of the transaction. The
+    session only weakly references unmodified instances and so, without this,
+    each total would be re-loaded from the database every time it was updated.
+
+    """
+    totals = session.info.setdefault(_TOTALS_KEY, {})
+    total = totals.get((model, key))
+    if total is None:
+        total = session.get(model, key)
+        if total is None:
+            total = model(vote_count=0, seat_count=0, **kwargs)
+            session.add(total)
+        totals[(model, key)] = total
+    return total
+
+def _sum_total_deltas(deltas, region_id, results, sign):
+    """Add (sign=1) or remove (sign=-1) results, a list of vote count, party id
+    pairs, to deltas, a dictionary mapping (region id, party id) pairs to
+    [vote count, seat count] lists. region_id is None for the national totals.
+
+    """
+    winner = _winner(results)
+    for count, party_id in results:
+        delta = deltas.setdefault((region_id, party_id), [0, 0])
+        delta[0] += sign * count
+        if party_id == winner:
+            delta[1] += sign
+
+def _apply_total_deltas(deltas, session):
+    """Add deltas, as summed by :py:func:`._sum_total_deltas`, to the
+    pre-computed totals.
+
+    """
+    for (region_id, party_id), (vote_count, seat_count) in deltas.items():
+        if region_id is None:
+            total = _get_total(
+                PartyTotal, party_id, session, party_id=party_id)
+        else:
+            total = _get_total(
+                RegionPartyTotal, (region_id, party_id), session,
+                region_id=region_id, party_id=party_id)
+        total.vote_count += vote_count
+        total.seat_count += seat_count
+
+def _update_region_party_totals(region_id, results, sign, session):
+    """Add (sign=1) or remove (sign=-1) results, a list of vote count, party id
+    pairs, from the pre-computed totals for a region.
+
+    """
+    winner = _winner(results)
+    for count, party_id in results:
+        total = _get_total(
+            RegionPartyTotal, (region_id, party_id), session,
+            region_id=region_id, party_id=party_id)
+        total.vote_count += sign * count
+        if party_id == winner:
+            total.seat_count += sign
+
+def _update_party_totals(results, sign, session):
+    """Add (sign=1) or remove (sign=-1) results, a list of vote count, party id
+    pairs, from the pre-computed national totals.
+
+    """
+    winner = _winner(results)
+    for count, party_id in results:
+        total = _get_total(PartyTotal, party_id, session, party_id=party_id)
+        total.vote_count += sign * count
+        if party_id == winner:
+            total.seat_count += sign
+
+def snapshot_party_totals(session=None):
+    """Record a :py:class:`.PartyTotalSnapshot` for every
+    :py:class:`.PartyTotal`. All snapshots share the same creation time.
+
+    """
+    session = session if session is not None else db.session
+    now = datetime.datetime.utcnow()
+    for total in PartyTotal.query:
+        session.add(PartyTotalSnapshot(
+            created_at=now, party_id=total.party_id,
+            vote_count=total.vote_count, seat_count=total.seat_count))
+
+def assign_constituency_region(constituency, region_name, nation_name,
+                               session=None):
+    """Assign a :py:class:`.Constituency` to the named region within the named
+    nation. The region and nation are created if necessary. Raises ValueError
+    if the region already exists in a different nation.
+
+    The current result for the constituency is moved between the pre-computed
+    totals for its old and new regions.
+
+    """
+    session = session if session is not None else db.session
+
+    nation = Nation.query.filter(Nation.name==nation_name).first()
+    if nation is None:
+        nation = Nation(name=nation_name)
+        session.add(nation)
+
+    region = Region.query.filter(Region.name==region_name).first()
+    if region is None:
+        region = Region(name=region_name, nation=nation)
+        session.add(region)
+        session.flush()
+    elif region.nation is not nation:
+        raise ValueError(
+            'Region "%s" is not in nation "%s"', region_name, nation_name)
+
+    if constituency.region_id == region.id:
+        return
+
+    results = current_results([constituency], session=session)[constituency]
+    if constituency.region_id is not None:
+        _update_region_party_totals(
+            constituency.region_id, results, -1, session)
+    constituency.region = region
+    _update_region_party_totals(region.id, results, 1, session)
+
+def rebuild_party_totals(session=None):
+    """Discard and re-compute all :py:class:`.PartyTotal` records from the
+    current results. This is not normally required since the totals are
+    maintained as results are imported.
+
+    """
+    session = session if session is not None else db.session
+    session.info.pop(_TOTALS_KEY, None)
+    PartyTotal.query.delete()
+
+    for results in current_results(
+            Constituency.query.all(), session=session).values():
+        _update_party_totals(results, 1, session)
+
+def rebuild_region_party_totals(session=None):
+    """Discard and re-compute all :py:class:`.RegionPartyTotal` records from
+    the current results. This is not normally required since the totals are
+    maintained as results are imported.
+
+    """
+    session = session if session is not None else db.session
+    session.info.pop(_TOTALS_KEY, None)
+    RegionPartyTotal.query.delete()
+
+    constituencies = (
+        Constituency.query.filter(Constituency.region_id != None).all())
+    for constituency, results in current_results(
+            constituencies, session=session).items():
+        _update_region_party_totals(
+            constituency.region_id, results, 1, session)
+
+def rebuild_current_results(session=None):
+    """Discard and re-create the current results from the latest
+    :py:class:`.ResultVersion` of each constituency. The results are written in
+    the form given by :py:func:`.result_storage` and any held in the other form
+    are deleted. This is required after changing the ``RESULT_STORAGE``
+    configuration value of an existing database.
+
+    """
+    session = session if session is not None else db.session
+    session.flush()
+    session.execute(delete(Voting.__table__))
+    session.execute(delete(PackedResult.__table__))
+
+    latest = (
+        session.query(func.max(ResultVersion.id).label('version_id'))
+        .group_by(ResultVersion.constituency_id)
+        .subquery()
+    )
+    q = (
+        session.query(
+            ResultVersion.constituency_id, VersionedVoting.count,
+            VersionedVoting.party_id)
+        .join(latest, latest.c.version_id == ResultVersion.id)
+        .outerjoin(VersionedVoting)
+        .order_by(ResultVersion.constituency_id, VersionedVoting.id)
+    )
+    results = {}
+    for constituency_id, count, party_id in q:
+        votes = results.setdefault(constituency_id, [])
+        if count is not None:
+            votes.append((count, party_id))
+
+    if result_storage() == 'packed':
+        _insert_rows(
+            session, PackedResult.__table__, _PACKED_COLUMNS, [
+                _packed_row(constituency_id, votes)
+                for constituency_id, votes in results.items()
+            ])
+    else:
+        _insert_rows(
+            session, Voting.__table__,
+            ('count', 'constituency_id', 'party_id'), [
+                (count, constituency_id, party_id)
+                for constituency_id, votes in results.items()
+                for count, party_id in votes
+            ])
+
+def resolve_constituencies(names, session=None):
+    """Look up constituencies by name. Names are matched by canonical name
+    against both constituency names and aliases. A single query is made to the
+    database.
+
+    Returns a dictionary mapping canonical names to :py:class:`.Constituency`
+    instances. Names which do not match a constituency are not present in the
+    dictionary.
+
+    """
+    session = session if session is not None else db.session
+    keys = set(canonical_constituency_name(name) for name in names)
+    if len(keys) == 0:
+        return {}
+
+    matches = _constituency_matches(keys, session)
+    q = (
+        session.query(Constituency, matches.c.canonical_name)
+        .join(matches, matches.c.constituency_id == Constituency.id)
+    )
+    return dict((key, constituency) for constituency, key in q)
+
+def _resolve_constituency_ids(keys, session):
+    """Like :py:func:`.resolve_constituencies` but takes a set of canonical
+    names and maps them to (id, region id) pairs rather than instances so
+    that nothing is added to the session.
+
+    """
+    if len(keys) == 0:
+        return {}
+
+    matches = _constituency_matches(keys, session)
+    q = (
+        session.query(
+            matches.c.canonical_name, Constituency.id, Constituency.region_id)
+        .join(matches, matches.c.constituency_id == Constituency.id)
+    )
+    return dict((key, (id, region_id)) for key, id, region_id in q)
+
+def _constituency_matches(keys, session):
+    """Return a sub-query giving the constituency id and canonical name,
+    labelled 'constituency_id' and 'canonical_name', of each constituency name
+    or alias whose canonical name is in keys.
+
+    """
+    return (
+        session.query(
+            Constituency.id.label('constituency_id'),
+            Constituency.canonical_name.label('canonical_name'))
+        .filter(Constituency.canonical_name.in_(keys))
+        .union_all(
+            session.query(
+                ConstituencyAlias.constituency_id,
+                ConstituencyAlias.canonical_name)
+            .filter(ConstituencyAlias.canonical_name.in_(keys))
+        )
+    ).subquery()
+
+def add_constituency_alias(alias, constituency, session=None):
+    """Record alias as an alternative name for constituency, a
+    :py:class:`.Constituency` instance. Raises ValueError if the alias already
+    refers to a different constituency. Adding an existing alias again has no
+    effect.
+
+    """
+    session = session if session is not None else db.session
+    key = canonical_constituency_name(alias)
+    if key == '':
+        raise ValueError('Alias cannot be empty')
+
+    existing = resolve_constituencies([alias], session=session).get(key)
+    if existing is not None:
+        if existing is not constituency:
+            raise ValueError(
+                '"%s" already refers to constituency "%s"', alias,
+                existing.name)
+        return
+
+    session.add(ConstituencyAlias(
+        canonical_name=key, constituency=constituency))
+
+def _suggest_constituencies(key, known_names):
+    """Return a list of constituency names from known_names, a dictionary
+    mapping canonical names to names, which are similar to the canonical name
+    key. The best match comes first.
+
+    """
+    return [
+        known_names[match]
+        for match in difflib.get_close_matches(
+            key, known_names.keys(), n=3, cutoff=SUGGESTION_CUTOFF)
+    ]
 
 class Diagnostic:
     """A diagnostic from parsing a file. Records the original line, a
-    human-readable message and a 1-based line number.
+    human-readable message and a 1-based line number. A diagnostic which is
+    not about a single line, such as one noting that further diagnostics were
+    omitted, has a line and line number of None.
 
     """
     def __init__(self, line, message, line_number):
@@ -212,58 +1649,275 @@ class Diagnostic:
         self.line_number = line_number
 
     def __str__(self):
+        if self.line is None:
+            return self.message
         return "{}: bad result line '{}': {}".format(
             self.line_number, self.line.strip(), self.message
         )
 
-def import_results(results_file, valid_codes=None, session=None):
+def error_message(error):
+    """Return the human-readable message of error, an exception raised with a
+    message and, optionally, values to be substituted into it with the ``%``
+    operator. Values taken from user input are passed separately in this way
+    so that any ``%`` characters they contain are not treated as formatting.
+
+    """
+    if len(error.args) > 1:
+        return error.args[0] % error.args[1:]
+    return str(error)
+
+class ImportProfile:
+    """Cumulative time spent in, and number of lines passing through, each
+    stage of an import. The stages are:
+
+    * "parse": parsing lines into constituency names and results;
+    * "validate": checking that results are well-formed and refer to known
+      parties;
+    * "lookup": finding existing constituencies and their current results;
+    * "delete": removing the current result for each constituency;
+    * "insert": adding the new results and updating the party totals, including
+      flushing them to the database;
+    * "commit": committing the transaction. This is recorded by the caller
+      which commits.
+
+    .. py:attribute:: timings
+
+        Dictionary mapping stage name to the total time spent in seconds.
+
+    .. py:attribute:: counts
+
+        Dictionary mapping stage name to the number of lines which passed
+        through the stage.
+
+    """
+    STAGES = ('parse', 'validate', 'lookup', 'delete', 'insert', 'commit')
+
+    def __init__(self):
+        self.timings = dict((stage, 0.) for stage in self.STAGES)
+        self.counts = dict((stage, 0) for stage in self.STAGES)
+
+    def record(self, stage, start, count=1):
+        """Add the time since start, a value from :py:func:`time.perf_counter`,
+        to stage along with count lines. Returns the current time so that the
+        return value may be used as the start of the next stage.
+
+        """
+        now = time.perf_counter()
+        self.timings[stage] += now - start
+        self.counts[stage] += count
+        return now
+
+    def update(self, other):
+        """Add the timings and counts from another profile to this one."""
+        for stage in self.STAGES:
+            self.timings[stage] += other.timings[stage]
+            self.counts[stage] += other.counts[stage]
+
+    def as_dict(self):
+        """Return a JSON-serialisable dictionary mapping each stage name to a
+        dictionary with "seconds" and "count" keys.
+
+        """
+        return dict(
+            (stage, dict(seconds=self.timings[stage], count=self.counts[stage]))
+            for stage in self.STAGES
+        )
+
+    def __str__(self):
+        # Stages which no line has reached, such as "commit" before the
+        # transaction has been committed, are omitted.
+        return ', '.join(
+            '{} {:.3f}s ({})'.format(
+                stage, self.timings[stage], self.counts[stage])
+            for stage in self.STAGES if self.counts[stage] > 0
+        )
+
+def import_results(results_file, valid_codes=None, session=None,
+                   suggest_matches=False, snapshot=True, parser=None,
+                   profile=None, max_diagnostics=None):
     """Take a iterable which yields result lines and add them to the database.
     If session is None, the global db.session is used.
 
+    Each line is parsed by parser which should return a constituency name and
+    a list of vote count, party code pairs or raise ValueError if the line is
+    malformed. If parser is None, :py:func:`.parse_result_line` is used. Pass
+    :py:func:`.parse_json_result` to import JSON records.
+
+    If profile is not None, it is an :py:class:`.ImportProfile` to which the
+    time spent in each stage of the import is added. The stage timings are
+    also recorded in the log entry for the import.
+
     If valid_codes is non-None, it is a set containing the party codes which are
-    allowed in this database. If None, this set is queried from the database.
+    allowed in this database. If None, :py:func:`.valid_party_codes` is used.
+
+    Lines are processed in batches of :py:data:`.IMPORT_BATCH_SIZE`.
+    Constituencies for every line in a batch are looked up via a single query
+    and their current results via another. The results for a batch are then
+    written with bulk statements rather than as ORM instances so that the
+    memory used by an import does not grow with the number of lines. The
+    results_file iterable is only consumed one batch at a time.
+
+    Once all lines have been imported, a snapshot of the national totals is
+    taken via :py:func:`.snapshot_party_totals` unless snapshot is False.
 
-    .. note::
+    If suggest_matches is True, a line whose constituency does not match an
+    existing one but is similar to one or more existing constituencies is not
+    imported. Instead a diagnostic listing the possible matches is returned.
+    If suggest_matches is False, a new constituency is created as usual.
 
-        This can take a relatively long time when adding several hundred
-        results. Should this become a bottleneck, there are some optimisation
-        opportunities.
+    If max_diagnostics is not None, at most that many diagnostics are kept. If
+    there are more, a final :py:class:`.Diagnostic` with no line notes how many
+    were omitted.
 
     """
     session = session if session is not None else db.session
     valid_codes = (
         valid_codes if valid_codes is not None else
-        _query_valid_party_codes(session)
+        valid_party_codes(session)
     )
+    ids = party_ids(session)
+    parser = parser if parser is not None else parse_result_line
+    profile = profile if profile is not None else ImportProfile()
 
     diagnostics = []
-
-    # This is a relatively straightforward but sub-optimal way to implement a
-    # bulk insert. The main issue is that the DB is queried once per result to
-    # see if the constituency exists. It would be preferable to do a single
-    # query over all of the given constituency names to determine which ones are
-    # present. This would make the flow of this function less obvious. For the
-    # moment, leave the sub-optimal implementation but should we need to
-    # re-visit this function as we deal with greater numbers of results the
-    # strategy above should be tried.
-
-    for line_idx, line in enumerate(results_file):
-        try:
-            add_constituency_result_line(
-                line, valid_codes=valid_codes, session=session)
-        except ValueError as e:
-            diagnostics.append(Diagnostic(
-                line, e.args[0] % e.args[1:], line_idx + 1
-            ))
+    diagnostic_count = 0
+    line_count = 0
+
+    # Mapping from canonical name to name for all known constituencies. Only
+    # loaded if we need to make a suggestion.
+    known_names = None
+
+    for batch in _batches(results_file, IMPORT_BATCH_SIZE):
+        start = time.perf_counter()
+        parsed = []
+        for line in batch:
+            try:
+                cn, results = parser(line)
+                parsed.append(
+                    (line, (cn, canonical_constituency_name(cn), results)))
+            except ValueError as e:
+                parsed.append((line, e))
+        start = profile.record('parse', start, len(batch))
+
+        constituencies = _resolve_constituency_ids(
+            set(p[1] for _, p in parsed
+                if not isinstance(p, ValueError) and p[0] != ''),
+            session)
+        previous_results = _current_results_by_id(
+            [id for id, _ in constituencies.values()], session)
+        profile.record('lookup', start, len(batch))
+
+        # Check each line and decide which constituencies must be created.
+        # Accepted lines refer to constituencies by canonical name until new
+        # ones have been inserted.
+        accepted = []
+        new_names = {}
+        for line, parsed_line in parsed:
+            line_count += 1
+            start = time.perf_counter()
+            try:
+                if isinstance(parsed_line, ValueError):
+                    raise parsed_line
+                cn, key, results = parsed_line
+
+                # Check constituency name is non-empty
+                if cn == '':
+                    raise ValueError('Constituency name cannot be empty')
+
+                if key not in constituencies and key not in new_names:
+                    if suggest_matches:
+                        if known_names is None:
+                            known_names = dict(
+                                session.query(
+                                    Constituency.canonical_name,
+                                    Constituency.name
+                                ).filter(Constituency.canonical_name != None)
+                            )
+                        suggestions = _suggest_constituencies(key, known_names)
+                        if len(suggestions) > 0:
+                            raise ValueError(
+                                'Unknown constituency, did you mean %s?',
+                                ' or '.join(
+                                    '"{}"'.format(s) for s in suggestions))
+                        known_names[key] = cn
+                    new_names[key] = cn
+
+                # As when importing a single line, the constituency is created
+                # even if its result is invalid.
+                accepted.append(
+                    (key, _validate_result(results, valid_codes, ids)))
+            except ValueError as e:
+                diagnostic_count += 1
+                if max_diagnostics is None or \
+                        len(diagnostics) < max_diagnostics:
+                    diagnostics.append(Diagnostic(
+                        line, error_message(e), line_count
+                    ))
+            profile.record('validate', start)
+
+        # Create any new constituencies
+        start = time.perf_counter()
+        constituencies.update(_insert_constituencies(new_names, session))
+        profile.record('insert', start, 0)
+
+        _write_results(
+            [constituencies[key] + (results,) for key, results in accepted],
+            previous_results, session, profile)
+
+    if diagnostic_count > len(diagnostics):
+        diagnostics.append(Diagnostic(
+            None, '{} further diagnostic(s) omitted'.format(
+                diagnostic_count - len(diagnostics)), None))
+
+    # Record the state of the national totals after this import
+    if snapshot:
+        snapshot_party_totals(session=session)
 
     # Log the fact that this import happened
     log('\n'.join([
         'Imported {} result line(s), {} diagnostic(s)'.format(
-            line_idx+1, len(diagnostics)),
+            line_count, diagnostic_count),
+        'Stage timings: {}'.format(profile),
     ] + [str(d) for d in diagnostics]))
 
     return diagnostics
 
+def _batches(iterable, size):
+    """Yield successive lists of at most size items from iterable."""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
+# Forget the record of changed constituencies, the current generation and any
+# totals at the end of each transaction. These events are also dispatched when a
+# SAVEPOINT ends, which does not end the transaction.
+@sqlalchemy_event.listens_for(Session, 'after_commit')
+@sqlalchemy_event.listens_for(Session, 'after_rollback')
+def _clear_changed_constituencies(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_CHANGED_KEY, None)
+    session.info.pop(_GENERATION_KEY, None)
+    session.info.pop(_TOTALS_KEY, None)
+    session.info.pop(_WRITTEN_KEY, None)
+
+# Record that a transaction has written to the database, either by flushing
+# ORM changes or by executing a bulk statement
+@sqlalchemy_event.listens_for(Session, 'after_flush')
+def _record_flush(session, flush_context):
+    session.info[_WRITTEN_KEY] = True
+
+@sqlalchemy_event.listens_for(Session, 'do_orm_execute')
+def _record_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or \
+            orm_execute_state.is_delete:
+        orm_execute_state.session.info[_WRITTEN_KEY] = True
+
 # Ensure that sqlite honours foreign key constraints
 # http://stackoverflow.com/questions/2614984/a
 @sqlalchemy_event.listens_for(Engine, "connect")
@@ -272,3 +1926,58 @@ def _set_sqlite_pragma(dbapi_connection, connection_record):
         cursor = dbapi_connection.cursor()
         cursor.execute("PRAGMA foreign_keys=ON;")
         cursor.close()
+
+def configure_sqlite(app):
+    """Apply the ``SQLITE_PRAGMAS`` configuration of app to each new SQLite
+    connection made by its database engine. ``SQLITE_PRAGMAS`` is a mapping
+    from pragma name to value. Pragmas are applied in order. Engines for other
+    databases are unaffected.
+
+    """
+    pragmas = list(app.config.get('SQLITE_PRAGMAS', {}).items())
+    if len(pragmas) == 0:
+        return
+
+    def _apply_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, SQLite3Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute('PRAGMA {}={};'.format(name, value))
+        cursor.close()
+
+    with app.app_context():
+        sqlalchemy_event.listen(db.engine, 'connect', _apply_pragmas)
+
+def read_only(view):
+    """Decorator for views which only read from the database. If the
+    ``SQLITE_READ_ONLY_VIEWS`` configuration value is True and the database is
+    SQLite, the view is run with the ``query_only`` pragma set on its
+    connection so that any attempt to write fails rather than taking the
+    database's write lock.
+
+    The decorated view must not return a response which reads from the database
+    after the view returns.
+
+    """
+    @functools.wraps(view)
+    def _view(*args, **kwargs):
+        if not current_app.config.get('SQLITE_READ_ONLY_VIEWS', False):
+            return view(*args, **kwargs)
+
+        dbapi_connection = db.session.connection().connection.dbapi_connection
+        if not isinstance(dbapi_connection, SQLite3Connection):
+            return view(*args, **kwargs)
+
+        # Any changes already pending in the session were not made by the view
+        db.session.flush()
+
+        dbapi_connection.execute('PRAGMA query_only=ON;')
+        try:
+            return view(*args, **kwargs)
+        finally:
+            # The connection is returned to the pool after the request and so
+            # must be made writable again.
+            dbapi_connection.execute('PRAGMA query_only=OFF;')
+
+    return _view
@@ -2,12 +2,21 @@
 The :py:mod:`.query` module provides some ready-to-use queries which can be run
 against the database.
 
+Queries which take an ``as_of`` argument can be used to reconstruct results as
+they stood at some point in the past. If ``as_of`` is ``None``, the current
+results are used. Otherwise it should be a :py:class:`datetime.datetime` in UTC
+and results are reconstructed from the :py:class:`.ResultVersion` history.
+
 """
-from sqlalchemy import func
+from sqlalchemy import and_, desc, func, or_
 
-from .model import db, Constituency, Party, Voting
+from .model import (
+    db, Constituency, Party, Voting, PackedResult, ResultVersion,
+    VersionedVoting, Nation, Region, RegionPartyTotal, PartyTotal,
+    PartyTotalSnapshot, LogEntry, SlowQuery, result_storage
+)
 
-def constituency_winners():
+def constituency_winners(as_of=None):
     """
     A query which returns the Constituency, Voting, winning vote count and
     total vote count for each constituency. If there was no winner in the
@@ -17,6 +26,15 @@ def constituency_winners():
     The maximum vote count for a constituency is labelled 'max_vote_count' and
     the total vote count is labelled 'total_vote_count'.
 
+    If as_of is not None, the Voting is replaced by a
+    :py:class:`.VersionedVoting` and only constituencies which had a result at
+    that time are returned.
+
+    The current Voting records are only maintained when
+    :py:func:`.result_storage` is "normalized". Use
+    :py:func:`.constituency_winner_columns` for a query which works with either
+    storage.
+
     If you intend to get related objects from the Voting, make sure to add an
     appropriate joinedload() to the options.
 
@@ -29,6 +47,9 @@ def constituency_winners():
         )
 
     """
+    if as_of is not None:
+        return _historic_constituency_winners(as_of)
+
     return (
         Constituency.query
         .add_entity(Voting)
@@ -39,18 +60,364 @@ def constituency_winners():
         .outerjoin(Voting).group_by(Constituency.id)
     )
 
-def party_totals():
+def constituency_winner_columns(as_of=None):
+    """
+    Like :py:func:`.constituency_winners` but the query returns columns rather
+    than ORM instances. Each row gives the constituency's id, name and
+    canonical name, the winning party id labelled 'party_id' and the winning and
+    total vote counts labelled as for :py:func:`.constituency_winners`. Rows
+    may be filtered and ordered in the same way.
+
+    If as_of is None and :py:func:`.result_storage` is "packed", the columns
+    are read from each constituency's :py:class:`.PackedResult` without
+    grouping.
+
+    """
+    if as_of is None and result_storage() == 'packed':
+        return (
+            db.session.query(
+                Constituency.id, Constituency.name,
+                Constituency.canonical_name,
+                PackedResult.winner_party_id.label('party_id'),
+                PackedResult.max_vote_count.label('max_vote_count'),
+                PackedResult.total_vote_count.label('total_vote_count'))
+            .outerjoin(PackedResult)
+        )
+
+    voting_class = Voting if as_of is None else VersionedVoting
+    return constituency_winners(as_of=as_of).with_entities(
+        Constituency.id, Constituency.name, Constituency.canonical_name,
+        voting_class.party_id.label('party_id'),
+        func.max(voting_class.count).label('max_vote_count'),
+        func.sum(voting_class.count).label('total_vote_count')
+    )
+
+def constituency_votes():
+    """
+    A query which returns the id and name of each constituency along with the
+    count and party id of each of its current votes, labelled 'count' and
+    'party_id'. Rows are ordered by constituency id and then in the order the
+    votes were imported. A constituency with no result has a single row whose
+    count and party id are None.
+
+    This query reads :py:class:`.Voting` records and so is only useful when
+    :py:func:`.result_storage` is "normalized". See
+    :py:func:`.constituency_packed_votes`.
+
+    """
+    return (
+        db.session.query(
+            Constituency.id, Constituency.name,
+            Voting.count.label('count'), Voting.party_id.label('party_id'))
+        .outerjoin(Voting)
+        .order_by(Constituency.id, Voting.id)
+    )
+
+def constituency_packed_votes():
+    """
+    A query which returns the id and name of each constituency along with its
+    current votes, labelled 'votes', as encoded by
+    :py:func:`.pack_results`. Rows are ordered by constituency id. The votes of
+    a constituency with no result are None. This is the equivalent of
+    :py:func:`.constituency_votes` when :py:func:`.result_storage` is
+    "packed".
+
+    """
+    return (
+        db.session.query(
+            Constituency.id, Constituency.name,
+            PackedResult.votes.label('votes'))
+        .outerjoin(PackedResult)
+        .order_by(Constituency.id)
+    )
+
+def party_totals(as_of=None):
     """
     A query which returns a Party and a constituency count, labelled
     'constituency_count' which gives the number of constituencies that party has
-    won.
+    won. If as_of is not None, this is the number of constituencies won at that
+    time.
 
     """
+    if as_of is None and result_storage() == 'packed':
+        return (
+            Party.query.add_columns(func.count().label('constituency_count'))
+            .join(PackedResult, PackedResult.winner_party_id == Party.id)
+            .group_by(Party.id)
+        )
+
+    voting_class = Voting if as_of is None else VersionedVoting
     q = (
-        constituency_winners().add_columns(Voting.party_id.label('party_id'))
+        constituency_winners(as_of=as_of)
+        .add_columns(voting_class.party_id.label('party_id'))
         .subquery(with_labels=True, reduce_columns=True)
     )
     return (
         Party.query.add_columns(func.count().label('constituency_count'))
-        .join(q).group_by(q.c.party_id)
+        .join(q, q.c.party_id == Party.id).group_by(q.c.party_id)
+    )
+
+def party_vote_totals():
+    """
+    A query which returns a Party, a vote count labelled 'vote_count' and a
+    constituency count labelled 'constituency_count' for each party using the
+    pre-computed :py:class:`.PartyTotal` records. Parties are ordered by
+    decreasing vote count.
+
+    """
+    return (
+        Party.query
+        .add_columns(
+            PartyTotal.vote_count.label('vote_count'),
+            PartyTotal.seat_count.label('constituency_count')
+        )
+        .join(PartyTotal, PartyTotal.party_id == Party.id)
+        .order_by(desc(PartyTotal.vote_count))
+    )
+
+def party_total_history(since=None):
+    """
+    A query which returns the :py:class:`.PartyTotalSnapshot` records ordered by
+    creation time. If since is not None, only snapshots created after since are
+    returned.
+
+    """
+    q = PartyTotalSnapshot.query
+    if since is not None:
+        q = q.filter(PartyTotalSnapshot.created_at > since)
+    return q.order_by(
+        PartyTotalSnapshot.created_at, PartyTotalSnapshot.party_id)
+
+def constituency_result(constituency_id):
+    """
+    A query which returns the current :py:class:`.Voting` records for a
+    constituency in descending order of vote count. Equal counts are returned
+    in the order they were imported and so the first record is the winner.
+
+    Like :py:func:`.constituency_winners`, this is only useful when
+    :py:func:`.result_storage` is "normalized".
+
+    """
+    return (
+        Voting.query
+        .filter(Voting.constituency_id == constituency_id)
+        .order_by(desc(Voting.count), Voting.id)
+    )
+
+def constituency_result_key(constituency_id):
+    """
+    Return a (result version id, party generation id) pair which changes
+    whenever the current result for a constituency or any party changes. The
+    result version id is that of the constituency's latest
+    :py:class:`.ResultVersion` or 0 if it has none. The party generation id is
+    the greatest :py:attr:`.Party.generation_id` or 0 if no party has one.
+    Both are fetched in a single query.
+
+    """
+    version_id = (
+        db.session.query(func.max(ResultVersion.id))
+        .filter(ResultVersion.constituency_id == constituency_id)
+        .scalar_subquery()
+    )
+    party_generation_id = (
+        db.session.query(func.max(Party.generation_id)).scalar_subquery())
+    version_id, party_generation_id = (
+        db.session.query(version_id, party_generation_id).one())
+    return (version_id or 0, party_generation_id or 0)
+
+def log_entries(before=None):
+    """
+    A query which returns :py:class:`.LogEntry` records, most recent first.
+    Entries created at the same time are ordered by descending id. If before is
+    not None, it is a (created_at, id) pair and only entries which come after
+    it in this order are returned. This allows the log to be paged through
+    using the index on creation time.
+
+    """
+    q = LogEntry.query
+    if before is not None:
+        # The first condition is implied by the second but, without it, SQLite
+        # cannot use the index to skip entries created after before.
+        created_at, id = before
+        q = q.filter(
+            LogEntry.created_at <= created_at,
+            or_(
+                LogEntry.created_at < created_at,
+                and_(LogEntry.created_at == created_at, LogEntry.id < id)
+            )
+        )
+    return q.order_by(desc(LogEntry.created_at), desc(LogEntry.id))
+
+def log_page(before=None, limit=50):
+    """
+    Return a list of at most limit :py:class:`.LogEntry` records from
+    :py:func:`.log_entries` along with the (created_at, id) pair which should be
+    passed as before to fetch the next page. If there are no more entries, the
+    pair is None. A limit of less than one is treated as one so that a page is
+    only empty if there are no entries.
+
+    """
+    limit = max(1, limit)
+    entries = log_entries(before=before).limit(limit + 1).all()
+    if len(entries) <= limit:
+        return entries, None
+    entries = entries[:limit]
+    return entries, (entries[-1].created_at, entries[-1].id)
+
+def slow_queries(endpoint=None, slowest_first=False):
+    """
+    A query which returns :py:class:`.SlowQuery` records, most recent first or,
+    if slowest_first is True, longest-running first. If endpoint is not None,
+    only queries executed by that endpoint are returned.
+
+    """
+    q = SlowQuery.query
+    if endpoint is not None:
+        q = q.filter(SlowQuery.endpoint == endpoint)
+    if slowest_first:
+        return q.order_by(desc(SlowQuery.duration), desc(SlowQuery.id))
+    return q.order_by(desc(SlowQuery.created_at), desc(SlowQuery.id))
+
+def region_party_totals(region=None, nation=None):
+    """
+    A query which returns a Party, a constituency count labelled
+    'constituency_count' and a vote count labelled 'vote_count' for each party
+    using the pre-computed :py:class:`.RegionPartyTotal` records.
+
+    If region is not None, it is a :py:class:`.Region` and only totals within
+    that region are included. Similarly, if nation is not None, it is a
+    :py:class:`.Nation` and only totals within that nation are included.
+    Otherwise totals for all constituencies which have been assigned to a
+    region are returned.
+
+    """
+    q = (
+        Party.query
+        .add_columns(
+            func.sum(RegionPartyTotal.seat_count).label('constituency_count'),
+            func.sum(RegionPartyTotal.vote_count).label('vote_count')
+        )
+        .join(RegionPartyTotal, RegionPartyTotal.party_id == Party.id)
+        .group_by(Party.id)
+    )
+    if region is not None:
+        q = q.filter(RegionPartyTotal.region_id == region.id)
+    if nation is not None:
+        q = q.join(Region).filter(Region.nation_id == nation.id)
+    return q
+
+def regional_summary():
+    """
+    A query which returns the nation name, region name, Party, constituency
+    count and vote count for each party with votes in each region using the
+    pre-computed :py:class:`.RegionPartyTotal` records. The names are labelled
+    'nation_name' and 'region_name' and the counts are labelled
+    'constituency_count' and 'vote_count'. Rows are ordered by nation and
+    region and then by decreasing constituency and vote count.
+
+    """
+    return (
+        db.session.query(
+            Nation.name.label('nation_name'),
+            Region.name.label('region_name'),
+            Party,
+            RegionPartyTotal.seat_count.label('constituency_count'),
+            RegionPartyTotal.vote_count.label('vote_count'),
+        )
+        .select_from(RegionPartyTotal)
+        .join(Party, RegionPartyTotal.party_id == Party.id)
+        .join(Region, RegionPartyTotal.region_id == Region.id)
+        .join(Nation, Region.nation_id == Nation.id)
+        .filter(or_(
+            RegionPartyTotal.seat_count != 0,
+            RegionPartyTotal.vote_count != 0
+        ))
+        .order_by(
+            Nation.name, Region.name, desc(RegionPartyTotal.seat_count),
+            desc(RegionPartyTotal.vote_count)
+        )
+    )
+
+def changed_constituency_ids(since):
+    """
+    A query which returns the ids, labelled 'constituency_id', of
+    constituencies whose results have changed in a generation after the
+    generation numbered since. Suitable for use with ``in_()``. An id is
+    returned once for each result created since then and so may be repeated.
+    Removing duplicates would stop SQLite from using the index on generation.
+
+    """
+    return (
+        db.session.query(
+            ResultVersion.constituency_id.label('constituency_id'))
+        .filter(ResultVersion.generation_id > since)
+    )
+
+def affected_party_ids(since):
+    """
+    A query which returns the ids, labelled 'party_id', of parties whose
+    constituency counts or names may have changed in a generation after the
+    generation numbered since. These are the parties which received votes in
+    any result created after that generation or in the result it replaced
+    along with any parties changed after that generation. Suitable for use with
+    ``in_()``.
+
+    """
+    replaced = (
+        db.session.query(func.max(ResultVersion.id))
+        .filter(ResultVersion.constituency_id.in_(
+            changed_constituency_ids(since)))
+        .filter(or_(
+            ResultVersion.generation_id <= since,
+            ResultVersion.generation_id == None
+        ))
+        .group_by(ResultVersion.constituency_id)
+    )
+    created = (
+        db.session.query(ResultVersion.id)
+        .filter(ResultVersion.generation_id > since)
+    )
+    changed_parties = (
+        db.session.query(Party.id.label('party_id'))
+        .filter(Party.generation_id > since)
+    )
+    return (
+        db.session.query(VersionedVoting.party_id.label('party_id'))
+        .filter(or_(
+            VersionedVoting.version_id.in_(replaced),
+            VersionedVoting.version_id.in_(created)
+        ))
+        .union(changed_parties)
+    )
+
+def latest_result_versions(as_of):
+    """
+    A sub-query which gives the id of the most recent
+    :py:class:`.ResultVersion` for each constituency created at or before
+    as_of. The columns are labelled 'constituency_id' and 'version_id'.
+
+    """
+    return (
+        db.session.query(
+            ResultVersion.constituency_id.label('constituency_id'),
+            func.max(ResultVersion.id).label('version_id')
+        )
+        .filter(ResultVersion.created_at <= as_of)
+        .group_by(ResultVersion.constituency_id)
+        .subquery()
+    )
+
+def _historic_constituency_winners(as_of):
+    latest = latest_result_versions(as_of)
+    return (
+        Constituency.query
+        .add_entity(VersionedVoting)
+        .add_columns(
+            func.max(VersionedVoting.count).label('max_vote_count'),
+            func.sum(VersionedVoting.count).label('total_vote_count')
+        )
+        .join(latest, latest.c.constituency_id == Constituency.id)
+        .outerjoin(VersionedVoting,
+            VersionedVoting.version_id == latest.c.version_id)
+        .group_by(Constituency.id)
     )
@@ -0,0 +1,172 @@
+"""
+The :py:mod:`.resultset` module provides a compact representation of
+constituency results for pages and endpoints which list every constituency.
+
+Loading a :py:class:`.Constituency`, :py:class:`.Voting` and
+:py:class:`.Party` instance for each row adds them to the session's identity
+map and tracks their state even though only a few attributes are read. A
+:py:class:`.ResultSet` instead holds one :py:class:`.ConstituencyResult` per
+constituency built directly from the rows of a Core ``SELECT``. Rows use
+``__slots__`` and share a single copy of each party's code and name.
+
+"""
+from sqlalchemy import select
+
+from . import query
+from .model import db, Party, result_storage, unpack_results
+
+class ConstituencyResult:
+    """The result for a single constituency.
+
+    .. py:attribute:: id
+
+        Integer primary key of the constituency.
+
+    .. py:attribute:: name
+
+        Name of the constituency.
+
+    .. py:attribute:: canonical_name
+
+        Canonical name of the constituency or None if not known.
+
+    .. py:attribute:: slug
+
+        Slug of the constituency as for :py:attr:`.Constituency.slug`.
+
+    .. py:attribute:: party_code
+
+        Code of the winning party or None if there is no result.
+
+    .. py:attribute:: party_name
+
+        Name of the winning party or None if there is no result.
+
+    .. py:attribute:: max_vote_count
+
+        Number of votes for the winning party or None if there is no result.
+
+    .. py:attribute:: total_vote_count
+
+        Total number of votes cast or None if there is no result.
+
+    .. py:attribute:: share_percentage
+
+        Percentage of the votes cast won by the winning party or None if there
+        is no result.
+
+    .. py:attribute:: votes
+
+        List of vote count, party code pairs for the current result in the order
+        they were imported. None unless the result set was created by
+        :py:func:`.votes`.
+
+    """
+    __slots__ = [
+        'id', 'name', 'canonical_name', 'party_code', 'party_name',
+        'max_vote_count', 'total_vote_count', 'votes'
+    ]
+
+    def __init__(self, id, name, canonical_name, party_code=None,
+                 party_name=None, max_vote_count=None, total_vote_count=None,
+                 votes=None):
+        self.id = id
+        self.name = name
+        self.canonical_name = canonical_name
+        self.party_code = party_code
+        self.party_name = party_name
+        self.max_vote_count = max_vote_count
+        self.total_vote_count = total_vote_count
+        self.votes = votes
+
+    @property
+    def slug(self):
+        if self.canonical_name is None:
+            return None
+        return self.canonical_name.replace(' ', '-')
+
+    @property
+    def share_percentage(self):
+        if self.max_vote_count is None:
+            return None
+        return (100. * self.max_vote_count) / self.total_vote_count
+
+class ResultSet:
+    """A sequence of :py:class:`.ConstituencyResult` instances.
+
+    .. py:attribute:: parties
+
+        Dictionary mapping each party code to its name. Rows refer to the same
+        string objects as this dictionary.
+
+    """
+    __slots__ = ['rows', 'parties']
+
+    def __init__(self, rows, parties):
+        self.rows = rows
+        self.parties = parties
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __getitem__(self, idx):
+        return self.rows[idx]
+
+def winners(q=None, session=None):
+    """Return a :py:class:`.ResultSet` with the winner of each constituency.
+    If q is not None, it is a query returned by
+    :py:func:`.query.constituency_winner_columns`, possibly filtered or
+    ordered, whose rows are used. Otherwise every constituency's current result
+    is returned. If session is None, the global db.session is used.
+
+    """
+    session = session if session is not None else db.session
+    q = q if q is not None else query.constituency_winner_columns()
+    parties = _parties(session)
+    rows = []
+    for id, name, canonical_name, party_id, max_v, tot_v in (
+            session.execute(q.statement)):
+        party_code, party_name = parties.get(party_id, (None, None))
+        rows.append(ConstituencyResult(
+            id, name, canonical_name, party_code, party_name, max_v, tot_v))
+    return ResultSet(rows, dict(parties.values()))
+
+def votes(session=None):
+    """Return a :py:class:`.ResultSet` with the current votes of every
+    constituency in order of id. Only the id, name and votes of each row are
+    set. If session is None, the global db.session is used.
+
+    """
+    session = session if session is not None else db.session
+    parties = _parties(session)
+    rows = []
+    if result_storage() == 'packed':
+        for id, name, votes in (
+                session.execute(query.constituency_packed_votes().statement)):
+            rows.append(ConstituencyResult(id, name, None, votes=[
+                (count, parties[party_id][0])
+                for count, party_id in unpack_results(votes or b'')
+            ]))
+        return ResultSet(rows, dict(parties.values()))
+
+    row = None
+    for id, name, count, party_id in (
+            session.execute(query.constituency_votes().statement)):
+        if row is None or row.id != id:
+            row = ConstituencyResult(id, name, None, votes=[])
+            rows.append(row)
+        if count is not None:
+            row.votes.append((count, parties[party_id][0]))
+    return ResultSet(rows, dict(parties.values()))
+
+def _parties(session):
+    # Return a dictionary mapping party id to a (code, name) pair. Looking up
+    # ids from the database in this dictionary gives a single shared copy of
+    # each code and name.
+    return dict(
+        (id, (code, name))
+        for id, code, name in session.execute(
+            select(Party.id, Party.code, Party.name)))
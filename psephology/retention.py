@@ -0,0 +1,125 @@
+"""
+The :py:mod:`.retention` module implements the retention policy for
+:py:class:`.LogEntry` records.
+
+Each import adds a log entry and so, left alone, the log grows without bound.
+The same is true of the record of slow queries kept by :py:mod:`.slowlog`.
+Entries older than the retention period may be archived to a gzip-compressed
+file of JSON lines, one entry per line, and are then deleted from the database.
+Archives are appended to and so one file may hold entries archived over many
+runs.
+
+Deleting rows does not shrink an SQLite database file. Instead the freed pages
+are returned to the operating system by an incremental vacuum. This requires
+the database to use ``auto_vacuum=INCREMENTAL``, which the default
+``SQLITE_PRAGMAS`` configuration sets for new databases. Existing databases are
+converted with a one-off full vacuum via :py:func:`.incremental_vacuum`.
+
+"""
+import datetime
+import gzip
+import json
+
+from sqlalchemy import text
+
+from .model import db, LogEntry, SlowQuery
+
+#: Number of log entries archived and deleted together
+ARCHIVE_BATCH_SIZE = 1000
+
+def archive_log_entries(older_than, archive_path=None, session=None):
+    """Delete all :py:class:`.LogEntry` records created before the
+    :py:class:`datetime.datetime` older_than, oldest first. If archive_path is
+    not None, entries are appended to the gzip-compressed JSON lines file at
+    that path before they are deleted. Returns the number of entries deleted.
+
+    Entries are processed in batches of :py:data:`.ARCHIVE_BATCH_SIZE`. Each
+    batch is written to the archive as a separate gzip member and the file
+    closed before the batch is deleted and session committed. An entry is
+    therefore never deleted without having been archived. If a commit fails,
+    the batch remains in the database and is archived again by the next call
+    and so the archive may hold an entry more than once. Entries keep their id
+    in the archive so that such repeats may be discarded.
+
+    """
+    session = session if session is not None else db.session
+    count = 0
+    while True:
+        entries = (
+            session.query(LogEntry)
+            .filter(LogEntry.created_at < older_than)
+            .order_by(LogEntry.created_at, LogEntry.id)
+            .limit(ARCHIVE_BATCH_SIZE)
+        ).all()
+        if len(entries) == 0:
+            return count
+
+        if archive_path is not None:
+            with gzip.open(archive_path, 'at', encoding='utf8') as f:
+                for entry in entries:
+                    f.write(json.dumps(dict(
+                        id=entry.id,
+                        created_at=entry.created_at.isoformat() + 'Z',
+                        message=entry.message,
+                    )) + '\n')
+
+        (
+            session.query(LogEntry)
+            .filter(LogEntry.id.in_([e.id for e in entries]))
+            .delete(synchronize_session=False)
+        )
+        session.commit()
+        count += len(entries)
+
+def prune_log(retention_days, archive_path=None, session=None):
+    """Apply the retention policy: entries more than retention_days days old
+    are archived and deleted via :py:func:`.archive_log_entries`. Returns the
+    number of entries deleted.
+
+    """
+    older_than = (
+        datetime.datetime.utcnow() - datetime.timedelta(days=retention_days))
+    return archive_log_entries(
+        older_than, archive_path=archive_path, session=session)
+
+def prune_slow_queries(retention_days, session=None):
+    """Delete :py:class:`.SlowQuery` records more than retention_days days old
+    and commit. Slow queries are not archived. Returns the number of records
+    deleted.
+
+    """
+    session = session if session is not None else db.session
+    older_than = (
+        datetime.datetime.utcnow() - datetime.timedelta(days=retention_days))
+    count = (
+        session.query(SlowQuery)
+        .filter(SlowQuery.created_at < older_than)
+        .delete(synchronize_session=False)
+    )
+    session.commit()
+    return count
+
+def incremental_vacuum(pages=None, engine=None):
+    """Return up to pages free pages of an SQLite database to the operating
+    system. If pages is None, all free pages are returned. If the database does
+    not yet use incremental auto-vacuum it is converted, which requires a full
+    vacuum. Returns the number of free pages remaining. Other databases are
+    left untouched and None is returned.
+
+    """
+    engine = engine if engine is not None else db.engine
+    if engine.dialect.name != 'sqlite':
+        return None
+
+    # VACUUM cannot be run within a transaction
+    with engine.connect().execution_options(
+            isolation_level='AUTOCOMMIT') as connection:
+        if connection.execute(text('PRAGMA auto_vacuum')).scalar() != 2:
+            connection.execute(text('PRAGMA auto_vacuum=INCREMENTAL'))
+            connection.execute(text('VACUUM'))
+        # The pragma frees one page each time the statement is stepped.
+        # executescript() steps statements to completion whereas execute()
+        # only steps them once.
+        connection.connection.dbapi_connection.executescript(
+            'PRAGMA incremental_vacuum({});'.format(int(pages or 0)))
+        return connection.execute(text('PRAGMA freelist_count')).scalar()
@@ -0,0 +1,214 @@
+"""
+The :py:mod:`.search` module provides an in-process index over constituency
+names which supports fast prefix and substring searches. It is intended to
+back "type-ahead" style user interfaces.
+
+Each application has a single :py:class:`.NameIndex` which may be retrieved via
+:py:func:`.get_index`. The index is brought up to date incrementally before
+each search by fetching only those constituencies which have been added since
+the index was last refreshed. Since constituencies are never renamed, this is
+sufficient to keep the index consistent with the database even when
+constituencies are imported by another process.
+
+"""
+import bisect
+import heapq
+import threading
+import unicodedata
+
+from flask import current_app
+
+from .model import db, Constituency
+
+#: Kinds of match in order of preference.
+MATCH_EXACT, MATCH_PREFIX, MATCH_WORD_PREFIX, MATCH_SUBSTRING = range(4)
+
+_MATCH_NAMES = ['exact', 'prefix', 'word_prefix', 'substring']
+
+#: Key in app.extensions used to store the index
+_EXTENSION_KEY = 'psephology_search'
+
+def fold(s):
+    """Fold a string for searching. Case and diacritics are removed and runs of
+    whitespace are collapsed to a single space.
+
+    """
+    decomposed = unicodedata.normalize('NFKD', s)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split())
+
+def _trigrams(s):
+    return set(s[i:i+3] for i in range(len(s) - 2))
+
+class SearchResult:
+    """A single search result.
+
+    .. py:attribute:: id
+
+        Integer primary key of matching constituency.
+
+    .. py:attribute:: name
+
+        Name of matching constituency.
+
+    .. py:attribute:: match
+
+        Kind of match. One of "exact", "prefix", "word_prefix" or "substring".
+
+    """
+    __slots__ = ['id', 'name', 'match']
+
+    def __init__(self, id, name, match):
+        self.id = id
+        self.name = name
+        self.match = match
+
+class NameIndex:
+    """An in-memory index over constituency names.
+
+    Names are stored folded via :py:func:`.fold`. Prefix matches are found by
+    bisecting a sorted list of names and a sorted list of each "word suffix" of
+    each name. Substring matches for queries of three or more characters are
+    found by intersecting trigram posting sets.
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._max_id = 0
+        self._names = {}          # id -> original name
+        self._folded = {}         # id -> folded name
+        self._prefixes = []       # sorted (folded name, id)
+        self._word_prefixes = []  # sorted (folded suffix at word start, id)
+        self._trigrams = {}       # trigram -> set of ids
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, id, name):
+        """Add a single constituency to the index. Adding the same id twice has
+        no effect.
+
+        """
+        with self._lock:
+            self._add(id, name, insort=True)
+
+    def _add(self, id, name, insort):
+        # If insort is False, the caller must call _sort() afterwards.
+        if id in self._names:
+            return
+        folded = fold(name)
+        self._names[id] = name
+        self._folded[id] = folded
+        self._max_id = max(self._max_id, id)
+
+        add = bisect.insort if insort else list.append
+        add(self._prefixes, (folded, id))
+        for idx, c in enumerate(folded):
+            if idx > 0 and folded[idx-1] == ' ' and c != ' ':
+                add(self._word_prefixes, (folded[idx:], id))
+        for trigram in _trigrams(folded):
+            self._trigrams.setdefault(trigram, set()).add(id)
+
+    def _sort(self):
+        self._prefixes.sort()
+        self._word_prefixes.sort()
+
+    def refresh(self, session=None):
+        """Add any constituencies which are not yet in the index. Only
+        constituencies with an id greater than any previously seen are
+        fetched.
+
+        """
+        session = session if session is not None else db.session
+        rows = (
+            session.query(Constituency.id, Constituency.name)
+            .filter(Constituency.id > self._max_id)
+            .order_by(Constituency.id)
+        ).all()
+        if len(rows) == 0:
+            return
+        with self._lock:
+            for id, name in rows:
+                self._add(id, name, insort=False)
+            self._sort()
+
+    def search(self, q, limit=10):
+        """Search the index for q. Returns a list of at most limit
+        :py:class:`.SearchResult` instances ordered with best matches first.
+        Within a kind of match, shorter names are preferred and then names are
+        sorted alphabetically.
+
+        """
+        q = fold(q)
+        if q == '' or limit <= 0:
+            return []
+
+        with self._lock:
+            matches = {}
+
+            def _note(ids, kind):
+                for id in ids:
+                    if kind < matches.get(id, len(_MATCH_NAMES)):
+                        matches[id] = kind
+
+            # Matches are gathered best kind first. Once we have at least limit
+            # matches, lower ranked kinds of match cannot appear in the result.
+            for id in self._prefix_ids(self._prefixes, q):
+                matches[id] = (
+                    MATCH_EXACT if self._folded[id] == q else MATCH_PREFIX)
+            if len(matches) < limit:
+                _note(self._prefix_ids(self._word_prefixes, q),
+                      MATCH_WORD_PREFIX)
+            if len(matches) < limit and len(q) >= 3:
+                _note(self._substring_ids(q), MATCH_SUBSTRING)
+
+            ranked = heapq.nsmallest(
+                limit, matches.items(),
+                key=lambda item: (
+                    item[1], len(self._folded[item[0]]), self._folded[item[0]]
+                )
+            )
+
+            return [
+                SearchResult(id, self._names[id], _MATCH_NAMES[kind])
+                for id, kind in ranked
+            ]
+
+    def _prefix_ids(self, entries, q):
+        idx = bisect.bisect_left(entries, (q,))
+        while idx < len(entries) and entries[idx][0].startswith(q):
+            yield entries[idx][1]
+            idx += 1
+
+    def _substring_ids(self, q):
+        candidates = None
+        for trigram in _trigrams(q):
+            postings = self._trigrams.get(trigram, set())
+            candidates = (
+                postings if candidates is None else candidates & postings)
+            if not candidates:
+                return
+        for id in candidates:
+            if q in self._folded[id]:
+                yield id
+
+def get_index(app=None):
+    """Return the :py:class:`.NameIndex` for app. If app is None, the current
+    application is used. The index is created on first use. It is not refreshed
+    from the database; call :py:meth:`.NameIndex.refresh` to do that.
+
+    """
+    app = app if app is not None else current_app._get_current_object()
+    index = app.extensions.get(_EXTENSION_KEY)
+    if index is None:
+        index = app.extensions.setdefault(_EXTENSION_KEY, NameIndex())
+    return index
+
+def search_constituencies(q, limit=10, session=None):
+    """Convenience function which refreshes the current application's index and
+    then searches it for q. Returns a list of :py:class:`.SearchResult`.
+
+    """
+    index = get_index()
+    index.refresh(session=session)
+    return index.search(q, limit=limit)
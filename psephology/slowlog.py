@@ -0,0 +1,176 @@
+"""
+The :py:mod:`.slowlog` module records SQL statements which are slow to execute.
+
+Each statement executed by the application's database engine is timed via
+SQLAlchemy's cursor execution events. Statements which take longer than
+``SLOW_QUERY_THRESHOLD`` seconds are recorded as a :py:class:`.SlowQuery` along
+with their parameters and the endpoint of the request which executed them. If
+``SLOW_QUERY_EXPLAIN`` is True and the database is SQLite, the output of
+``EXPLAIN QUERY PLAN`` for slow ``SELECT`` statements is recorded too.
+
+The most recent slow queries in each process are kept in a ring of at most
+``SLOW_QUERY_RING_SIZE`` records which may be retrieved via
+:py:meth:`.SlowQueryRecorder.recent`. Records are also written to the
+``slow_queries`` table, and so are visible from every process, when each
+application context ends, which is usually at the end of each request. They are
+written in their own transaction so that they are kept even if the request's
+transaction was rolled back.
+
+"""
+import collections
+import datetime
+import logging
+import threading
+import time
+from sqlite3 import Connection as SQLite3Connection
+
+from flask import current_app, has_request_context, request
+from sqlalchemy import event as sqlalchemy_event
+
+from .model import db, SlowQuery
+
+LOG = logging.getLogger(__name__)
+
+#: Key in app.extensions used to store the recorder
+_EXTENSION_KEY = 'psephology_slow_query_recorder'
+
+#: Maximum length of the recorded representation of a statement's parameters
+MAX_PARAMETERS_LENGTH = 1000
+
+class SlowQueryRecorder:
+    """Records statements executed by an engine which take longer than a
+    threshold.
+
+    :param threshold: minimum duration in seconds of statements to record
+    :param explain: if True, record the query plan of slow SQLite ``SELECT``
+        statements
+    :param ring_size: number of recent slow queries kept in memory
+
+    """
+    def __init__(self, threshold, explain=False, ring_size=100):
+        self.threshold = threshold
+        self.explain = explain
+        self._ring = collections.deque(maxlen=ring_size)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._local = threading.local()
+
+    def recent(self):
+        """Return a list of the most recent slow queries recorded by this
+        process as dictionaries, newest first. The dictionaries have keys
+        matching the attributes of :py:class:`.SlowQuery`.
+
+        """
+        return list(reversed(self._ring))
+
+    def listen(self, engine):
+        """Start recording statements executed by engine."""
+        sqlalchemy_event.listen(
+            engine, 'before_cursor_execute', self._before_cursor_execute)
+        sqlalchemy_event.listen(
+            engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def flush(self, engine):
+        """Write any slow queries which have not yet been written to the
+        ``slow_queries`` table using a new connection from engine. Failures are
+        logged and the records discarded.
+
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if len(pending) == 0:
+            return
+
+        self._local.flushing = True
+        try:
+            with engine.begin() as connection:
+                connection.execute(SlowQuery.__table__.insert(), pending)
+        except Exception:
+            LOG.exception('Failed to write %s slow queries', len(pending))
+        finally:
+            self._local.flushing = False
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters,
+                               context, executemany):
+        conn.info['_slowlog_start'] = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        duration = time.perf_counter() - conn.info['_slowlog_start']
+        if duration < self.threshold:
+            return
+        if getattr(self._local, 'flushing', False):
+            return
+
+        record = dict(
+            created_at=datetime.datetime.utcnow(),
+            duration=duration,
+            statement=statement,
+            parameters=_format_parameters(parameters),
+            endpoint=request.endpoint if has_request_context() else None,
+            plan=None,
+        )
+        if self.explain and not executemany:
+            record['plan'] = _explain(conn, statement, parameters)
+
+        self._ring.append(record)
+        with self._lock:
+            self._pending.append(record)
+
+def _format_parameters(parameters):
+    text = repr(parameters)
+    if len(text) > MAX_PARAMETERS_LENGTH:
+        text = text[:MAX_PARAMETERS_LENGTH] + '...'
+    return text
+
+def _explain(conn, statement, parameters):
+    # Return the query plan for a SELECT statement on SQLite or None. A new
+    # cursor is used so that the results of the statement are not disturbed.
+    dbapi_connection = conn.connection.dbapi_connection
+    if not isinstance(dbapi_connection, SQLite3Connection):
+        return None
+    if not statement.lstrip().upper().startswith('SELECT'):
+        return None
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return '\n'.join(row[3] for row in cursor.fetchall())
+    except Exception:
+        LOG.exception('Failed to explain slow query')
+        return None
+    finally:
+        cursor.close()
+
+def init_app(app):
+    """Start recording slow queries for app according to its configuration.
+    Nothing is recorded if ``SLOW_QUERY_THRESHOLD`` is None.
+
+    """
+    threshold = app.config.get('SLOW_QUERY_THRESHOLD')
+    if threshold is None:
+        return
+
+    recorder = SlowQueryRecorder(
+        threshold, explain=app.config.get('SLOW_QUERY_EXPLAIN', False),
+        ring_size=app.config.get('SLOW_QUERY_RING_SIZE', 100))
+    app.extensions[_EXTENSION_KEY] = recorder
+
+    with app.app_context():
+        recorder.listen(db.engine)
+
+    @app.teardown_appcontext
+    def _flush(exc):
+        # Teardown functions run in reverse order of registration and so the
+        # session has not yet been removed. Remove it now so that an open
+        # transaction cannot block the write.
+        db.session.remove()
+        recorder.flush(db.engine)
+
+def get_recorder(app=None):
+    """Return the :py:class:`.SlowQueryRecorder` for app or None if slow
+    queries are not being recorded. If app is None, the current application is
+    used.
+
+    """
+    app = app if app is not None else current_app
+    return app.extensions.get(_EXTENSION_KEY)
@@ -0,0 +1,288 @@
+"""
+The :py:mod:`.stream` module implements a publish/subscribe broker used to
+push live results to clients via `Server-Sent Events`_.
+
+When a database transaction which imported results is committed, an event is
+published containing the new results for each changed constituency, the
+updated party totals and the new generation number. Each subscriber has a
+bounded queue of pending events. A subscriber which falls so far behind that
+its queue fills is dropped; an ``EventSource`` client will then reconnect and
+can re-fetch the full results.
+
+Two brokers are provided. :py:class:`.Broker` fans out events within a single
+process. :py:class:`.FileBroker` additionally appends each event to a spool
+file which every process tails. This allows events published by one gunicorn
+worker, or by the command line, to reach subscribers in all workers. The broker
+is selected by the ``STREAM_BROKER`` configuration value.
+
+.. _Server-Sent Events: https://html.spec.whatwg.org/multipage/server-sent-events.html
+
+"""
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event as sqlalchemy_event
+from sqlalchemy.orm import Session
+
+from .model import (
+    db, Constituency, changed_constituencies, current_generation
+)
+from . import query, resultset
+
+LOG = logging.getLogger(__name__)
+
+#: Key in app.extensions used to store the broker
+_EXTENSION_KEY = 'psephology_stream'
+
+#: Key in session.info used to stash an event until commit
+_PENDING_KEY = 'psephology_pending_event'
+
+class Subscription:
+    """A single subscriber to a :py:class:`.Broker`. Events are queued in a
+    bounded queue. If the queue is full when an event is published, the
+    subscription is dropped.
+
+    .. py:attribute:: dropped
+
+        True if this subscription has been dropped by the broker.
+
+    """
+    def __init__(self, maxsize):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.dropped = False
+
+    def get(self, timeout=None):
+        """Return the next event or None if there was no event within timeout
+        seconds or if the subscription has been dropped.
+
+        """
+        if self.dropped:
+            return None
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _offer(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped = True
+        return not self.dropped
+
+class Broker:
+    """An in-process broker which fans out events to subscribers.
+
+    :param queue_size: maximum number of pending events for each subscriber
+
+    """
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def subscribe(self):
+        """Return a new :py:class:`.Subscription`."""
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Remove a subscription. Removing a dropped subscription is not an
+        error.
+
+        """
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def subscriber_count(self):
+        """Return the number of current subscribers."""
+        with self._lock:
+            return len(self._subscriptions)
+
+    def publish(self, event):
+        """Publish an event to all subscribers. Events must be JSON
+        serialisable.
+
+        """
+        self._fan_out(event)
+
+    def _fan_out(self, event):
+        with self._lock:
+            dropped = [
+                s for s in self._subscriptions if not s._offer(event)
+            ]
+            for subscription in dropped:
+                LOG.warning('Dropping slow stream subscriber')
+                self._subscriptions.discard(subscription)
+
+class FileBroker(Broker):
+    """A broker which shares events between processes via a spool file.
+    Published events are appended to the file as JSON lines. A background
+    thread in each process tails the file and fans out new events to local
+    subscribers. The thread is started when the first subscription is made.
+
+    :param path: path to spool file
+    :param queue_size: maximum number of pending events for each subscriber
+    :param poll_interval: seconds between checks of the spool file
+    :param max_bytes: the spool file is truncated before an event is appended
+        if it has grown beyond this size
+
+    """
+    def __init__(self, path, queue_size=100, poll_interval=0.25,
+                 max_bytes=1024*1024):
+        super(FileBroker, self).__init__(queue_size=queue_size)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.max_bytes = max_bytes
+        self._thread = None
+
+    def publish(self, event):
+        line = (json.dumps(event) + '\n').encode('utf8')
+        with open(self.path, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if f.tell() > self.max_bytes:
+                    f.truncate(0)
+                f.write(line)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def subscribe(self):
+        with self._lock:
+            if self._thread is None:
+                # Start from the current end of the file so that old events
+                # are not re-sent.
+                position = (
+                    os.path.getsize(self.path)
+                    if os.path.exists(self.path) else 0
+                )
+                self._thread = threading.Thread(
+                    target=self._tail, args=(position,),
+                    name='psephology-stream', daemon=True)
+                self._thread.start()
+        return super(FileBroker, self).subscribe()
+
+    def _tail(self, position):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                size = os.path.getsize(self.path)
+            except OSError:
+                continue
+            if size < position:
+                # The file was truncated
+                position = 0
+            if size == position:
+                continue
+            with open(self.path, 'rb') as f:
+                f.seek(position)
+                data = f.read()
+            # Only consume complete lines
+            end = data.rfind(b'\n') + 1
+            position += end
+            for line in data[:end].splitlines():
+                try:
+                    self._fan_out(json.loads(line.decode('utf8')))
+                except ValueError:
+                    LOG.warning('Ignoring malformed stream event')
+
+def init_app(app):
+    """Create the broker for app according to its configuration."""
+    kind = app.config.get('STREAM_BROKER', 'memory')
+    queue_size = app.config.get('STREAM_QUEUE_SIZE', 100)
+    if kind == 'memory':
+        broker = Broker(queue_size=queue_size)
+    elif kind == 'file':
+        broker = FileBroker(
+            app.config['STREAM_BROKER_PATH'], queue_size=queue_size)
+    else:
+        raise ValueError('Unknown STREAM_BROKER: {}'.format(kind))
+    app.extensions[_EXTENSION_KEY] = broker
+
+def get_broker(app=None):
+    """Return the broker for app. If app is None, the current application is
+    used.
+
+    """
+    app = app if app is not None else current_app
+    return app.extensions[_EXTENSION_KEY]
+
+def results_event(constituency_ids, session=None):
+    """Return an event describing the current results for a sequence of
+    constituency ids along with the current party totals. The format matches
+    that of the ``/api/constituencies`` and ``/api/party_totals`` endpoints. If
+    session is None, the global db.session is used.
+
+    """
+    session = session if session is not None else db.session
+    ids = list(constituency_ids)
+    q = (
+        query.constituency_winner_columns()
+        .filter(Constituency.id.in_(ids))
+        .order_by(Constituency.name)
+    )
+    return dict(
+        constituencies=[
+            dict(
+                id=r.id,
+                slug=r.slug,
+                name=r.name,
+                party=dict(
+                    name=r.party_name, id=r.party_code
+                ) if r.party_code is not None else None,
+                maximum_votes=r.max_vote_count,
+                total_votes=r.total_vote_count,
+                share_percentage=r.share_percentage,
+            )
+            for r in resultset.winners(q, session=session)
+        ],
+        party_totals=dict([
+            (party.code, dict(
+                name=party.name,
+                constituency_count=constituency_count,
+                vote_count=vote_count,
+            ))
+            for party, vote_count, constituency_count
+            in query.party_vote_totals().with_session(session)
+        ]),
+    )
+
+# Build the event while the transaction is still open so that it may be
+# queried and publish it only once the transaction has been committed. Ending a
+# SAVEPOINT also dispatches these events but does not end the transaction.
+@sqlalchemy_event.listens_for(Session, 'before_commit')
+def _prepare_event(session):
+    if session.in_nested_transaction():
+        return
+    if not has_app_context() or _EXTENSION_KEY not in current_app.extensions:
+        return
+    changed = changed_constituencies(session)
+    if len(changed) == 0:
+        return
+    session.flush()
+    event = results_event(list(changed), session=session)
+    event['generation'] = current_generation(session).id
+    session.info[_PENDING_KEY] = (get_broker(), event)
+
+@sqlalchemy_event.listens_for(Session, 'after_commit')
+def _publish_event(session):
+    if session.in_nested_transaction():
+        return
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending is not None:
+        broker, event = pending
+        broker.publish(event)
+
+@sqlalchemy_event.listens_for(Session, 'after_rollback')
+def _discard_event(session):
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_PENDING_KEY, None)
@@ -1,4 +1,16 @@
-from psephology.model import db, Constituency
+import bz2
+import datetime
+import gzip
+import json
+import lzma
+
+from psephology import query
+from psephology.cache import get_cache
+from psephology.coordinator import get_coordinator
+from psephology.model import (
+    db, add_constituency_result_line, add_constituency_alias,
+    assign_constituency_region, Constituency, LogEntry
+)
 
 from .fixtures import RESULT_LINES, add_parties
 from .util import TestCase
@@ -21,12 +33,398 @@ class PartyTotalsAPITests(TestCase):
         r = self.client.get('/api/party_totals')
         self.assertEqual(r.status_code, 200)
 
+    def test_as_of(self):
+        """Party totals can be requested as of some time."""
+        add_parties()
+        add_constituency_result_line('A, 10, C, 20, L')
+        db.session.commit()
+
+        r = self.client.get('/api/party_totals?as_of=2000-01-01T00:00:00Z')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json['party_totals'], {})
+
+        r = self.client.get('/api/party_totals?as_of=2100-01-01')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(
+            r.json['party_totals']['L']['constituency_count'], 1)
+
+    def test_bad_as_of(self):
+        """An unparseable as_of gives HTTP 400."""
+        r = self.client.get('/api/party_totals?as_of=yesterday')
+        self.assertEqual(r.status_code, 400)
+
+    def test_region(self):
+        """Party totals can be requested for a region or nation."""
+        add_parties()
+        add_constituency_result_line('A, 10, C, 20, L')
+        add_constituency_result_line('B, 10, C, 5, L')
+        for name, region in [('A', 'R1'), ('B', 'R2')]:
+            assign_constituency_region(
+                Constituency.query.filter(Constituency.name==name).one(),
+                region, 'N')
+        db.session.commit()
+
+        r = self.client.get('/api/party_totals?region=R1')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json['party_totals']['L']['constituency_count'], 1)
+        self.assertEqual(r.json['party_totals']['L']['vote_count'], 20)
+        self.assertEqual(r.json['party_totals']['C']['constituency_count'], 0)
+
+        r = self.client.get('/api/party_totals?nation=N')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json['party_totals']['C']['constituency_count'], 1)
+        self.assertEqual(r.json['party_totals']['C']['vote_count'], 20)
+
+    def test_unknown_region(self):
+        """An unknown region gives HTTP 404."""
+        r = self.client.get('/api/party_totals?region=Narnia')
+        self.assertEqual(r.status_code, 404)
+
+    def test_region_as_of(self):
+        """Regional totals are not available in the past."""
+        r = self.client.get('/api/party_totals?region=X&as_of=2017-01-01')
+        self.assertEqual(r.status_code, 400)
+
+    def test_since(self):
+        """Party totals can be requested since a generation."""
+        add_parties()
+        add_constituency_result_line('A, 10, C, 20, L')
+        add_constituency_result_line('B, 10, C, 20, L')
+        db.session.commit()
+
+        r = self.client.get('/api/party_totals')
+        generation = r.json['generation']
+        self.assertGreater(generation, 0)
+
+        r = self.client.get('/api/party_totals?since={}'.format(generation))
+        self.assertEqual(r.json['party_totals'], {})
+        self.assertEqual(r.json['generation'], generation)
+
+        # Labour lose A to the Lib Dems. Conservatives are unaffected.
+        add_constituency_result_line('A, 10, C, 20, L, 30, LD')
+        db.session.commit()
+
+        r = self.client.get('/api/party_totals?since={}'.format(generation))
+        self.assertGreater(r.json['generation'], generation)
+        totals = r.json['party_totals']
+        self.assertEqual(totals['L']['constituency_count'], 1)
+        self.assertEqual(totals['LD']['constituency_count'], 1)
+        self.assertEqual(totals['C']['constituency_count'], 0)
+
+        # Labour lose B too and so no longer appear in the full totals but are
+        # still reported as changed.
+        generation = r.json['generation']
+        add_constituency_result_line('B, 30, C, 20, L')
+        db.session.commit()
+        r = self.client.get('/api/party_totals?since={}'.format(generation))
+        totals = r.json['party_totals']
+        self.assertEqual(set(totals.keys()), {'C', 'L'})
+        self.assertEqual(totals['L']['constituency_count'], 0)
+        self.assertEqual(totals['C']['constituency_count'], 1)
+
+    def test_bad_since(self):
+        """A bad since parameter is a bad request."""
+        r = self.client.get('/api/party_totals?since=yesterday')
+        self.assertEqual(r.status_code, 400)
+        r = self.client.get('/api/party_totals?since=1&as_of=2100-01-01')
+        self.assertEqual(r.status_code, 400)
+
+class PartyVotesAPITests(TestCase):
+    def setUp(self):
+        super(PartyVotesAPITests, self).setUp()
+        add_parties()
+        db.session.commit()
+
+    def test_no_results(self):
+        """Party votes are empty with no results."""
+        r = self.client.get('/api/party_votes')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json['party_votes'], {})
+        self.assertEqual(r.json['total_votes'], 0)
+
+    def test_basic_usage(self):
+        """Party votes and shares are reported."""
+        self.client.post('/api/import', data='A, 30, C, 10, L\nB, 40, L')
+        r = self.client.get('/api/party_votes')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json['total_votes'], 80)
+        self.assertEqual(r.json['party_votes']['L']['vote_count'], 50)
+        self.assertEqual(r.json['party_votes']['L']['constituency_count'], 1)
+        self.assertAlmostEqual(
+            r.json['party_votes']['C']['share_percentage'], 37.5)
+
+    def test_history(self):
+        """Party vote history has one entry per import."""
+        self.client.post('/api/import', data='A, 30, C, 10, L')
+        self.client.post('/api/import', data='B, 40, L')
+        r = self.client.get('/api/party_votes/history')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(
+            [h['vote_counts'] for h in r.json['history']],
+            [{'C': 30, 'L': 10}, {'C': 30, 'L': 50}])
+
+        since = r.json['history'][0]['timestamp']
+        r = self.client.get('/api/party_votes/history?since=' + since)
+        self.assertEqual(len(r.json['history']), 1)
+
+    def test_bad_since(self):
+        """An unparseable since gives HTTP 400."""
+        r = self.client.get('/api/party_votes/history?since=yesterday')
+        self.assertEqual(r.status_code, 400)
+
 class ConstituenciesAPITests(TestCase):
     def test_basic_usage(self):
         """Calling the API succeeds."""
         r = self.client.get('/api/constituencies')
         self.assertEqual(r.status_code, 200)
 
+    def test_as_of(self):
+        """Constituencies can be requested as of some time."""
+        add_parties()
+        add_constituency_result_line('A, 10, C, 20, L')
+        db.session.commit()
+
+        r = self.client.get('/api/constituencies?as_of=2000-01-01T00:00:00')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json['constituencies'], [])
+
+        r = self.client.get('/api/constituencies?as_of=2100-01-01T00:00:00')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.json['constituencies']), 1)
+        self.assertEqual(r.json['constituencies'][0]['party']['id'], 'L')
+
+    def test_bad_as_of(self):
+        """An unparseable as_of gives HTTP 400."""
+        r = self.client.get('/api/constituencies?as_of=yesterday')
+        self.assertEqual(r.status_code, 400)
+
+    def test_since(self):
+        """Constituency results can be requested since a generation."""
+        add_parties()
+        add_constituency_result_line('A, 10, C, 20, L')
+        add_constituency_result_line('B, 10, C, 20, L')
+        db.session.commit()
+
+        r = self.client.get('/api/constituencies?since=0')
+        self.assertEqual(len(r.json['constituencies']), 2)
+        generation = r.json['generation']
+
+        r = self.client.get('/api/constituencies?since={}'.format(generation))
+        self.assertEqual(r.json['constituencies'], [])
+        self.assertEqual(r.json['generation'], generation)
+
+        add_constituency_result_line('B, 30, C, 20, L')
+        db.session.commit()
+
+        r = self.client.get('/api/constituencies?since={}'.format(generation))
+        self.assertEqual(
+            [c['name'] for c in r.json['constituencies']], ['B'])
+        self.assertEqual(r.json['generation'], generation + 1)
+
+    def test_bad_since(self):
+        """A bad since parameter is a bad request."""
+        r = self.client.get('/api/constituencies?since=yesterday')
+        self.assertEqual(r.status_code, 400)
+
+class ConstituencyAPITests(TestCase):
+    def setUp(self):
+        super(ConstituencyAPITests, self).setUp()
+        add_parties()
+        add_constituency_result_line('Ynys Môn, 10, C, 30, L, 10, LD, 5, G')
+        add_constituency_result_line('B, 20, C')
+        db.session.commit()
+
+    def test_detail(self):
+        """Constituency detail includes every party."""
+        r = self.client.get('/api/constituencies/ynys-mon')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json['name'], 'Ynys Môn')
+        self.assertEqual(r.json['slug'], 'ynys-mon')
+        self.assertEqual(r.json['winner']['id'], 'L')
+        self.assertEqual(r.json['total_votes'], 55)
+        self.assertEqual(r.json['margin'], 20)
+        self.assertEqual(
+            [(p['party']['id'], p['count'], p['rank'])
+             for p in r.json['results']],
+            [('L', 30, 1), ('C', 10, 2), ('LD', 10, 2), ('G', 5, 4)])
+        self.assertAlmostEqual(
+            r.json['results'][0]['share_percentage'], 100. * 30 / 55)
+
+        # Constituencies may also be found by id or alias
+        id = r.json['id']
+        r = self.client.get('/api/constituencies/{}'.format(id))
+        self.assertEqual(r.json['name'], 'Ynys Môn')
+        add_constituency_alias('Anglesey', db.session.get(Constituency, id))
+        db.session.commit()
+        r = self.client.get('/api/constituencies/anglesey')
+        self.assertEqual(r.json['name'], 'Ynys Môn')
+
+    def test_unknown(self):
+        """Unknown constituencies are not found."""
+        r = self.client.get('/api/constituencies/nowhere')
+        self.assertEqual(r.status_code, 404)
+        r = self.client.get('/api/constituencies/12345')
+        self.assertEqual(r.status_code, 404)
+
+    def test_invalidation(self):
+        """Only re-imported constituencies are re-rendered."""
+        self.client.get('/api/constituencies/ynys-mon')
+        self.client.get('/api/constituencies/b')
+        b_id = Constituency.query.filter_by(name='B').one().id
+        b_fragment = get_cache().get(
+            'constituency:{}'.format(b_id),
+            query.constituency_result_key(b_id))
+        self.assertIsNotNone(b_fragment)
+
+        add_constituency_result_line('Ynys Môn, 40, C')
+        db.session.commit()
+        r = self.client.get('/api/constituencies/ynys-mon')
+        self.assertEqual(r.json['winner']['id'], 'C')
+        self.assertEqual(r.json['margin'], 40)
+
+        # Other constituencies are still cached
+        r = self.client.get('/api/constituencies/b')
+        self.assertEqual(r.data.decode('utf8'), b_fragment.text)
+
+class ConstituencySearchAPITests(TestCase):
+    def test_basic_usage(self):
+        """Searching for constituencies works."""
+        add_parties()
+        add_constituency_result_line('Oxford East, 10, C')
+        add_constituency_result_line('East Hampshire, 10, C')
+        db.session.commit()
+
+        r = self.client.get('/api/constituencies/search?q=east')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(
+            [c['name'] for c in r.json['results']],
+            ['East Hampshire', 'Oxford East'])
+        self.assertEqual(r.json['results'][0]['match'], 'prefix')
+
+    def test_bad_limit(self):
+        """A non-integer limit gives HTTP 400."""
+        r = self.client.get('/api/constituencies/search?q=a&limit=x')
+        self.assertEqual(r.status_code, 400)
+
+class PartiesAPITests(TestCase):
+    def setUp(self):
+        super(PartiesAPITests, self).setUp()
+        add_parties()
+        db.session.commit()
+
+    def test_list(self):
+        """Parties can be listed."""
+        r = self.client.get('/api/parties')
+        self.assertEqual(r.status_code, 200)
+        self.assertIn(
+            dict(id='C', name='The C party'), r.json['parties'])
+
+    def test_upsert(self):
+        """Parties can be created and renamed in bulk."""
+        r = self.client.post('/api/parties', json=dict(parties=[
+            dict(id='C', name='Conservatives'),
+            dict(id='X', name='The X party'),
+        ]))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json['generation'], 1)
+        names = dict(
+            (p['id'], p['name'])
+            for p in self.client.get('/api/parties').json['parties'])
+        self.assertEqual(names['C'], 'Conservatives')
+        self.assertEqual(names['X'], 'The X party')
+
+        # The new party may be used immediately
+        r = self.client.post('/api/import', data='A, 10, X')
+        self.assertEqual(r.json['diagnostics'], [])
+
+    def test_upsert_swap(self):
+        """Parties may swap names."""
+        r = self.client.post('/api/parties', json=dict(parties=[
+            dict(id='C', name='The L party'),
+            dict(id='L', name='The C party'),
+        ]))
+        self.assertEqual(r.status_code, 200)
+        names = dict(
+            (p['id'], p['name'])
+            for p in self.client.get('/api/parties').json['parties'])
+        self.assertEqual(names['C'], 'The L party')
+        self.assertEqual(names['L'], 'The C party')
+
+    def test_upsert_errors(self):
+        """Bad upserts are bad requests."""
+        r = self.client.post('/api/parties', json=dict(parties=[
+            dict(id='X', name='The C party')]))
+        self.assertEqual(r.status_code, 400)
+        self.assertIn('already used', r.json['error'])
+        r = self.client.post('/api/parties', json=dict(parties=[dict(id='X')]))
+        self.assertEqual(r.status_code, 400)
+        r = self.client.post('/api/parties', data='not json')
+        self.assertEqual(r.status_code, 400)
+
+    def test_rename_invalidates_summaries(self):
+        """Renaming a party is seen by cached pages and deltas."""
+        add_constituency_result_line('A, 10, C')
+        db.session.commit()
+        self.assertIn(b'The C party', self.client.get('/summary').data)
+        generation = self.client.get('/api/party_totals').json['generation']
+
+        self.client.post('/api/parties', json=dict(parties=[
+            dict(id='C', name='Conservatives')]))
+        self.assertIn(b'Conservatives', self.client.get('/summary').data)
+        r = self.client.get('/api/party_totals?since={}'.format(generation))
+        self.assertEqual(
+            r.json['party_totals'],
+            dict(C=dict(name='Conservatives', constituency_count=1)))
+
+    def test_delete(self):
+        """Parties can be deleted in bulk."""
+        r = self.client.delete('/api/parties?id=L&id=LD')
+        self.assertEqual(r.status_code, 200)
+        ids = [p['id'] for p in self.client.get('/api/parties').json['parties']]
+        self.assertNotIn('L', ids)
+        self.assertNotIn('LD', ids)
+
+        r = self.client.delete('/api/parties?id=X')
+        self.assertEqual(r.status_code, 400)
+        r = self.client.delete('/api/parties')
+        self.assertEqual(r.status_code, 400)
+
+class LogAPITests(TestCase):
+    def test_pages(self):
+        """The log can be paged through most recent first."""
+        # Entries with the same creation time are ordered by id
+        created_at = datetime.datetime(2017, 6, 9)
+        for idx in range(5):
+            db.session.add(LogEntry(
+                created_at=created_at, message='message {}'.format(idx)))
+        db.session.commit()
+
+        messages, before = [], None
+        while True:
+            url = '/api/log?limit=2'
+            if before is not None:
+                url += '&before=' + before
+            r = self.client.get(url)
+            self.assertEqual(r.status_code, 200)
+            messages.extend(e['message'] for e in r.json['entries'])
+            before = r.json['next']
+            if before is None:
+                break
+
+        self.assertEqual(
+            messages, ['message {}'.format(idx) for idx in range(4, -1, -1)])
+
+    def test_bad_cursor(self):
+        """A bad cursor is a bad request."""
+        r = self.client.get('/api/log?before=yesterday')
+        self.assertEqual(r.status_code, 400)
+
+    def test_bad_limit(self):
+        """A limit of less than one is a bad request."""
+        for limit in ['0', '-1']:
+            r = self.client.get('/api/log?limit=' + limit)
+            self.assertEqual(r.status_code, 400)
+
 class ImportAPITests(TestCase):
     def setUp(self):
         super(ImportAPITests, self).setUp()
@@ -68,3 +466,113 @@ class ImportAPITests(TestCase):
         # Check correct number of constituencies imported
         self.assertEqual(Constituency.query.count(), 29)
 
+        # The time spent in each stage is returned
+        self.assertEqual(r['stages']['parse']['count'], 31)
+        self.assertEqual(r['stages']['insert']['count'], 27)
+        self.assertEqual(r['stages']['commit']['count'], 31)
+        self.assertGreater(r['stages']['commit']['seconds'], 0)
+
+    def test_json(self):
+        """Results may be imported as a JSON array."""
+        records = [
+            dict(constituency='A, B', results=[
+                dict(party='C', count=10), dict(party='L', count=20)]),
+            dict(constituency='C', results=[dict(party='X', count=10)]),
+            dict(constituency='D', results=[dict(party='C', count='10')]),
+        ]
+        r = self.client.post(
+            '/api/import', data=json.dumps(records),
+            content_type='application/json')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json['line_count'], 3)
+        self.assertEqual(
+            [d['line_number'] for d in r.json['diagnostics']], [2, 3])
+        self.assertEqual(
+            json.loads(r.json['diagnostics'][0]['line']), records[1])
+
+        votings = Constituency.query.filter_by(name='A, B').one().votings
+        self.assertEqual(
+            sorted((v.party.code, v.count) for v in votings),
+            [('C', 10), ('L', 20)])
+
+    def test_ndjson(self):
+        """Results may be imported as newline-delimited JSON."""
+        data = '\n'.join([
+            '{"constituency": "A", "results": [{"party": "C", "count": 10}]}',
+            '{"constituency": "B", "results": [{"party": "L"',
+            '',
+            '{"constituency": "C", "results": []}',
+        ])
+        r = self.client.post(
+            '/api/import', data=data, content_type='application/x-ndjson')
+        self.assertEqual(r.json['line_count'], 3)
+        self.assertEqual(
+            [d['line_number'] for d in r.json['diagnostics']], [2])
+        self.assertEqual(Constituency.query.count(), 2)
+
+    def test_malformed_json(self):
+        """A malformed JSON array is rejected."""
+        r = self.client.post(
+            '/api/import', data='[{"constituency": "A"}',
+            content_type='application/json')
+        self.assertEqual(r.status_code, 400)
+        self.assertIn('error', r.json)
+        self.assertEqual(Constituency.query.count(), 0)
+
+        r = self.client.post(
+            '/api/import', data=b'[{"constituency": "\x80"}]',
+            content_type='application/json')
+        self.assertEqual(r.status_code, 400)
+
+    def test_body_not_buffered(self):
+        """The body is read as it is imported rather than beforehand."""
+        coordinator = get_coordinator(self.app)
+        submitted = []
+
+        def _submit(lines, **kwargs):
+            submitted.append(lines)
+            return type(coordinator).submit(coordinator, lines, **kwargs)
+
+        coordinator.submit = _submit
+        try:
+            r = self.client.post('/api/import', data='\n'.join(RESULT_LINES))
+        finally:
+            del coordinator.submit
+        self.assertEqual(r.json['line_count'], 31)
+        self.assertNotIsInstance(submitted[0], (list, tuple))
+
+    def test_compressed(self):
+        """Compressed bodies are decompressed."""
+        data = '\n'.join(RESULT_LINES).encode('utf8')
+        r = self.client.post(
+            '/api/import', data=gzip.compress(data),
+            headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(r.json['line_count'], 31)
+        self.assertEqual(len(r.json['diagnostics']), 4)
+
+        # The compression may be detected from the body
+        for compress in [bz2.compress, lzma.compress]:
+            r = self.client.post('/api/import', data=compress(data))
+            self.assertEqual(r.json['line_count'], 31)
+
+        r = self.client.post(
+            '/api/import',
+            data=gzip.compress(b'{"constituency": "Q", "results": []}'),
+            content_type='application/json')
+        self.assertEqual(r.json['line_count'], 1)
+        self.assertEqual(Constituency.query.count(), 30)
+
+    def test_compressed_errors(self):
+        """Bad or overly compressed bodies are rejected."""
+        r = self.client.post(
+            '/api/import', data=b'A, 10, C', headers={'Content-Encoding': 'br'})
+        self.assertEqual(r.status_code, 400)
+
+        r = self.client.post(
+            '/api/import', data=gzip.compress(b'A, 10, C')[:-4])
+        self.assertEqual(r.status_code, 400)
+
+        r = self.client.post(
+            '/api/import', data=gzip.compress(b'A, 10, C\n' * 1024 * 1024))
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual(Constituency.query.count(), 0)
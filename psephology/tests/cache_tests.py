@@ -0,0 +1,62 @@
+import gzip
+from unittest import TestCase as UnitTestCase
+
+from psephology.cache import FragmentCache
+
+class FragmentCacheTests(UnitTestCase):
+    def test_get_or_put(self):
+        """Fragments are only rendered once per generation."""
+        cache = FragmentCache()
+        calls = []
+        def render():
+            calls.append(1)
+            return 'text'
+
+        self.assertEqual(cache.get_or_put('a', 1, render).text, 'text')
+        self.assertEqual(cache.get_or_put('a', 1, render).text, 'text')
+        self.assertEqual(len(calls), 1)
+
+        cache.get_or_put('a', 2, render)
+        self.assertEqual(len(calls), 2)
+
+    def test_old_generations_discarded(self):
+        """Caching a newer generation discards older ones."""
+        cache = FragmentCache()
+        cache.put('a', 1, 'one')
+        cache.put('a', 2, 'two')
+        self.assertIsNone(cache.get('a', 1))
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, 3)
+
+        # A fragment rendered from an older generation does not replace it
+        cache.put('a', 1, 'one')
+        self.assertEqual(cache.get('a', 2).text, 'two')
+        self.assertIsNone(cache.get('a', 1))
+
+    def test_eviction(self):
+        """Least recently used fragments are evicted to bound the size."""
+        cache = FragmentCache(max_size=10)
+        cache.put('a', 1, 'aaaa')
+        cache.put('b', 1, 'bbbb')
+        cache.get('a', 1)
+        cache.put('c', 1, 'cccc')
+        self.assertIsNotNone(cache.get('a', 1))
+        self.assertIsNone(cache.get('b', 1))
+        self.assertIsNotNone(cache.get('c', 1))
+        self.assertEqual(cache.size, 8)
+
+        # Fragments larger than the cache are returned but not cached
+        self.assertEqual(cache.put('d', 1, 'd' * 20).text, 'd' * 20)
+        self.assertIsNone(cache.get('d', 1))
+
+    def test_disabled(self):
+        """A cache of size zero caches nothing."""
+        cache = FragmentCache(max_size=0)
+        cache.put('a', 1, 'aaaa')
+        self.assertEqual(len(cache), 0)
+
+    def test_compress(self):
+        """Compressed variants are kept if requested."""
+        self.assertIsNone(FragmentCache().put('a', 1, 'text').gzipped)
+        fragment = FragmentCache(compress=True).put('a', 1, 'text')
+        self.assertEqual(gzip.decompress(fragment.gzipped), b'text')
@@ -0,0 +1,172 @@
+import threading
+import time
+
+import psephology.model
+from psephology.coordinator import ImportCoordinator
+from psephology.model import (
+    db, latest_generation, Constituency, LogEntry, PartyTotal,
+    PartyTotalSnapshot
+)
+
+from .fixtures import add_parties
+from .util import TestCase
+
+class ImportCoordinatorTests(TestCase):
+    def setUp(self):
+        super(ImportCoordinatorTests, self).setUp()
+        add_parties()
+        db.session.commit()
+
+    def _submit_concurrently(self, coordinator, submissions, late=()):
+        # Submit each sequence of lines from its own thread while a group is
+        # being committed so that they queue, in order, for the next group.
+        # Each of late is submitted once that group's leader is waiting for
+        # others to arrive. Returns a list of diagnostics lists or exceptions
+        # in the same order as submissions followed by late.
+        results = [None] * (len(submissions) + len(late))
+
+        def _submit(idx, lines):
+            with self.app.app_context():
+                try:
+                    results[idx] = coordinator.submit(lines)
+                except Exception as e:
+                    results[idx] = e
+                finally:
+                    db.session.remove()
+
+        coordinator._busy = True
+        threads = []
+        for lines in submissions:
+            t = threading.Thread(target=_submit, args=(len(threads), lines))
+            t.start()
+            threads.append(t)
+            while len(coordinator._pending) < len(threads):
+                time.sleep(0.01)
+
+        with coordinator._condition:
+            coordinator._busy = False
+            coordinator._condition.notify_all()
+        while len(late) > 0 and not coordinator._busy:
+            time.sleep(0.01)
+
+        for lines in late:
+            t = threading.Thread(target=_submit, args=(len(threads), lines))
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        return results
+
+    def test_single_submission(self):
+        """A single submission is imported and committed."""
+        coordinator = ImportCoordinator(window=0)
+        diagnostics = coordinator.submit(['A, 10, C', 'B, 10, X'])
+        self.assertEqual(len(diagnostics), 1)
+        self.assertEqual(diagnostics[0].line_number, 2)
+        db.session.rollback()
+        self.assertEqual(Constituency.query.count(), 2)
+
+    def test_single_submission_not_delayed(self):
+        """A submission which does not compete with others does not wait."""
+        start = time.perf_counter()
+        ImportCoordinator(window=10).submit(['A, 10, C'])
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_late_submissions_coalesced(self):
+        """Submissions arriving while a group waits join the group."""
+        results = self._submit_concurrently(
+            ImportCoordinator(window=0.5), [['A, 10, C'], ['B, 10, L']],
+            late=[['C, 10, LD']])
+        self.assertEqual(results, [[], [], []])
+        self.assertEqual(Constituency.query.count(), 3)
+        self.assertEqual(latest_generation(), 1)
+
+    def test_concurrent_submissions_coalesced(self):
+        """Concurrent submissions are committed in one transaction."""
+        coordinator = ImportCoordinator(window=0.5)
+        results = self._submit_concurrently(coordinator, [
+            ['A, 10, C', 'B, 10, C'],
+            ['C, 10, L', 'D, 10, X'],
+            ['E, 10, LD'],
+        ])
+
+        self.assertEqual(latest_generation(), 1)
+        self.assertEqual(Constituency.query.count(), 5)
+
+        # Each caller sees only its own diagnostics
+        self.assertEqual([len(r) for r in results], [0, 1, 0])
+        self.assertEqual(results[1][0].line, 'D, 10, X')
+        self.assertEqual(results[1][0].line_number, 2)
+
+        # Each import is logged but the totals are snapshotted once
+        self.assertEqual(LogEntry.query.count(), 3)
+        self.assertEqual(
+            len(set(s.created_at for s in PartyTotalSnapshot.query)), 1)
+
+    def test_last_writer_wins(self):
+        """Later submissions replace results from earlier ones."""
+        self._submit_concurrently(
+            ImportCoordinator(window=0.5),
+            [['A, 10, C'], ['A, 20, L'], ['A, 30, LD']])
+
+        votings = Constituency.query.filter_by(name='A').one().votings
+        self.assertEqual([(v.count, v.party.code) for v in votings], [(30, 'LD')])
+        self.assertEqual(latest_generation(), 1)
+
+    def test_failure_is_isolated(self):
+        """An exception from one submission is raised only for its caller."""
+        coordinator = ImportCoordinator(window=0.5)
+        results = self._submit_concurrently(coordinator, [
+            ['A, 10, C'],
+            [42],
+        ])
+        self.assertIsInstance(results[1], Exception)
+        self.assertEqual(results[0], [])
+        self.assertEqual(Constituency.query.count(), 1)
+
+    def test_failure_rolled_back(self):
+        """A submission which fails part way through is rolled back."""
+        def _failing_lines():
+            yield 'B, 10, L'
+            yield 'C, 10, L'
+            raise ValueError('Invalid compressed data')
+
+        batch_size = psephology.model.IMPORT_BATCH_SIZE
+        psephology.model.IMPORT_BATCH_SIZE = 1
+        try:
+            results = self._submit_concurrently(
+                ImportCoordinator(window=0.5),
+                [['A, 10, C'], _failing_lines(), ['D, 10, LD']])
+        finally:
+            psephology.model.IMPORT_BATCH_SIZE = batch_size
+
+        self.assertEqual(results[0], [])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2], [])
+        self.assertEqual(
+            sorted(c.name for c in Constituency.query), ['A', 'D'])
+        self.assertEqual(
+            sorted(t.party.code for t in PartyTotal.query if t.vote_count > 0),
+            ['C', 'LD'])
+        self.assertEqual(LogEntry.query.count(), 2)
+        self.assertEqual(latest_generation(), 1)
+
+    def test_lines_consumed_lazily(self):
+        """Submitted lines are imported a batch at a time as they are read."""
+        counts = []
+
+        def _lines():
+            for name in ['A', 'B', 'C']:
+                counts.append(db.session.query(Constituency).count())
+                yield '{}, 10, C'.format(name)
+
+        batch_size = psephology.model.IMPORT_BATCH_SIZE
+        psephology.model.IMPORT_BATCH_SIZE = 1
+        try:
+            diagnostics = ImportCoordinator(window=0).submit(_lines())
+        finally:
+            psephology.model.IMPORT_BATCH_SIZE = batch_size
+
+        self.assertEqual(diagnostics, [])
+        self.assertEqual(counts, [0, 1, 2])
+        self.assertEqual(Constituency.query.count(), 3)
@@ -38,6 +38,6 @@ Workington, 17392, C, 21317, L, 1556, UKIP, 1133, LD
 def add_parties(session=None):
     """Add the parties required for RESULT_LINES."""
     session = session if session is not None else db.session
-    for id_ in 'C L LD UKIP G Ind SNP'.split():
-        session.add(Party(id=id_, name='The {} party'.format(id_)))
+    for code in 'C L LD UKIP G Ind SNP'.split():
+        session.add(Party(code=code, name='The {} party'.format(code)))
 
@@ -1,3 +1,8 @@
+import bz2
+import gzip
+import io as stdio
+import json
+import lzma
 import unittest
 from psephology import io
 
@@ -62,3 +67,163 @@ class ResultLineTest(unittest.TestCase):
         self.assertEqual(results[3], (12, 'C'))
 
 
+
+class CanonicalConstituencyNameTest(unittest.TestCase):
+    def test_case_and_whitespace(self):
+        """Case and whitespace are ignored."""
+        self.assertEqual(
+            io.canonical_constituency_name('  Oxford   EAST '),
+            io.canonical_constituency_name('oxford east'))
+
+    def test_ampersand(self):
+        """An ampersand is equivalent to "and"."""
+        self.assertEqual(
+            io.canonical_constituency_name('Barrow & Furness'),
+            io.canonical_constituency_name('Barrow and Furness'))
+
+    def test_diacritics(self):
+        """Diacritics are ignored."""
+        self.assertEqual(
+            io.canonical_constituency_name('Ynys Môn'),
+            io.canonical_constituency_name('Ynys Mon'))
+
+    def test_punctuation(self):
+        """Punctuation is ignored."""
+        self.assertEqual(
+            io.canonical_constituency_name('Birmingham, Edgbaston'),
+            'birmingham edgbaston')
+
+class JSONResultTest(unittest.TestCase):
+    def test_basic_parsing(self):
+        """Parsing a straightforward record should succeed."""
+        cn, results = io.parse_json_result(json.dumps(dict(
+            constituency='Birmingham, City of, Edgbaston',
+            results=[dict(party='C', count=10), dict(party='L', count=11)])))
+        self.assertEqual(cn, 'Birmingham, City of, Edgbaston')
+        self.assertEqual(results, [(10, 'C'), (11, 'L')])
+
+    def test_no_results(self):
+        """The results may be omitted."""
+        cn, results = io.parse_json_result('{"constituency": "Littleton"}')
+        self.assertEqual(cn, 'Littleton')
+        self.assertEqual(results, [])
+
+    def test_invalid(self):
+        """Records which do not match the schema are rejected."""
+        for text in ['', '[]', '{"results": []}', '{"constituency": 1}']:
+            with self.assertRaises(ValueError, msg=text):
+                io.parse_json_result(text)
+        for results in [
+                {}, [1], [{'count': 1}], [{'party': 'C'}],
+                [{'party': 'C', 'count': '1'}], [{'party': 'C', 'count': -1}],
+                [{'party': 'C', 'count': True}]]:
+            text = json.dumps(dict(constituency='A', results=results))
+            with self.assertRaises(ValueError, msg=text):
+                io.parse_json_result(text)
+
+class JSONRecordsTest(unittest.TestCase):
+    def _records(self, text, chunk_size=3):
+        return list(io.iter_json_records(
+            stdio.StringIO(text), chunk_size=chunk_size))
+
+    def test_array(self):
+        """Each element of an array is a record."""
+        records = [
+            dict(constituency='A, B', results=[dict(party='C', count=1234)]),
+            dict(constituency='Ynys Môn', results=[]),
+        ]
+        text = ' ' + json.dumps(records, indent=2) + '\n'
+        for chunk_size in [1, 3, 1000]:
+            self.assertEqual(
+                [json.loads(r) for r in self._records(text, chunk_size)],
+                records)
+
+    def test_single_object(self):
+        """A single object is one record."""
+        self.assertEqual(
+            self._records('{"constituency": "A"}\n'),
+            ['{"constituency": "A"}'])
+
+    def test_empty(self):
+        """An empty array has no records."""
+        self.assertEqual(self._records(' [ ] '), [])
+
+    def test_malformed(self):
+        """Malformed input is rejected."""
+        for text in ['', '"A"', '[{"a": 1} {"b": 2}]', '[{"a": 1}', '[{"a"}]',
+                     '[] []']:
+            with self.assertRaises(ValueError, msg=text):
+                self._records(text)
+
+class DecompressionTest(unittest.TestCase):
+    DATA = b'Littleton, 10, C, 11, L\nYnys M\xc3\xb4n, 12, LD\n'
+
+    def _read(self, data, **kwargs):
+        return io.open_decompressed(stdio.BytesIO(data), **kwargs).read()
+
+    def test_magic(self):
+        """Compressed data is detected by its first bytes."""
+        for compress in [gzip.compress, bz2.compress, lzma.compress]:
+            self.assertEqual(self._read(compress(self.DATA)), self.DATA)
+
+    def test_uncompressed(self):
+        """Uncompressed data is read unchanged."""
+        self.assertEqual(self._read(self.DATA), self.DATA)
+        self.assertEqual(self._read(b''), b'')
+        self.assertEqual(self._read(b'\x1f'), b'\x1f')
+
+    def test_content_encoding(self):
+        """The Content-Encoding takes precedence."""
+        self.assertEqual(
+            self._read(gzip.compress(self.DATA), content_encoding='gzip'),
+            self.DATA)
+        self.assertEqual(
+            self._read(self.DATA, content_encoding='identity'), self.DATA)
+        with self.assertRaises(ValueError):
+            self._read(self.DATA, content_encoding='br')
+        with self.assertRaises(ValueError):
+            self._read(self.DATA, content_encoding='xz')
+
+    def test_filename(self):
+        """Compression is detected from the filename."""
+        self.assertEqual(
+            self._read(bz2.compress(self.DATA), filename='results.txt.bz2'),
+            self.DATA)
+        self.assertEqual(io.guess_results_format('results.json.gz'), 'json')
+        self.assertEqual(io.guess_results_format('results.jsonl'), 'ndjson')
+        self.assertEqual(io.guess_results_format('results.txt.xz'), 'text')
+
+    def test_corrupt(self):
+        """Corrupt or truncated compressed data is rejected."""
+        data = gzip.compress(self.DATA)
+        with self.assertRaises(ValueError):
+            self._read(data[:-8] + b'\0' * 8)
+        with self.assertRaises(ValueError):
+            self._read(lzma.compress(self.DATA)[:20])
+
+    def test_ratio_limit(self):
+        """Data which decompresses too far is rejected."""
+        data = b'A, 1, C\n' * (256 * 1024)
+        for compress in [gzip.compress, bz2.compress, lzma.compress]:
+            with self.assertRaises(ValueError):
+                self._read(compress(data), max_ratio=100)
+            self.assertEqual(len(self._read(compress(data))), len(data))
+
+        # Small files may exceed the ratio
+        data = b'A, 1, C\n' * 1000
+        self.assertEqual(self._read(gzip.compress(data), max_ratio=2), data)
+
+class ResultRecordsTest(unittest.TestCase):
+    def test_text(self):
+        """Blank lines at the start and end of text are skipped."""
+        records, parser = io.result_records(
+            stdio.StringIO('\n\nA, 1, C\r\n\nB, 2, L\n\n'))
+        self.assertEqual(list(records), ['A, 1, C', '', 'B, 2, L'])
+        self.assertIs(parser, io.parse_result_line)
+
+    def test_ndjson(self):
+        """Blank lines in NDJSON are skipped."""
+        records, parser = io.result_records(
+            stdio.StringIO('{"constituency": "A"}\n\n{}\n'), 'ndjson')
+        self.assertEqual(list(records), ['{"constituency": "A"}', '{}'])
+        self.assertIs(parser, io.parse_json_result)
@@ -0,0 +1,79 @@
+import unittest
+
+from psephology.metrics import Histogram, Metrics, get_metrics
+from psephology.model import db
+
+from .fixtures import add_parties
+from .util import TestCase
+
+class HistogramTests(unittest.TestCase):
+    def test_buckets(self):
+        """Buckets are cumulative and include their upper bound."""
+        h = Histogram('h', 'A histogram.', ('a',), buckets=(1, 2))
+        for v in [0.5, 1, 1.5, 3]:
+            h.observe(v, ('x',))
+        self.assertEqual(list(h.samples()), [
+            ('_bucket', dict(a='x', le='1'), 2),
+            ('_bucket', dict(a='x', le='2'), 3),
+            ('_bucket', dict(a='x', le='+Inf'), 4),
+            ('_sum', dict(a='x'), 6.0),
+            ('_count', dict(a='x'), 4),
+        ])
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        super(MetricsTests, self).setUp()
+        add_parties()
+        db.session.commit()
+
+    def test_requests(self):
+        """Requests and their SQL statements are recorded."""
+        metrics = get_metrics()
+        self.client.get('/api/party_totals')
+        self.client.get('/api/party_totals')
+        self.client.get('/api/nonexistent')
+
+        self.assertEqual(
+            metrics.requests.value(('api.party_totals', 'GET', '200')), 2)
+        self.assertEqual(metrics.requests.value(('none', 'GET', '404')), 1)
+        self.assertEqual(
+            metrics.request_duration.count(('api.party_totals',)), 2)
+        statements = dict(
+            (s[1]['le'], s[2])
+            for s in metrics.request_statements.samples()
+            if s[0] == '_bucket' and s[1]['endpoint'] == 'api.party_totals'
+        )
+        # Each request executes at least one statement
+        self.assertEqual(statements['0'], 0)
+        self.assertEqual(statements['+Inf'], 2)
+
+    def test_imports(self):
+        """Imported lines are counted."""
+        metrics = get_metrics()
+        self.client.post('/api/import', data='A, 10, C\nB, 10, X')
+        self.assertEqual(metrics.import_lines.value(), 2)
+        self.assertEqual(metrics.import_diagnostics.value(), 1)
+        self.assertEqual(metrics.import_duration.count(), 1)
+
+    def test_endpoint(self):
+        """Metrics are exposed in the Prometheus text format."""
+        self.client.get('/api/party_totals')
+        r = self.client.get('/metrics')
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.content_type.startswith('text/plain; version=0.0.4'))
+        text = r.data.decode('utf8')
+        self.assertIn('# TYPE psephology_request_duration_seconds histogram',
+                      text)
+        self.assertIn(
+            'psephology_requests_total{endpoint="api.party_totals",'
+            'method="GET",status="200"} 1\n', text)
+        self.assertIn('psephology_import_lines_total 0\n', text)
+
+class CounterTests(unittest.TestCase):
+    def test_escaping(self):
+        """Label values are escaped."""
+        metrics = Metrics()
+        metrics.requests.inc(('a"b\\c', 'GET', '200'))
+        self.assertIn(
+            'psephology_requests_total{endpoint="a\\"b\\\\c",method="GET",'
+            'status="200"} 1', metrics.render())
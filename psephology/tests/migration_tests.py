@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+
+import flask_migrate
+from sqlalchemy import text
+
+from psephology.app import create_app
+from psephology.model import db
+
+from .util import TestCase
+
+#: Directory holding the migration scripts
+MIGRATIONS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', 'migrations')
+
+#: Tables whose rows must survive migrations
+RESULT_TABLES = [
+    'parties', 'constituencies', 'votings', 'result_versions',
+    'versioned_votings',
+]
+
+#: Tables holding pre-computed totals
+TOTALS_TABLES = [
+    'party_totals', 'region_party_totals', 'party_total_snapshots',
+]
+
+class MigrationTests(TestCase):
+    """Migrations preserve the data in a populated database."""
+
+    def create_app(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+        class Config:
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(
+                self.tmpdir, 'db.sqlite')
+            TESTING = True
+            SLOW_QUERY_THRESHOLD = None
+            SQLITE_PRAGMAS = {}
+
+        return create_app(config_object=Config)
+
+    def setUp(self):
+        # The schema is created by the migrations under test
+        pass
+
+    def tearDown(self):
+        super(MigrationTests, self).tearDown()
+        db.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def _upgrade(self, revision='head'):
+        flask_migrate.upgrade(directory=MIGRATIONS_DIR, revision=revision)
+
+    def _downgrade(self, revision):
+        flask_migrate.downgrade(directory=MIGRATIONS_DIR, revision=revision)
+
+    def _execute(self, *statements):
+        with db.engine.begin() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+
+    def _counts(self, tables):
+        with db.engine.connect() as connection:
+            return dict(
+                (table, connection.execute(
+                    text('SELECT COUNT(*) FROM {}'.format(table))).scalar())
+                for table in tables)
+
+    def test_results_preserved(self):
+        """Results and their history survive upgrading to the latest schema."""
+        self._upgrade('3f1c9a7b2d64')
+        self._execute(
+            "INSERT INTO constituencies (id, name) VALUES (1, 'A'), (2, 'B')",
+            "INSERT INTO votings (count, constituency_id, party_id) "
+            "VALUES (10, 1, 'C'), (20, 1, 'L'), (5, 2, 'LD')",
+            "INSERT INTO result_versions (id, created_at, constituency_id) "
+            "VALUES (1, '2017-06-08', 1), (2, '2017-06-09', 1), "
+            "(3, '2017-06-09', 2)",
+            "INSERT INTO versioned_votings (count, version_id, party_id) "
+            "VALUES (1, 1, 'C'), (10, 2, 'C'), (20, 2, 'L'), (5, 3, 'LD')",
+        )
+        expected = self._counts(RESULT_TABLES)
+
+        self._upgrade()
+        self.assertEqual(self._counts(RESULT_TABLES), expected)
+        self.assertEqual(self._counts(['party_totals'])['party_totals'], 3)
+
+        # Results refer to the same parties after keys become integers
+        with db.engine.connect() as connection:
+            votes = connection.execute(text(
+                'SELECT c.name, p.code, v.count FROM votings AS v '
+                'JOIN constituencies AS c ON c.id = v.constituency_id '
+                'JOIN parties AS p ON p.id = v.party_id ORDER BY v.id'
+            )).fetchall()
+        self.assertEqual(
+            [tuple(v) for v in votes],
+            [('A', 'C', 10), ('A', 'L', 20), ('B', 'LD', 5)])
+
+    def test_history_preserved(self):
+        """Existing result history is kept and given a generation."""
+        self._upgrade('7a5664938c8d')
+        self._execute(
+            "INSERT INTO constituencies (id, name, canonical_name) "
+            "VALUES (1, 'A', 'a')",
+            "INSERT INTO result_versions (id, created_at, constituency_id) "
+            "VALUES (1, '2017-06-08', 1), (2, '2017-06-09', 1)",
+            "INSERT INTO versioned_votings (count, version_id, party_id) "
+            "VALUES (1, 1, 'C'), (10, 2, 'C'), (20, 2, 'L')",
+        )
+        expected = self._counts(RESULT_TABLES)
+
+        self._upgrade('d2b6e81f4a07')
+        self.assertEqual(self._counts(RESULT_TABLES), expected)
+        with db.engine.connect() as connection:
+            generation_ids = connection.execute(text(
+                'SELECT generation_id FROM result_versions')).fetchall()
+        self.assertEqual([g[0] for g in generation_ids], [1, 1])
+
+        self._downgrade('7a5664938c8d')
+        self.assertEqual(self._counts(RESULT_TABLES), expected)
+
+    def test_round_trip(self):
+        """Results and totals survive upgrading and downgrading again."""
+        self._upgrade('7a5664938c8d')
+        self._execute(
+            "INSERT INTO nations (id, name) VALUES (1, 'N')",
+            "INSERT INTO regions (id, name, nation_id) VALUES (1, 'R', 1)",
+            "INSERT INTO constituencies (id, name, canonical_name, region_id) "
+            "VALUES (1, 'A', 'a', 1), (2, 'B', 'b', NULL)",
+            "INSERT INTO votings (count, constituency_id, party_id) "
+            "VALUES (10, 1, 'C'), (20, 1, 'L'), (5, 2, 'LD')",
+            "INSERT INTO result_versions (id, created_at, constituency_id) "
+            "VALUES (1, '2017-06-08', 1), (2, '2017-06-08', 2)",
+            "INSERT INTO versioned_votings (count, version_id, party_id) "
+            "VALUES (10, 1, 'C'), (20, 1, 'L'), (5, 2, 'LD')",
+            "INSERT INTO party_totals (party_id, vote_count, seat_count) "
+            "VALUES ('C', 10, 0), ('L', 20, 1), ('LD', 5, 1)",
+            "INSERT INTO region_party_totals "
+            "(region_id, party_id, vote_count, seat_count) "
+            "VALUES (1, 'C', 10, 0), (1, 'L', 20, 1)",
+            "INSERT INTO party_total_snapshots "
+            "(created_at, party_id, vote_count, seat_count) "
+            "VALUES ('2017-06-08', 'L', 20, 1)",
+        )
+        tables = RESULT_TABLES + TOTALS_TABLES + ['regions', 'nations']
+        expected = self._counts(tables)
+
+        self._upgrade()
+        self.assertEqual(self._counts(tables), expected)
+
+        self._downgrade('7a5664938c8d')
+        self.assertEqual(self._counts(tables), expected)
+        with db.engine.connect() as connection:
+            region_ids = connection.execute(text(
+                'SELECT region_id FROM constituencies ORDER BY id')).fetchall()
+        self.assertEqual([r[0] for r in region_ids], [1, None])
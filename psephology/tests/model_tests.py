@@ -1,13 +1,22 @@
 import datetime
+import os
+import tempfile
+import tracemalloc
 
-from flask import current_app
-from sqlalchemy import event, desc
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import event, desc, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
 
 from psephology.model import (
-    db, migrate, Party, Constituency, Voting, LogEntry,
-    add_constituency_result_line, import_results, log
+    db, migrate, Party, Constituency, Voting, LogEntry, ResultVersion,
+    VersionedVoting, add_constituency_result_line, import_results, log,
+    add_constituency_alias, resolve_constituencies, Region, RegionPartyTotal,
+    assign_constituency_region, rebuild_region_party_totals, PartyTotal,
+    PartyTotalSnapshot, rebuild_party_totals, latest_generation, read_only,
+    upsert_parties, delete_parties, valid_party_codes, party_ids, ImportProfile,
+    error_message
 )
+from psephology.app import create_app
 
 from .fixtures import RESULT_LINES, add_parties
 from .util import TestCase
@@ -16,20 +25,20 @@ class PartyTests(TestCase):
     def test_creation(self):
         """Parties can be created and persisted into the database."""
         db.create_all()
-        p = Party(id='X')
+        p = Party(code='X')
         db.session.add(p)
         db.session.commit()
-        self.assertEqual(Party.query.filter(Party.id=='X').count(), 1)
+        self.assertEqual(Party.query.filter(Party.code=='X').count(), 1)
 
     def test_name_unique(self):
         """Parties should not allow duplicate names."""
-        p1 = Party(id='Fo', name='Foo')
-        p2 = Party(id='B', name='Bar')
+        p1 = Party(code='Fo', name='Foo')
+        p2 = Party(code='B', name='Bar')
         db.session.add(p1)
         db.session.add(p2)
         db.session.commit() # ok
 
-        p3 = Party(id='F', name='Foo')
+        p3 = Party(code='F', name='Foo')
         db.session.add(p3)
         with self.assertRaises(IntegrityError):
             db.session.commit()
@@ -56,6 +65,20 @@ class ConstituencyTests(TestCase):
         with self.assertRaises(IntegrityError):
             db.session.commit()
 
+    def test_canonical_name(self):
+        """Constituencies have a canonical name set automatically."""
+        c = Constituency(name='Barrow & Furness')
+        self.assertEqual(c.canonical_name, 'barrow and furness')
+
+    def test_canonical_name_unique(self):
+        """Constituencies should not allow duplicate canonical names."""
+        db.session.add(Constituency(name='Foo Bar'))
+        db.session.commit() # ok
+
+        db.session.add(Constituency(name='foo, bar'))
+        with self.assertRaises(IntegrityError):
+            db.session.commit()
+
     def test_need_name(self):
         """Constituencies need a name."""
         c = Constituency()
@@ -70,20 +93,20 @@ class VotingTests(TestCase):
         # Create some constituency and party fixtures
         db.session.add(Constituency(id=1, name='C1'))
         db.session.add(Constituency(id=2, name='C2'))
-        db.session.add(Party(id='P1', name='Party 1'))
-        db.session.add(Party(id='P2', name='Party 2'))
+        db.session.add(Party(code='P1', name='Party 1'))
+        db.session.add(Party(code='P2', name='Party 2'))
         db.session.commit()
 
     def test_creation(self):
         """Voting records can be created."""
-        v = Voting(count=10, constituency_id=1, party_id='P1')
+        v = Voting(count=10, constituency_id=1, party_id=1)
         db.session.add(v)
         db.session.commit()
         self.assertIsNot(v.id, None)
 
     def test_relations(self):
         """Voting records should have a constituency and party relation."""
-        v = Voting(count=10, constituency_id=1, party_id='P2')
+        v = Voting(count=10, constituency_id=1, party_id=2)
         db.session.add(v)
         db.session.commit()
 
@@ -92,7 +115,8 @@ class VotingTests(TestCase):
         self.assertEqual(v.party.name, 'Party 2')
 
         self.assertIn(v.id, [v2.id for v2 in Constituency.query.get(1).votings])
-        self.assertIn(v.id, [v2.id for v2 in Party.query.get('P2').votings])
+        self.assertIn(
+            v.id, [v2.id for v2 in Party.query.filter_by(code='P2').one().votings])
 
     def test_constituency_required(self):
         """Voting records require a constituency."""
@@ -122,9 +146,9 @@ class AddResultLineTests(TestCase):
         # Create some constituency and party fixtures
         db.session.add(Constituency(id=1, name='C1'))
         db.session.add(Constituency(id=2, name='C2'))
-        db.session.add(Party(id='P1', name='Party 1'))
-        db.session.add(Party(id='P2', name='Party 2'))
-        db.session.add(Party(id='P3', name='Party 3'))
+        db.session.add(Party(code='P1', name='Party 1'))
+        db.session.add(Party(code='P2', name='Party 2'))
+        db.session.add(Party(code='P3', name='Party 3'))
         db.session.commit()
 
     def test_simple_usage(self):
@@ -135,11 +159,11 @@ class AddResultLineTests(TestCase):
         q = Voting.query.filter(Voting.constituency_id==1)
         self.assertEqual(q.count(), 2)
 
-        self.assertEqual(q.filter(Voting.party_id=='P1').count(), 1)
-        self.assertEqual(q.filter(Voting.party_id=='P2').count(), 1)
+        self.assertEqual(q.filter(Voting.party.has(code='P1')).count(), 1)
+        self.assertEqual(q.filter(Voting.party.has(code='P2')).count(), 1)
 
-        self.assertEqual(q.filter(Voting.party_id=='P1').first().count, 10)
-        self.assertEqual(q.filter(Voting.party_id=='P2').first().count, 20)
+        self.assertEqual(q.filter(Voting.party.has(code='P1')).first().count, 10)
+        self.assertEqual(q.filter(Voting.party.has(code='P2')).first().count, 20)
 
     def test_no_results_adds_constituency(self):
         """A constituency with no results is still added."""
@@ -158,12 +182,46 @@ class AddResultLineTests(TestCase):
         q = Voting.query.filter(Voting.constituency_id==1)
         self.assertEqual(q.count(), 2)
 
-        self.assertEqual(q.filter(Voting.party_id=='P1').count(), 1)
-        self.assertEqual(q.filter(Voting.party_id=='P2').count(), 0)
-        self.assertEqual(q.filter(Voting.party_id=='P3').count(), 1)
+        self.assertEqual(q.filter(Voting.party.has(code='P1')).count(), 1)
+        self.assertEqual(q.filter(Voting.party.has(code='P2')).count(), 0)
+        self.assertEqual(q.filter(Voting.party.has(code='P3')).count(), 1)
+
+        self.assertEqual(q.filter(Voting.party.has(code='P1')).first().count, 11)
+        self.assertEqual(q.filter(Voting.party.has(code='P3')).first().count, 12)
+
+    def test_history_retained(self):
+        """Adding a result appends to the result history."""
+        add_constituency_result_line('C1, 10, P1, 20, P2')
+        db.session.commit()
+        add_constituency_result_line('C1, 12, P3, 11, P1')
+        db.session.commit()
+
+        versions = Constituency.query.get(1).result_versions
+        self.assertEqual(len(versions), 2)
+        self.assertEqual(
+            sorted((v.party.code, v.count) for v in versions[0].votings),
+            [('P1', 10), ('P2', 20)])
+        self.assertEqual(
+            sorted((v.party.code, v.count) for v in versions[1].votings),
+            [('P1', 11), ('P3', 12)])
 
-        self.assertEqual(q.filter(Voting.party_id=='P1').first().count, 11)
-        self.assertEqual(q.filter(Voting.party_id=='P3').first().count, 12)
+        # The votes of every version are kept but only the latest are current
+        self.assertEqual(VersionedVoting.query.count(), 4)
+        self.assertEqual(Voting.query.count(), 2)
+
+    def test_bad_result_leaves_current_result(self):
+        """A bad result does not remove the current result or add history."""
+        add_constituency_result_line('C1, 10, P1, 20, P2')
+        db.session.commit()
+        with self.assertRaises(ValueError):
+            add_constituency_result_line('C1, 10, P1, 20, NOTEXIST')
+        db.session.commit()
+
+        self.assertEqual(
+            Voting.query.filter(Voting.constituency_id==1).count(), 2)
+        self.assertEqual(
+            ResultVersion.query.filter(
+                ResultVersion.constituency_id==1).count(), 1)
 
     def test_empty_constituency_fails(self):
         """An empty constituency name is invalid"""
@@ -187,17 +245,63 @@ class AddResultLineTests(TestCase):
         q = Voting.query.filter(Voting.constituency==c)
         self.assertEqual(q.count(), 2)
 
-        self.assertEqual(q.filter(Voting.party_id=='P1').count(), 1)
-        self.assertEqual(q.filter(Voting.party_id=='P2').count(), 1)
+        self.assertEqual(q.filter(Voting.party.has(code='P1')).count(), 1)
+        self.assertEqual(q.filter(Voting.party.has(code='P2')).count(), 1)
 
-        self.assertEqual(q.filter(Voting.party_id=='P1').first().count, 10)
-        self.assertEqual(q.filter(Voting.party_id=='P2').first().count, 20)
+        self.assertEqual(q.filter(Voting.party.has(code='P1')).first().count, 10)
+        self.assertEqual(q.filter(Voting.party.has(code='P2')).first().count, 20)
 
     def test_multiple_party_fails(self):
         """Multiple results for one party are not allowed."""
         with self.assertRaises(ValueError):
             add_constituency_result_line('C1, 10, P1, 20, P1')
 
+    def test_matches_canonical_name(self):
+        """Constituencies are matched by canonical name."""
+        add_constituency_result_line('  c1 , 10, P1')
+        db.session.commit()
+        self.assertEqual(Constituency.query.count(), 2)
+        self.assertEqual(
+            Voting.query.filter(Voting.constituency_id==1).count(), 1)
+
+    def test_matches_alias(self):
+        """Constituencies are matched by alias."""
+        add_constituency_alias('First constituency', Constituency.query.get(1))
+        add_constituency_result_line('First Constituency, 10, P1')
+        db.session.commit()
+        self.assertEqual(Constituency.query.count(), 2)
+        self.assertEqual(
+            Voting.query.filter(Voting.constituency_id==1).count(), 1)
+
+class ConstituencyAliasTests(TestCase):
+    def setUp(self):
+        super(ConstituencyAliasTests, self).setUp()
+        db.session.add(Constituency(id=1, name='C1'))
+        db.session.add(Constituency(id=2, name='C2'))
+        db.session.commit()
+
+    def test_resolve(self):
+        """Names and aliases are resolved."""
+        c1, c2 = Constituency.query.get(1), Constituency.query.get(2)
+        add_constituency_alias('Con 2', c2)
+        db.session.commit()
+        self.assertEqual(
+            resolve_constituencies(['c1', 'CON 2', 'C3']),
+            {'c1': c1, 'con 2': c2})
+
+    def test_conflicting_alias(self):
+        """An alias may not refer to a different constituency."""
+        with self.assertRaises(ValueError):
+            add_constituency_alias('c1', Constituency.query.get(2))
+
+    def test_repeated_alias(self):
+        """Adding an alias twice has no effect."""
+        c2 = Constituency.query.get(2)
+        add_constituency_alias('Con 2', c2)
+        add_constituency_alias('con  2', c2)
+        db.session.commit()
+        self.assertEqual(len(c2.aliases), 1)
+
 class ImportDataTest(TestCase):
     """Test import_results functionality."""
     def setUp(self):
@@ -217,6 +321,27 @@ class ImportDataTest(TestCase):
         self.assertEqual(diagnostics[2].line_number, 12)
         self.assertEqual(diagnostics[3].line_number, 16)
 
+    def test_profile(self):
+        """Time spent in each stage of an import is recorded."""
+        profile = ImportProfile()
+        import_results(RESULT_LINES, profile=profile)
+        self.assertEqual(profile.counts['parse'], len(RESULT_LINES))
+        self.assertEqual(profile.counts['lookup'], len(RESULT_LINES))
+        self.assertEqual(profile.counts['validate'], len(RESULT_LINES))
+        # Lines with diagnostics are not imported
+        self.assertEqual(profile.counts['delete'], len(RESULT_LINES) - 4)
+        self.assertEqual(profile.counts['insert'], len(RESULT_LINES) - 4)
+        self.assertEqual(profile.counts['commit'], 0)
+        self.assertTrue(all(t >= 0 for t in profile.timings.values()))
+        self.assertEqual(
+            set(profile.as_dict()['insert']), set(['seconds', 'count']))
+
+        # The timings are logged
+        message = LogEntry.query.order_by(desc(LogEntry.id)).first().message
+        self.assertTrue(
+            message.splitlines()[1].startswith('Stage timings: parse '))
+        self.assertNotIn('commit', message)
+
     def test_idempotent(self):
         """Importing the same results twice should not change number of voting
         records."""
@@ -235,7 +360,7 @@ class ImportDataTest(TestCase):
         c = Constituency.query.filter(Constituency.name=='Braintree').first()
         self.assertIsNot(c, None)
 
-        p = Party.query.get('C')
+        p = Party.query.filter_by(code='C').one()
 
         self.assertEqual(
             Voting.query.filter(
@@ -256,6 +381,358 @@ class ImportDataTest(TestCase):
             Voting.query.filter(
                 Voting.constituency==c).count(), 1)
 
+    def test_canonical_match(self):
+        """Differently formatted names match the same constituency."""
+        diagnostics = import_results([
+            'Barrow and Furness, 1, C', 'barrow & furness, 2, L',
+            'BARROW AND  FURNESS, 3, LD'])
+        self.assertEqual(len(diagnostics), 0)
+        self.assertEqual(Constituency.query.count(), 1)
+        self.assertEqual(Voting.query.one().party.code, 'LD')
+
+    def test_one_lookup_per_batch(self):
+        """Constituencies are looked up once per batch."""
+        import_results(RESULT_LINES[:4])
+        db.session.commit()
+
+        statements = []
+        def _record(conn, cursor, statement, *args):
+            if statement.startswith('SELECT') and 'constituencies' in statement:
+                statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', _record)
+        try:
+            import_results(RESULT_LINES, valid_codes=set(['C', 'L']))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', _record)
+        self.assertEqual(len(statements), 1)
+
+    def test_suggest_matches(self):
+        """Similar constituency names are suggested rather than created."""
+        import_results(['Barrow and Furness, 1, C'])
+        diagnostics = import_results(
+            ['Barow and Furness, 2, L', 'Totally New, 2, L'],
+            suggest_matches=True)
+        self.assertEqual(len(diagnostics), 1)
+        self.assertIn('"Barrow and Furness"', diagnostics[0].message)
+        self.assertEqual(
+            sorted(c.name for c in Constituency.query),
+            ['Barrow and Furness', 'Totally New'])
+
+    def test_suggest_matches_percent(self):
+        """Suggested names containing "%" are reported verbatim."""
+        import_results(['100% Town, 1, C'])
+        diagnostics = import_results(
+            ['100% Twn, 2, L'], suggest_matches=True)
+        self.assertEqual(
+            [d.message for d in diagnostics],
+            ['Unknown constituency, did you mean "100% Town"?'])
+
+    def test_no_suggest_matches(self):
+        """Similar constituency names are created by default."""
+        import_results(['Barrow and Furness, 1, C'])
+        diagnostics = import_results(['Barow and Furness, 2, L'])
+        self.assertEqual(len(diagnostics), 0)
+        self.assertEqual(Constituency.query.count(), 2)
+
+    def test_max_diagnostics(self):
+        """Diagnostics beyond max_diagnostics are summarised."""
+        diagnostics = import_results(RESULT_LINES, max_diagnostics=2)
+        self.assertEqual(len(diagnostics), 3)
+        self.assertEqual(diagnostics[1].line_number, 8)
+        self.assertIsNone(diagnostics[2].line)
+        self.assertIsNone(diagnostics[2].line_number)
+        self.assertEqual(
+            diagnostics[2].message, '2 further diagnostic(s) omitted')
+
+    def test_percent_in_values(self):
+        """Values containing "%" are reported verbatim."""
+        diagnostics = import_results(['A, 1, C%s', 'B%d, 1, X%d'])
+        self.assertEqual(
+            [d.message for d in diagnostics],
+            ['Party code "C%s" is unknown', 'Party code "X%d" is unknown'])
+
+    def test_error_message(self):
+        """Messages are only formatted if there are values to substitute."""
+        self.assertEqual(error_message(ValueError('100%d')), '100%d')
+        self.assertEqual(error_message(ValueError('"%s"', '100%d')), '"100%d"')
+
+class ImportMemoryTests(TestCase):
+    """Memory used by import_results does not grow with the number of lines."""
+    #: Number of lines imported
+    LINE_COUNT = 100000
+
+    #: Bound in bytes on the peak memory allocated by an import
+    PEAK_BOUND = 8 * 1024 * 1024
+
+    def setUp(self):
+        super(ImportMemoryTests, self).setUp()
+        add_parties()
+        db.session.commit()
+
+    def test_peak(self):
+        """Importing many lines, some bad, has bounded peak memory."""
+        # Every seventh line refers to an unknown party
+        lines = (
+            'Constituency {}, {}, C, {}, {}'.format(
+                idx % 650, idx, idx + 1, 'X' if idx % 7 == 0 else 'L')
+            for idx in range(self.LINE_COUNT)
+        )
+        tracemalloc.start()
+        try:
+            diagnostics = import_results(
+                lines, snapshot=False, max_diagnostics=100)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        self.assertLess(peak, self.PEAK_BOUND)
+        self.assertEqual(len(diagnostics), 101)
+        self.assertEqual(
+            diagnostics[-1].message, '{} further diagnostic(s) omitted'.format(
+                len(range(0, self.LINE_COUNT, 7)) - 100))
+        self.assertEqual(Constituency.query.count(), 650)
+        self.assertEqual(Voting.query.count(), 1300)
+
+class PartyTotalTests(TestCase):
+    def setUp(self):
+        super(PartyTotalTests, self).setUp()
+        add_parties()
+        db.session.commit()
+
+    def _totals(self):
+        return dict(
+            (t.party.code, (t.seat_count, t.vote_count))
+            for t in PartyTotal.query
+            if t.seat_count != 0 or t.vote_count != 0
+        )
+
+    def test_incremental(self):
+        """Importing results maintains national totals."""
+        import_results(['A, 10, C, 20, L', 'B, 30, C, 20, L'])
+        self.assertEqual(self._totals(), {'C': (1, 40), 'L': (1, 40)})
+        import_results(['A, 10, C, 5, LD'])
+        self.assertEqual(
+            self._totals(), {'C': (2, 40), 'L': (0, 20), 'LD': (0, 5)})
+
+    def test_rebuild(self):
+        """Rebuilding totals matches the incrementally maintained ones."""
+        import_results(RESULT_LINES)
+        import_results(RESULT_LINES[::2])
+        incremental = self._totals()
+        rebuild_party_totals()
+        self.assertEqual(incremental, self._totals())
+
+    def test_snapshots(self):
+        """Each import records a snapshot of the totals."""
+        import_results(['A, 10, C, 20, L'])
+        import_results(['B, 30, C'])
+        times = sorted(set(s.created_at for s in PartyTotalSnapshot.query))
+        self.assertEqual(len(times), 2)
+        latest = dict(
+            (s.party.code, s.vote_count) for s in PartyTotalSnapshot.query
+            .filter(PartyTotalSnapshot.created_at == times[-1])
+        )
+        self.assertEqual(latest, {'C': 40, 'L': 20})
+
+class GenerationTests(TestCase):
+    def setUp(self):
+        super(GenerationTests, self).setUp()
+        add_parties()
+        db.session.commit()
+
+    def test_one_generation_per_transaction(self):
+        """All results replaced in one transaction share a generation."""
+        self.assertEqual(latest_generation(), 0)
+        import_results(['A, 10, C', 'B, 20, L'])
+        db.session.commit()
+        self.assertEqual(latest_generation(), 1)
+        self.assertEqual(
+            set(v.generation_id for v in ResultVersion.query), {1})
+
+        import_results(['A, 30, C'])
+        db.session.commit()
+        self.assertEqual(latest_generation(), 2)
+
+    def test_rollback(self):
+        """Rolled back transactions do not leave a generation behind."""
+        import_results(['A, 10, C'])
+        db.session.rollback()
+        self.assertEqual(latest_generation(), 0)
+
+class PartyManagementTests(TestCase):
+    def setUp(self):
+        super(PartyManagementTests, self).setUp()
+        add_parties()
+        db.session.commit()
+
+    def test_upsert(self):
+        """Parties are created or renamed."""
+        upsert_parties([('C', 'Conservatives'), ('X', 'The X party')])
+        db.session.commit()
+        self.assertEqual(Party.query.filter_by(code='C').one().name, 'Conservatives')
+        self.assertEqual(Party.query.filter_by(code='X').one().name, 'The X party')
+        self.assertEqual(latest_generation(), 1)
+
+    def test_upsert_errors(self):
+        """Invalid upserts make no changes."""
+        for parties in [
+                [('X', 'X'), ('X', 'Y')],
+                [('X', 'X'), ('Y', 'X')],
+                [('X', '')],
+                [('X', 'X'), ('Y', 'The C party')]]:
+            with self.assertRaises(ValueError):
+                upsert_parties(parties)
+            self.assertIsNone(Party.query.filter_by(code='X').first())
+
+    def test_upsert_moved_names(self):
+        """Names may be swapped or rotated between parties being updated."""
+        upsert_parties([('C', 'The L party'), ('L', 'The C party')])
+        db.session.commit()
+        upsert_parties([
+            ('C', 'The LD party'), ('L', 'The L party'),
+            ('LD', 'The C party'), ('X', 'The X party')])
+        db.session.commit()
+        self.assertEqual(
+            dict((p.code, p.name) for p in Party.query
+                 if p.code in ('C', 'L', 'LD', 'X')),
+            {'C': 'The LD party', 'L': 'The L party', 'LD': 'The C party',
+             'X': 'The X party'})
+        self.assertEqual(latest_generation(), 2)
+
+    def test_delete(self):
+        """Parties without results can be deleted."""
+        add_constituency_result_line('A, 10, C')
+        with self.assertRaises(ValueError):
+            delete_parties(['C'])
+        with self.assertRaises(ValueError):
+            delete_parties(['X'])
+        delete_parties(['L'])
+        db.session.commit()
+        self.assertIsNone(Party.query.filter_by(code='L').first())
+
+    def test_other_session(self):
+        """Parties are changed via the session which is passed."""
+        db.session.remove()
+        session = Session(bind=db.engine)
+        try:
+            upsert_parties([('C', 'Conservatives')], session=session)
+            delete_parties(['L'], session=session)
+            session.commit()
+        finally:
+            session.close()
+
+        db.session.remove()
+        self.assertEqual(
+            Party.query.filter_by(code='C').one().name, 'Conservatives')
+        self.assertIsNone(Party.query.filter_by(code='L').first())
+        self.assertEqual(latest_generation(), 1)
+
+    def test_valid_codes_invalidated(self):
+        """Cached party codes are refreshed after a change."""
+        self.assertNotIn('X', valid_party_codes())
+        upsert_parties([('X', 'The X party'), ('Y', 'The Y party')])
+        self.assertIn('X', valid_party_codes())
+        db.session.commit()
+        self.assertIn('X', valid_party_codes())
+        import_results(['A, 10, X'])
+        self.assertEqual(
+            Constituency.query.one().votings[0].party.code, 'X')
+
+        self.assertIn('Y', valid_party_codes())
+        delete_parties(['Y'])
+        db.session.commit()
+        self.assertNotIn('Y', valid_party_codes())
+
+    def test_uncommitted_party_not_cached(self):
+        """Parties which are rolled back are not cached."""
+        db.session.add(Party(code='Z', name='The Z party'))
+        db.session.flush()
+        self.assertIn('Z', valid_party_codes())
+        db.session.rollback()
+
+        self.assertNotIn('Z', valid_party_codes())
+        diagnostics = import_results(['B, 5, Z'])
+        self.assertEqual(
+            [d.message for d in diagnostics], ['Party code "Z" is unknown'])
+
+    def test_party_ids(self):
+        """Party codes map to integer ids."""
+        ids = party_ids()
+        self.assertEqual(set(ids), valid_party_codes())
+        for party in Party.query:
+            self.assertEqual(ids[party.code], party.id)
+            self.assertIsInstance(party.id, int)
+
+class RegionTests(TestCase):
+    def setUp(self):
+        super(RegionTests, self).setUp()
+        add_parties()
+        db.session.commit()
+
+    def _totals(self, region_name):
+        region = Region.query.filter(Region.name==region_name).one()
+        return dict(
+            (t.party.code, (t.seat_count, t.vote_count))
+            for t in region.party_totals
+            if t.seat_count != 0 or t.vote_count != 0
+        )
+
+    def _assign(self, constituency_name, region_name, nation_name='N'):
+        assign_constituency_region(
+            Constituency.query.filter(
+                Constituency.name==constituency_name).one(),
+            region_name, nation_name)
+
+    def test_import_after_assignment(self):
+        """Importing results updates totals for assigned regions."""
+        import_results(['A', 'B', 'C'])
+        self._assign('A', 'R1')
+        self._assign('B', 'R1')
+        self._assign('C', 'R2')
+        import_results(['A, 10, C, 20, L', 'B, 30, C, 20, L', 'C, 5, G'])
+        self.assertEqual(
+            self._totals('R1'), {'C': (1, 40), 'L': (1, 40)})
+        self.assertEqual(self._totals('R2'), {'G': (1, 5)})
+
+    def test_reimport(self):
+        """Re-importing a result replaces its contribution to the totals."""
+        import_results(['A, 10, C, 20, L'])
+        self._assign('A', 'R1')
+        import_results(['A, 30, C, 20, L', 'A, 30, C, 20, LD'])
+        self.assertEqual(
+            self._totals('R1'), {'C': (1, 30), 'LD': (0, 20)})
+
+    def test_reassignment(self):
+        """Moving a constituency moves its result between regions."""
+        import_results(['A, 10, C, 20, L'])
+        self._assign('A', 'R1')
+        self._assign('A', 'R2')
+        self.assertEqual(self._totals('R1'), {})
+        self.assertEqual(self._totals('R2'), {'C': (0, 10), 'L': (1, 20)})
+
+    def test_region_in_other_nation(self):
+        """A region cannot be in two nations."""
+        import_results(['A', 'B'])
+        self._assign('A', 'R1', 'N1')
+        with self.assertRaises(ValueError):
+            self._assign('B', 'R1', 'N2')
+
+    def test_rebuild(self):
+        """Rebuilding totals matches the incrementally maintained ones."""
+        import_results(RESULT_LINES)
+        for idx, c in enumerate(Constituency.query.order_by(Constituency.id)):
+            assign_constituency_region(c, 'R{}'.format(idx % 3), 'N')
+        import_results(RESULT_LINES[::2])
+
+        def _all_totals():
+            return sorted(
+                (t.region_id, t.party.code, t.seat_count, t.vote_count)
+                for t in RegionPartyTotal.query
+            )
+        incremental = _all_totals()
+        rebuild_region_party_totals()
+        self.assertEqual(incremental, _all_totals())
+
 class LogEntryTest(TestCase):
     def test_defaults(self):
         """Log entry defaults should be set."""
@@ -269,3 +746,39 @@ class LogEntryTest(TestCase):
         self.assertEqual(
             LogEntry.query.order_by(desc(LogEntry.created_at)).first().message,
             'Hello')
+
+class SQLiteTests(TestCase):
+    def test_pragmas(self):
+        """The configured pragmas are applied to new connections."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            class Config:
+                SQLALCHEMY_DATABASE_URI = (
+                    'sqlite:///' + os.path.join(tmpdir, 'db.sqlite'))
+            app = create_app(config_object=Config)
+            with app.app_context():
+                def _pragma(name):
+                    return db.session.execute(
+                        text('PRAGMA {}'.format(name))).scalar()
+                self.assertEqual(_pragma('journal_mode'), 'wal')
+                self.assertEqual(_pragma('busy_timeout'), 5000)
+                self.assertEqual(_pragma('synchronous'), 1)
+                self.assertEqual(_pragma('foreign_keys'), 1)
+                db.session.remove()
+                db.engine.dispose()
+
+    def test_read_only(self):
+        """Read only views cannot write to the database."""
+        @read_only
+        def view():
+            db.session.add(Party(code='X', name='X'))
+            db.session.flush()
+
+        with self.app.test_request_context():
+            with self.assertRaises(OperationalError):
+                view()
+            db.session.rollback()
+
+        # The connection is writable once the view has finished
+        db.session.add(Party(code='Y', name='Y'))
+        db.session.commit()
+        self.assertEqual(Party.query.count(), 1)
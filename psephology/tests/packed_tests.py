@@ -0,0 +1,142 @@
+from psephology import query, resultset
+from psephology.cache import get_cache
+from psephology.model import (
+    db, add_constituency_result_line, import_results, pack_results,
+    rebuild_current_results, result_storage, unpack_results, Constituency,
+    PackedResult, PartyTotal, Voting
+)
+
+from .fixtures import RESULT_LINES, add_parties
+from .util import TestCase, compiled_plan
+
+class PackResultsTests(TestCase):
+    def test_round_trip(self):
+        """Packed results decode to the original pairs in order."""
+        results = [(10, 3), (0, 1), (4000000000, 2)]
+        self.assertEqual(unpack_results(pack_results(results)), results)
+        self.assertEqual(len(pack_results(results)), 24)
+        self.assertEqual(unpack_results(pack_results([])), [])
+
+class PackedStorageTests(TestCase):
+    def create_app(self):
+        app = super(PackedStorageTests, self).create_app()
+        app.config['RESULT_STORAGE'] = 'packed'
+        return app
+
+    def setUp(self):
+        super(PackedStorageTests, self).setUp()
+        add_parties()
+        db.session.commit()
+
+    def _packed(self, name):
+        c = Constituency.query.filter_by(name=name).one()
+        return db.session.get(PackedResult, c.id)
+
+    def test_storage(self):
+        """Results are stored as one row per constituency."""
+        self.assertEqual(result_storage(), 'packed')
+        import_results(['A, 10, C, 20, L, 5, LD', 'B'])
+        add_constituency_result_line('C, 7, G')
+        db.session.commit()
+        self.assertEqual(Voting.query.count(), 0)
+        self.assertEqual(PackedResult.query.count(), 3)
+
+        a = self._packed('A')
+        self.assertEqual(a.winner.code, 'L')
+        self.assertEqual(
+            (a.max_vote_count, a.total_vote_count, a.margin), (20, 35, 10))
+        self.assertEqual(
+            [(count, a.constituency.name) for count, _ in
+             unpack_results(a.votes)],
+            [(10, 'A'), (20, 'A'), (5, 'A')])
+
+        b = self._packed('B')
+        self.assertEqual(b.votes, b'')
+        self.assertIsNone(b.winner_party_id)
+        self.assertIsNone(b.total_vote_count)
+
+        c = self._packed('C')
+        self.assertEqual((c.winner.code, c.margin), ('G', 7))
+
+    def test_replace(self):
+        """Importing a new result replaces the row in place."""
+        import_results(['A, 10, C, 20, L'])
+        db.session.commit()
+        import_results(['A, 30, C, 20, L', 'A, 40, C, 20, L'])
+        db.session.commit()
+        add_constituency_result_line('A, 50, C, 20, L')
+        db.session.commit()
+        self.assertEqual(PackedResult.query.count(), 1)
+        a = self._packed('A')
+        self.assertEqual((a.winner.code, a.max_vote_count), ('C', 50))
+
+        totals = dict(
+            (t.party.code, (t.vote_count, t.seat_count))
+            for t in PartyTotal.query)
+        self.assertEqual(totals['C'], (50, 1))
+        self.assertEqual(totals['L'], (20, 0))
+
+    def test_reads(self):
+        """Reads give the same results as normalized storage."""
+        import_results(RESULT_LINES)
+        db.session.commit()
+
+        def _responses():
+            get_cache().clear()
+            return [
+                self.client.get(path).data for path in [
+                    '/api/constituencies', '/api/constituencies/1',
+                    '/api/constituencies/pudsey', '/api/party_totals',
+                    '/export/results',
+                ]
+            ] + [
+                [(r.name, r.party_code, r.max_vote_count, r.total_vote_count)
+                 for r in resultset.winners()],
+                [(r.name, r.votes) for r in resultset.votes()],
+                sorted((p.code, n) for p, n in query.party_totals()),
+            ]
+
+        packed = _responses()
+        self.app.config['RESULT_STORAGE'] = 'normalized'
+        rebuild_current_results()
+        db.session.commit()
+        self.assertEqual(PackedResult.query.count(), 0)
+        self.assertGreater(Voting.query.count(), 0)
+        self.assertEqual(_responses(), packed)
+
+        self.app.config['RESULT_STORAGE'] = 'packed'
+        rebuild_current_results()
+        db.session.commit()
+        self.assertEqual(Voting.query.count(), 0)
+        self.assertEqual(_responses(), packed)
+
+    def test_listing_plan(self):
+        """Listing winners does not group votes."""
+        plan = compiled_plan(query.constituency_winner_columns())
+        self.assertFalse(any('GROUP BY' in detail for detail in plan), plan)
+        self.assertNoFullScan(plan, ['packed_results'])
+
+    def test_count_range(self):
+        """Counts which cannot be stored are diagnosed in either storage."""
+        lines = ['A, -1, C', 'B, 4294967296, L', 'C, 4294967295, L']
+        for storage in ['normalized', 'packed']:
+            self.app.config['RESULT_STORAGE'] = storage
+            diagnostics = import_results(lines)
+            db.session.commit()
+            self.assertEqual(
+                [d.line_number for d in diagnostics], [1, 2], storage)
+            self.assertEqual(
+                [(r.name, r.max_vote_count) for r in resultset.winners()
+                 if r.party_code is not None],
+                [('C', 4294967295)], storage)
+
+            response = self.client.post(
+                '/api/import', data='\n'.join(lines),
+                content_type='text/plain')
+            self.assertEqual(response.status_code, 200, storage)
+
+    def test_unknown_storage(self):
+        """An unknown storage mode is an error."""
+        self.app.config['RESULT_STORAGE'] = 'wide'
+        with self.assertRaises(ValueError):
+            result_storage()
@@ -1,5 +1,8 @@
+import datetime
+
 from psephology.model import (
-    db, add_constituency_result_line, Constituency, Party
+    db, add_constituency_result_line, Constituency, LogEntry, Party,
+    ResultVersion
 )
 from psephology import query
 
@@ -29,7 +32,7 @@ class ConstituencyWinnersTests(TestCase):
 
         c, v, max_v, tot_v = (
             query.constituency_winners().filter(Constituency.name=='A').one())
-        self.assertEqual(v.party.id, 'L')
+        self.assertEqual(v.party.code, 'L')
         self.assertEqual(max_v, 20)
         self.assertEqual(tot_v, 30)
 
@@ -41,7 +44,7 @@ class ConstituencyWinnersTests(TestCase):
 
         c, v, max_v, tot_v = (
             query.constituency_winners().filter(Constituency.name=='C').one())
-        self.assertEqual(v.party.id, 'C')
+        self.assertEqual(v.party.code, 'C')
         self.assertEqual(max_v, 200)
         self.assertEqual(tot_v, 300)
 
@@ -63,7 +66,72 @@ class PartyTotalsTests(TestCase):
         add_constituency_result_line('D, 20, C, 2, L')
         add_constituency_result_line('E')
 
-        p, tot = query.party_totals().filter(Party.id=='L').one()
+        p, tot = query.party_totals().filter(Party.code=='L').one()
         self.assertEqual(tot, 3)
-        p, tot = query.party_totals().filter(Party.id=='C').one()
+        p, tot = query.party_totals().filter(Party.code=='C').one()
         self.assertEqual(tot, 1)
+
+class AsOfTests(TestCase):
+    def setUp(self):
+        super(AsOfTests, self).setUp()
+
+        # dd the parties required to parse RESULT_LINES
+        add_parties()
+        db.session.commit()
+
+        # Import a provisional result for A and B and then move them into the
+        # past. Then import a recount for A.
+        self.provisional_at = datetime.datetime(2017, 6, 9, 1, 0, 0)
+        add_constituency_result_line('A, 10, C, 20, L')
+        add_constituency_result_line('B, 30, C, 20, L')
+        db.session.commit()
+        for v in ResultVersion.query:
+            v.created_at = self.provisional_at
+        add_constituency_result_line('A, 30, C, 20, L')
+        db.session.commit()
+
+    def test_winners_as_of(self):
+        """Winners can be reconstructed from history."""
+        before = self.provisional_at - datetime.timedelta(hours=1)
+        self.assertEqual(query.constituency_winners(as_of=before).count(), 0)
+
+        rows = dict(
+            (c.name, (v.party.code, max_v, tot_v))
+            for c, v, max_v, tot_v in query.constituency_winners(
+                as_of=self.provisional_at)
+        )
+        self.assertEqual(rows, {'A': ('L', 20, 30), 'B': ('C', 30, 50)})
+
+        rows = dict(
+            (c.name, (v.party.code, max_v, tot_v))
+            for c, v, max_v, tot_v in query.constituency_winners(
+                as_of=datetime.datetime.utcnow())
+        )
+        self.assertEqual(rows, {'A': ('C', 30, 50), 'B': ('C', 30, 50)})
+
+    def test_party_totals_as_of(self):
+        """Party totals can be reconstructed from history."""
+        totals = dict(
+            (p.code, tot) for p, tot in query.party_totals(
+                as_of=self.provisional_at)
+        )
+        self.assertEqual(totals, {'C': 1, 'L': 1})
+
+        totals = dict((p.code, tot) for p, tot in query.party_totals())
+        self.assertEqual(totals, {'C': 2})
+
+class LogPageTests(TestCase):
+    def test_small_limit(self):
+        """A limit of less than one still returns a page."""
+        created_at = datetime.datetime(2017, 6, 9)
+        for idx in range(2):
+            db.session.add(LogEntry(
+                created_at=created_at, message='message {}'.format(idx)))
+        db.session.commit()
+
+        for limit in [0, -1]:
+            entries, before = query.log_page(limit=limit)
+            self.assertEqual([e.message for e in entries], ['message 1'])
+            entries, before = query.log_page(before=before, limit=limit)
+            self.assertEqual([e.message for e in entries], ['message 0'])
+            self.assertIsNone(before)
@@ -0,0 +1,133 @@
+import datetime
+
+from psephology.model import (
+    db, delete_parties, import_results, Constituency, Party
+)
+from psephology import query
+
+from .fixtures import add_parties
+from .util import TestCase, captured_plans, compiled_plan
+
+#: Tables which grow with the number of constituencies or imports and so should
+#: never be scanned in full
+LARGE_TABLES = {
+    'constituencies', 'constituency_aliases', 'votings', 'result_versions',
+    'versioned_votings', 'log_entries', 'party_total_snapshots',
+    'slow_queries',
+}
+
+class QueryPlanTests(TestCase):
+    """Check that queries use indexes rather than scanning large tables.
+
+    Queries which return a row for every constituency must visit every
+    constituency but should look up its results via an index.
+
+    """
+    def setUp(self):
+        super(QueryPlanTests, self).setUp()
+        add_parties()
+        import_results(['A, 10, C, 20, L', 'B, 5, LD, 15, C'])
+        db.session.commit()
+
+    def test_constituency_winners(self):
+        """Winners are found via the index on constituency."""
+        plan = compiled_plan(query.constituency_winners())
+        self.assertUsesIndex(plan, 'votings', 'ix_votings_constituency_id')
+        self.assertNoFullScan(plan, LARGE_TABLES - {'constituencies'})
+
+    def test_party_totals(self):
+        """Totals are counted via the index on constituency."""
+        plan = compiled_plan(query.party_totals())
+        self.assertUsesIndex(plan, 'votings', 'ix_votings_constituency_id')
+        self.assertNoFullScan(plan, LARGE_TABLES - {'constituencies'})
+
+    def test_historic_constituency_winners(self):
+        """Historic winners are found via the index on result version."""
+        plan = compiled_plan(query.constituency_winners(
+            as_of=datetime.datetime.utcnow()))
+        self.assertUsesIndex(
+            plan, 'versioned_votings', 'ix_versioned_votings_version_id')
+        self.assertNoFullScan(plan, {'votings', 'versioned_votings'})
+
+    def test_changed_constituencies(self):
+        """Changed constituencies are found via the index on generation."""
+        plan = compiled_plan(query.constituency_winners().filter(
+            Constituency.id.in_(query.changed_constituency_ids(1))))
+        self.assertUsesIndex(
+            plan, 'result_versions', 'ix_result_versions_generation_id')
+        self.assertNoFullScan(plan, LARGE_TABLES)
+
+    def test_affected_parties(self):
+        """Affected parties are found without scanning the result history."""
+        plan = compiled_plan(Party.query.filter(
+            Party.id.in_(query.affected_party_ids(1))))
+        self.assertUsesIndex(
+            plan, 'result_versions', 'ix_result_versions_generation_id')
+        self.assertNoFullScan(plan, LARGE_TABLES)
+
+    def test_constituency_result(self):
+        """A single result is found via the index on constituency."""
+        plan = compiled_plan(query.constituency_result(1))
+        self.assertUsesIndex(plan, 'votings', 'ix_votings_constituency_id')
+        self.assertNoFullScan(plan)
+
+    def test_constituency_result_key(self):
+        """The result key is found via the index on constituency."""
+        with captured_plans() as plans:
+            query.constituency_result_key(1)
+        self.assertEqual(len(plans), 1)
+        self.assertUsesIndex(
+            plans[0][1], 'result_versions',
+            'ix_result_versions_constituency_id_created_at')
+        self.assertNoFullScan(plans[0][1], LARGE_TABLES)
+
+    def test_log_page(self):
+        """Later pages of the log start from the index on creation time."""
+        plan = compiled_plan(query.log_entries(
+            before=(datetime.datetime.utcnow(), 10)).limit(51))
+        self.assertUsesIndex(plan, 'log_entries', 'ix_log_entries_created_at')
+        self.assertNoFullScan(plan)
+
+    def test_party_total_history(self):
+        """Snapshots are found via the index on creation time."""
+        plan = compiled_plan(query.party_total_history(
+            since=datetime.datetime.utcnow()))
+        self.assertUsesIndex(
+            plan, 'party_total_snapshots',
+            'ix_party_total_snapshots_created_at')
+        self.assertNoFullScan(plan)
+
+    def test_slow_queries(self):
+        """Slow queries for an endpoint are found via the index on endpoint."""
+        plan = compiled_plan(query.slow_queries(endpoint='api.constituencies'))
+        self.assertUsesIndex(plan, 'slow_queries', 'ix_slow_queries_endpoint')
+        self.assertNoFullScan(plan)
+
+    def test_import(self):
+        """Importing results does not scan large tables."""
+        with captured_plans() as plans:
+            import_results(['A, 30, C, 20, L', 'B, 5, LD', 'D, 1, C'])
+            db.session.flush()
+
+        deletes = [
+            plan for statement, plan in plans
+            if statement.startswith('DELETE FROM votings')
+        ]
+        self.assertEqual(len(deletes), 1)
+        self.assertUsesIndex(
+            deletes[0], 'votings', 'ix_votings_constituency_id')
+        for statement, plan in plans:
+            self.assertNoFullScan(plan, LARGE_TABLES)
+
+    def test_delete_parties(self):
+        """Results for deleted parties are found via the index on party."""
+        db.session.add(Party(code='X', name='Unused'))
+        db.session.commit()
+        with captured_plans() as plans:
+            delete_parties(['X'])
+            db.session.flush()
+        self.assertTrue(any(
+            'ix_versioned_votings_party_id' in detail
+            for _, plan in plans for detail in plan))
+        for statement, plan in plans:
+            self.assertNoFullScan(plan, LARGE_TABLES)
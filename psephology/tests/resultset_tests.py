@@ -0,0 +1,90 @@
+import datetime
+
+from psephology.model import (
+    db, add_constituency_result_line, Constituency, Party
+)
+from psephology import query, resultset
+
+from .fixtures import add_parties
+from .util import TestCase
+
+class WinnersTests(TestCase):
+    def setUp(self):
+        super(WinnersTests, self).setUp()
+        add_parties()
+        add_constituency_result_line('Ynys Môn, 10, C, 20, L')
+        add_constituency_result_line('B')
+        add_constituency_result_line('C, 200, C, 100, L')
+        db.session.commit()
+
+    def test_winners(self):
+        """Winners match those from constituency_winners()."""
+        results = resultset.winners()
+        self.assertEqual(len(results), 3)
+        expected = query.constituency_winners().all()
+        for r, (c, v, max_v, tot_v) in zip(results, expected):
+            self.assertEqual(r.id, c.id)
+            self.assertEqual(r.name, c.name)
+            self.assertEqual(r.slug, c.slug)
+            self.assertEqual(
+                r.party_code, v.party.code if v is not None else None)
+            self.assertEqual(
+                r.party_name, v.party.name if v is not None else None)
+            self.assertEqual(r.max_vote_count, max_v)
+            self.assertEqual(r.total_vote_count, tot_v)
+
+        self.assertEqual(results[0].slug, 'ynys-mon')
+        self.assertAlmostEqual(results[0].share_percentage, 200. / 3)
+        self.assertIsNone(results[1].share_percentage)
+
+    def test_no_instances(self):
+        """No ORM instances are added to the session."""
+        db.session.expunge_all()
+        resultset.winners()
+        resultset.votes()
+        self.assertEqual(len(db.session.identity_map), 0)
+
+    def test_shared_party_names(self):
+        """Rows share a single copy of each party's code and name."""
+        results = resultset.winners()
+        party = Party.query.filter_by(code='C').one()
+        self.assertEqual(results.parties['C'], party.name)
+        code = [k for k in results.parties if k == 'C'][0]
+        self.assertIs(results[2].party_code, code)
+        self.assertIs(results[2].party_name, results.parties['C'])
+
+    def test_query(self):
+        """A filtered and ordered query may be given."""
+        results = resultset.winners(
+            query.constituency_winner_columns()
+            .filter(Constituency.name != 'B')
+            .order_by(Constituency.name))
+        self.assertEqual([r.name for r in results], ['C', 'Ynys Môn'])
+
+    def test_as_of(self):
+        """Historic winners may be used."""
+        as_of = datetime.datetime.utcnow()
+        add_constituency_result_line('C, 1, C, 100, L')
+        db.session.commit()
+        results = resultset.winners(
+            query.constituency_winner_columns(as_of=as_of)
+            .filter(Constituency.name == 'C'))
+        self.assertEqual(results[0].party_code, 'C')
+        self.assertEqual(results[0].total_vote_count, 300)
+
+class VotesTests(TestCase):
+    def setUp(self):
+        super(VotesTests, self).setUp()
+        add_parties()
+        db.session.commit()
+
+    def test_votes(self):
+        """Votes are listed in the order they were imported."""
+        add_constituency_result_line('A, 10, L, 20, C')
+        add_constituency_result_line('B')
+        add_constituency_result_line('C, 200, C')
+        db.session.commit()
+        results = resultset.votes()
+        self.assertEqual(
+            [(r.name, r.votes) for r in results],
+            [('A', [(10, 'L'), (20, 'C')]), ('B', []), ('C', [(200, 'C')])])
@@ -0,0 +1,92 @@
+import datetime
+import gzip
+import json
+import os
+import tempfile
+
+from sqlalchemy.orm import Session
+
+from psephology.model import db, LogEntry, SlowQuery
+from psephology.retention import (
+    archive_log_entries, incremental_vacuum, prune_log, prune_slow_queries
+)
+import psephology.retention as retention
+
+from .util import TestCase
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        super(RetentionTests, self).setUp()
+        now = datetime.datetime.utcnow()
+        for days in [100, 50, 10, 1]:
+            db.session.add(LogEntry(
+                created_at=now - datetime.timedelta(days=days),
+                message='{} days old'.format(days)))
+        db.session.commit()
+
+    def test_prune(self):
+        """Entries older than the retention period are deleted."""
+        self.assertEqual(prune_log(30), 2)
+        self.assertEqual(
+            set(e.message for e in LogEntry.query),
+            {'10 days old', '1 days old'})
+
+    def test_prune_slow_queries(self):
+        """Slow queries older than the retention period are deleted."""
+        now = datetime.datetime.utcnow()
+        for days in [100, 1]:
+            db.session.add(SlowQuery(
+                created_at=now - datetime.timedelta(days=days),
+                duration=1, statement='SELECT {}'.format(days)))
+        db.session.commit()
+        self.assertEqual(prune_slow_queries(30), 1)
+        self.assertEqual(
+            [q.statement for q in SlowQuery.query], ['SELECT 1'])
+
+    def test_archive(self):
+        """Deleted entries are appended to the archive."""
+        old_batch_size = retention.ARCHIVE_BATCH_SIZE
+        retention.ARCHIVE_BATCH_SIZE = 1
+        try:
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, 'log.jsonl.gz')
+                self.assertEqual(prune_log(60, archive_path=path), 1)
+                self.assertEqual(prune_log(5, archive_path=path), 2)
+                with gzip.open(path, 'rt') as f:
+                    archived = [json.loads(line) for line in f]
+        finally:
+            retention.ARCHIVE_BATCH_SIZE = old_batch_size
+
+        self.assertEqual(
+            [e['message'] for e in archived],
+            ['100 days old', '50 days old', '10 days old'])
+        self.assertEqual(LogEntry.query.count(), 1)
+
+    def test_other_session(self):
+        """Records are deleted via the session which is passed."""
+        created_at = datetime.datetime.utcnow() - datetime.timedelta(days=100)
+        db.session.add(SlowQuery(
+            created_at=created_at, duration=1, statement='SELECT 100'))
+        db.session.commit()
+        db.session.remove()
+
+        session = Session(bind=db.engine)
+        try:
+            self.assertEqual(prune_log(30, session=session), 2)
+            self.assertEqual(prune_slow_queries(30, session=session), 1)
+        finally:
+            session.close()
+
+        db.session.remove()
+        self.assertEqual(LogEntry.query.count(), 2)
+        self.assertEqual(SlowQuery.query.count(), 0)
+
+    def test_incremental_vacuum(self):
+        """Free pages are returned after entries are deleted."""
+        for _ in range(200):
+            db.session.add(LogEntry(message='x' * 1000))
+        db.session.commit()
+        archive_log_entries(datetime.datetime.utcnow())
+        db.session.close()
+
+        self.assertEqual(incremental_vacuum(), 0)
@@ -0,0 +1,68 @@
+import unittest
+
+from psephology.model import db, add_constituency_result_line
+from psephology import search
+
+from .fixtures import RESULT_LINES, add_parties
+from .util import TestCase
+
+class FoldTests(unittest.TestCase):
+    def test_fold(self):
+        """Folding removes case, diacritics and extra whitespace."""
+        self.assertEqual(search.fold('  Ynys   Môn '), 'ynys mon')
+
+class NameIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.index = search.NameIndex()
+        for id, name in enumerate([
+                'Oxford East', 'Oxford West and Abingdon', 'Oxford',
+                'East Hampshire', 'Hornsey and Wood Green', 'Ynys Môn']):
+            self.index.add(id + 1, name)
+
+    def _names(self, q, **kwargs):
+        return [r.name for r in self.index.search(q, **kwargs)]
+
+    def test_empty_query(self):
+        """An empty query matches nothing."""
+        self.assertEqual(self.index.search(''), [])
+
+    def test_ranking(self):
+        """Exact matches come first, then prefixes and then word prefixes."""
+        self.assertEqual(
+            self._names('oxford'),
+            ['Oxford', 'Oxford East', 'Oxford West and Abingdon'])
+        self.assertEqual(self._names('east'), ['East Hampshire', 'Oxford East'])
+
+    def test_substring(self):
+        """Substrings of three or more characters match."""
+        results = self.index.search('ingdo')
+        self.assertEqual([r.name for r in results], ['Oxford West and Abingdon'])
+        self.assertEqual(results[0].match, 'substring')
+
+    def test_diacritics(self):
+        """Diacritics are ignored when matching."""
+        self.assertEqual(self._names('MON'), ['Ynys Môn'])
+
+    def test_limit(self):
+        """Results are limited."""
+        self.assertEqual(len(self._names('o', limit=2)), 2)
+
+    def test_add_idempotent(self):
+        """Adding the same id twice does not duplicate it."""
+        self.index.add(3, 'Oxford')
+        self.assertEqual(self._names('oxford'), [
+            'Oxford', 'Oxford East', 'Oxford West and Abingdon'])
+
+class SearchConstituenciesTests(TestCase):
+    def setUp(self):
+        super(SearchConstituenciesTests, self).setUp()
+        add_parties()
+        db.session.commit()
+
+    def test_incremental_refresh(self):
+        """Newly added constituencies are found."""
+        self.assertEqual(search.search_constituencies('braintree'), [])
+        add_constituency_result_line(RESULT_LINES[1])
+        results = search.search_constituencies('braintree')
+        self.assertEqual([r.name for r in results], ['Braintree'])
+        self.assertEqual(len(search.get_index()), 1)
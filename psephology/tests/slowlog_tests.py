@@ -0,0 +1,94 @@
+import os
+import tempfile
+
+from sqlalchemy import text
+
+from psephology.app import create_app
+from psephology.model import db, SlowQuery
+from psephology.slowlog import get_recorder
+
+from .fixtures import add_parties
+from .util import TestCase
+
+class SlowQueryTests(TestCase):
+    def setUp(self):
+        super(SlowQueryTests, self).setUp()
+        add_parties()
+        db.session.commit()
+
+    def _app(self, tmpdir, **config):
+        class Config:
+            SQLALCHEMY_DATABASE_URI = (
+                'sqlite:///' + os.path.join(tmpdir, 'db.sqlite'))
+            SLOW_QUERY_THRESHOLD = 0
+        for k, v in config.items():
+            setattr(Config, k, v)
+        app = create_app(config_object=Config)
+        with app.app_context():
+            db.create_all()
+        return app
+
+    def test_disabled(self):
+        """Nothing is recorded without a threshold."""
+        self.assertIsNone(get_recorder())
+
+    def test_record(self):
+        """Slow statements are recorded with their endpoint."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            app = self._app(tmpdir, SLOW_QUERY_EXPLAIN=True)
+            r = app.test_client().get('/api/party_totals')
+            self.assertEqual(r.status_code, 200)
+
+            recent = [
+                q for q in get_recorder(app).recent()
+                if q['endpoint'] == 'api.party_totals'
+            ]
+            self.assertGreater(len(recent), 0)
+            select = [
+                q for q in recent if q['statement'].startswith('SELECT')][0]
+            self.assertIsNotNone(select['plan'])
+
+            # Records are written to the database at the end of the request
+            with app.app_context():
+                queries = SlowQuery.query.filter_by(
+                    endpoint='api.party_totals').all()
+                self.assertEqual(len(queries), len(recent))
+                db.session.remove()
+                db.engine.dispose()
+
+    def test_ring(self):
+        """Only the most recent slow queries are kept in memory."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            app = self._app(tmpdir, SLOW_QUERY_RING_SIZE=2)
+            with app.app_context():
+                for idx in range(3):
+                    db.session.execute(text('SELECT {}'.format(idx)))
+                self.assertEqual(
+                    [q['statement'] for q in get_recorder(app).recent()],
+                    ['SELECT 2', 'SELECT 1'])
+            with app.app_context():
+                self.assertGreaterEqual(SlowQuery.query.count(), 3)
+                db.session.remove()
+                db.engine.dispose()
+
+    def test_page(self):
+        """Slow queries are listed."""
+        db.session.add(SlowQuery(
+            duration=1.5, statement='SELECT slow', endpoint='ui.summary',
+            plan='SCAN votings'))
+        db.session.add(SlowQuery(
+            duration=2.5, statement='SELECT slower', endpoint='api.import_'))
+        db.session.commit()
+
+        r = self.client.get('/slow-queries')
+        self.assertEqual(r.status_code, 200)
+        self.assertIn(b'SELECT slow', r.data)
+        self.assertIn(b'SCAN votings', r.data)
+
+        r = self.client.get('/slow-queries?order=duration')
+        self.assertLess(
+            r.data.index(b'SELECT slower'), r.data.index(b'SELECT slow<'))
+
+        r = self.client.get('/slow-queries?view=api.import_')
+        self.assertNotIn(b'SELECT slow<', r.data)
+        self.assertIn(b'SELECT slower', r.data)
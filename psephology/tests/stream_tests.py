@@ -0,0 +1,163 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy.orm import Session
+
+from psephology.app import create_app
+from psephology.model import db, import_results
+from psephology import stream
+
+from .fixtures import add_parties
+from .util import TestCase
+
+class BrokerTests(unittest.TestCase):
+    def test_fan_out(self):
+        """Events are delivered to every subscriber."""
+        broker = stream.Broker()
+        s1, s2 = broker.subscribe(), broker.subscribe()
+        broker.publish({'a': 1})
+        self.assertEqual(s1.get(timeout=0), {'a': 1})
+        self.assertEqual(s2.get(timeout=0), {'a': 1})
+        self.assertIs(s1.get(timeout=0), None)
+
+    def test_unsubscribe(self):
+        """Unsubscribed subscribers receive no events."""
+        broker = stream.Broker()
+        s = broker.subscribe()
+        broker.unsubscribe(s)
+        broker.publish({'a': 1})
+        self.assertIs(s.get(timeout=0), None)
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    def test_slow_subscriber_dropped(self):
+        """A subscriber whose queue fills is dropped."""
+        broker = stream.Broker(queue_size=2)
+        slow, fast = broker.subscribe(), broker.subscribe()
+        for idx in range(3):
+            broker.publish({'idx': idx})
+            self.assertEqual(fast.get(timeout=0), {'idx': idx})
+        self.assertTrue(slow.dropped)
+        self.assertFalse(fast.dropped)
+        self.assertIs(slow.get(timeout=0), None)
+        self.assertEqual(broker.subscriber_count(), 1)
+
+class FileBrokerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'stream')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_between_brokers(self):
+        """Events published by one broker reach subscribers of another."""
+        publisher = stream.FileBroker(self.path)
+        subscriber = stream.FileBroker(self.path, poll_interval=0.01)
+        s = subscriber.subscribe()
+        publisher.publish({'a': 1})
+        self.assertEqual(s.get(timeout=5), {'a': 1})
+
+    def test_truncation(self):
+        """The spool file is truncated once it grows too large."""
+        broker = stream.FileBroker(self.path, max_bytes=10)
+        for idx in range(5):
+            broker.publish({'idx': idx})
+        self.assertLess(os.path.getsize(self.path), 30)
+
+class PublishOnCommitTests(TestCase):
+    def setUp(self):
+        super(PublishOnCommitTests, self).setUp()
+        add_parties()
+        db.session.commit()
+        self.subscription = stream.get_broker().subscribe()
+
+    def test_publish_on_commit(self):
+        """Importing results publishes an event when committed."""
+        import_results(['A, 10, C, 20, L', 'B'])
+        self.assertIs(self.subscription.get(timeout=0), None)
+        db.session.commit()
+
+        event = self.subscription.get(timeout=0)
+        self.assertEqual(
+            [c['name'] for c in event['constituencies']], ['A', 'B'])
+        self.assertEqual(event['constituencies'][0]['party']['id'], 'L')
+        self.assertEqual(
+            event['party_totals']['L']['constituency_count'], 1)
+
+        # Only changed constituencies are sent
+        import_results(['B, 5, C'])
+        db.session.commit()
+        event = self.subscription.get(timeout=0)
+        self.assertEqual(
+            [c['name'] for c in event['constituencies']], ['B'])
+
+    def test_no_publish_on_rollback(self):
+        """Rolled back imports are not published."""
+        import_results(['A, 10, C, 20, L'])
+        db.session.rollback()
+        db.session.commit()
+        self.assertIs(self.subscription.get(timeout=0), None)
+
+class PublishFromSessionTests(TestCase):
+    def create_app(self):
+        # Each session has its own connection to a database file and so cannot
+        # see the uncommitted changes of another
+        self.tmpdir = tempfile.mkdtemp()
+
+        class Config:
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(
+                self.tmpdir, 'db.sqlite')
+            TESTING = True
+            SLOW_QUERY_THRESHOLD = None
+            SQLITE_PRAGMAS = {}
+
+        return create_app(config_object=Config)
+
+    def setUp(self):
+        super(PublishFromSessionTests, self).setUp()
+        add_parties()
+        db.session.commit()
+        self.subscription = stream.get_broker().subscribe()
+
+    def tearDown(self):
+        super(PublishFromSessionTests, self).tearDown()
+        db.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def test_publish_from_other_session(self):
+        """Events are built using the session which is committed."""
+        session = Session(bind=db.engine)
+        try:
+            import_results(['A, 10, C, 20, L'], session=session)
+            session.commit()
+        finally:
+            session.close()
+
+        event = self.subscription.get(timeout=0)
+        self.assertEqual(
+            [c['name'] for c in event['constituencies']], ['A'])
+        self.assertEqual(event['constituencies'][0]['party']['id'], 'L')
+        self.assertEqual(
+            event['party_totals']['L']['constituency_count'], 1)
+
+class StreamAPITests(TestCase):
+    def test_stream(self):
+        """The stream endpoint sends events."""
+        add_parties()
+        db.session.commit()
+
+        r = self.client.get('/api/stream')
+        self.assertEqual(r.mimetype, 'text/event-stream')
+        chunks = (c.decode('utf8') for c in r.response)
+        self.assertTrue(next(chunks).startswith('retry:'))
+
+        import_results(['A, 10, C'])
+        db.session.commit()
+        chunk = next(chunks)
+        self.assertTrue(chunk.startswith('event: results\n'))
+        data = json.loads(chunk.split('data: ', 1)[1])
+        self.assertEqual(data['constituencies'][0]['name'], 'A')
+        r.close()
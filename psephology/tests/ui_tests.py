@@ -1,7 +1,11 @@
+import gzip
 from io import BytesIO
 from bs4 import BeautifulSoup
 
-from psephology.model import db, add_constituency_result_line, log
+from psephology.model import (
+    db, add_constituency_result_line, assign_constituency_region, log,
+    Constituency
+)
 from .util import TestCase
 from .fixtures import add_parties
 
@@ -52,6 +56,46 @@ class UITests(TestCase):
         self.assertIs(soup.find(id='no-results'), None)
         self.assertIsNot(soup.find(id='results-table'), None)
 
+    def test_constituency_totals(self):
+        """The table shows winning and total votes and the share."""
+        add_constituency_result_line('X, 10, C, 30, L')
+        r = self.client.get('/constituencies')
+        soup = BeautifulSoup(r.data, 'html.parser')
+        cells = [
+            td.get_text() for td in soup.find(id='results-table').find_all('td')]
+        self.assertEqual(cells, ['X', 'The L party', '30', '40', '75.0%'])
+
+    def test_constituency_cache_invalidated(self):
+        """Cached results are replaced after an import."""
+        add_constituency_result_line('X, 10, C')
+        db.session.commit()
+        r = self.client.get('/constituencies')
+        self.assertIn(b'The C party', r.data)
+
+        add_constituency_result_line('X, 10, C, 20, L')
+        db.session.commit()
+        r = self.client.get('/constituencies')
+        self.assertNotIn(b'The C party', r.data)
+        self.assertIn(b'The L party', r.data)
+
+    def test_regions_no_results(self):
+        """Regions with no results should have UI element saying so."""
+        r = self.client.get('/regions')
+        self.assertEqual(r.status_code, 200)
+        soup = BeautifulSoup(r.data, 'html.parser')
+        self.assertIsNot(soup.find(id='no-results'), None)
+        self.assertIs(soup.find(id='results'), None)
+
+    def test_regions_with_results(self):
+        """Regions with results should have tables."""
+        add_constituency_result_line('X, 10, C')
+        assign_constituency_region(Constituency.query.one(), 'R', 'N')
+        r = self.client.get('/regions')
+        self.assertEqual(r.status_code, 200)
+        soup = BeautifulSoup(r.data, 'html.parser')
+        self.assertIs(soup.find(id='no-results'), None)
+        self.assertIsNot(soup.find(id='results'), None)
+
     def test_log_no_results(self):
         """Log with no results should have UI element saying so."""
         r = self.client.get('/log')
@@ -69,6 +113,29 @@ class UITests(TestCase):
         self.assertIs(soup.find(id='no-results'), None)
         self.assertIsNot(soup.find(id='log'), None)
 
+    def test_log_pages(self):
+        """Log is paged with a link to older entries."""
+        self.app.config['LOG_PAGE_SIZE'] = 2
+        for idx in range(3):
+            log('message {}'.format(idx))
+        db.session.commit()
+
+        r = self.client.get('/log')
+        soup = BeautifulSoup(r.data, 'html.parser')
+        self.assertEqual(len(soup.find(id='log').find_all('li')), 2)
+        older = soup.find(id='older').find('a')['href']
+
+        r = self.client.get(older)
+        soup = BeautifulSoup(r.data, 'html.parser')
+        self.assertEqual(len(soup.find(id='log').find_all('li')), 1)
+        self.assertIn('message 0', soup.find(id='log').text)
+        self.assertIs(soup.find(id='older'), None)
+
+    def test_log_bad_cursor(self):
+        """A bad cursor is a bad request."""
+        r = self.client.get('/log?before=yesterday')
+        self.assertEqual(r.status_code, 400)
+
     def test_export(self):
         """Can get back a line from export."""
         add_constituency_result_line('X, 10, C')
@@ -76,6 +143,15 @@ class UITests(TestCase):
         self.assertEqual(r.status_code, 200)
         self.assertEqual(r.data.decode('utf8').strip(), 'X, 10, C')
 
+    def test_export_gzip(self):
+        """Export is compressed for clients which accept it."""
+        add_constituency_result_line('X, 10, C')
+        r = self.client.get(
+            '/export/results', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(r.data).decode('utf8'), 'X, 10, C')
+
     def test_import(self):
         """Import form renders"""
         r = self.client.get('/import')
@@ -95,3 +171,14 @@ class UITests(TestCase):
         })
         # If import succeeds then there should be a re-direct
         self.assertEqual(r.status_code, 302)
+
+    def test_import_compressed_results(self):
+        """Import compressed JSON results"""
+        data = gzip.compress(
+            b'[{"constituency": "X", "results": [{"party": "C", "count": 10}]}]')
+        r = self.client.post('/import/results', data={
+            'results': (BytesIO(data), 'foo.json.gz'),
+        })
+        self.assertEqual(r.status_code, 302)
+        votings = Constituency.query.filter_by(name='X').one().votings
+        self.assertEqual([(v.party.code, v.count) for v in votings], [('C', 10)])
@@ -1,4 +1,7 @@
+import contextlib
+
 from flask_testing import TestCase as FlaskTestCase
+from sqlalchemy import event
 from psephology.app import create_app
 from psephology.model import db
 
@@ -15,3 +18,91 @@ class TestCase(FlaskTestCase):
 
     def tearDown(self):
         db.session.remove()
+
+    def assertUsesIndex(self, plan, table, index):
+        """Assert that plan, as returned by :py:func:`query_plan`, looks up rows
+        of table via index.
+
+        """
+        self.assertTrue(
+            any(_plan_table(detail) == table and
+                'INDEX {}'.format(index) in detail for detail in plan),
+            'Plan does not use {} for {}:\n{}'.format(
+                index, table, '\n'.join(plan)))
+
+    def assertNoFullScan(self, plan, tables=None):
+        """Assert that plan, as returned by :py:func:`query_plan`, does not scan
+        every row of any of tables or, if tables is None, of any table. Building
+        an automatic index counts as a scan.
+
+        """
+        scans = [
+            detail for detail in plan
+            if (detail.startswith('SCAN ') or 'AUTOMATIC' in detail) and
+            (tables is None or _plan_table(detail) in tables)
+        ]
+        self.assertEqual(
+            scans, [], 'Plan has full scans:\n{}'.format('\n'.join(plan)))
+
+def query_plan(statement, parameters=()):
+    """Return the result of SQLite's ``EXPLAIN QUERY PLAN`` for statement, an
+    SQL string, as a list of plan details. Must be called within an application
+    context.
+
+    """
+    cursor = db.session.connection().connection.dbapi_connection.cursor()
+    try:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return [row[3] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+def compiled_plan(q):
+    """Return the query plan, as returned by :py:func:`query_plan`, for q, a
+    query or statement.
+
+    """
+    statement = getattr(q, 'statement', q)
+    compiled = statement.compile(
+        dialect=db.engine.dialect,
+        compile_kwargs=dict(render_postcompile=True))
+    return query_plan(str(compiled), [
+        compiled.params[name] for name in (compiled.positiontup or [])])
+
+@contextlib.contextmanager
+def captured_plans():
+    """A context manager which records the query plan of each ``SELECT``,
+    ``UPDATE`` and ``DELETE`` statement executed by the database engine. Yields
+    a list to which (statement, plan) pairs are appended where plan is as
+    returned by :py:func:`query_plan`.
+
+    """
+    plans = []
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                               executemany):
+        if executemany:
+            return
+        if statement.lstrip().split(' ', 1)[0].upper() not in (
+                'SELECT', 'UPDATE', 'DELETE'):
+            return
+        explain = conn.connection.dbapi_connection.cursor()
+        try:
+            explain.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            plans.append((statement, [row[3] for row in explain.fetchall()]))
+        finally:
+            explain.close()
+
+    event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+    try:
+        yield plans
+    finally:
+        event.remove(
+            db.engine, 'before_cursor_execute', _before_cursor_execute)
+
+def _plan_table(detail):
+    # Return the table or alias named by a SCAN or SEARCH plan detail
+    words = detail.split()
+    if len(words) < 2 or words[0] not in ('SCAN', 'SEARCH'):
+        return None
+    return words[1]
@@ -1,8 +1,9 @@
 from __future__ import division
 
+import datetime
 import unittest
 
-from psephology._util import token_urlsafe
+from psephology._util import token_urlsafe, format_cursor, parse_cursor
 
 # URL safe characters used in Base64
 URL_SAFE='ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
@@ -34,6 +35,14 @@ def token_with_entropy_test():
         expected_length = (5 + (nbytes * 8)) // 6
         assert len(token) == expected_length
 
+def cursor_round_trip_test():
+    """
+    parse_cursor() is the inverse of format_cursor()
+
+    """
+    created_at = datetime.datetime(2017, 6, 9, 2, 30, 15, 123456)
+    assert parse_cursor(format_cursor(created_at, 42)) == (created_at, 42)
+
 def _assert_url_safe(s):
     """Asserts that the passed string contains only URL-safe characters."""
     for c in s:
@@ -1,15 +1,22 @@
+import io
+
 from flask import (
     Blueprint, current_app, render_template, redirect, url_for,
-    request, abort, flash, Response
+    request, abort, flash
 )
 from sqlalchemy import desc
-from sqlalchemy.orm import joinedload
 
-from psephology.model import (
-    db, Voting, Constituency, LogEntry,
-    import_results as model_import_results
+from psephology.io import (
+    guess_results_format, open_decompressed, result_records
+)
+from psephology.model import read_only, Constituency, ImportProfile
+from psephology.cache import (
+    cached_fragment, fragment_response, render_fragment
 )
+from psephology.coordinator import get_coordinator
 import psephology.query as query
+import psephology.resultset as resultset
+from psephology._util import format_cursor, parse_cursor
 
 blueprint = Blueprint('ui', __name__, template_folder='templates/ui')
 
@@ -18,29 +25,65 @@ def index():
     return redirect(url_for('ui.summary'))
 
 @blueprint.route('/summary')
+@read_only
 def summary():
-    results = (
-        query.party_totals()
-        .order_by(desc('constituency_count'))
-    ).all()
-    return render_template('summary.html', results=results)
+    def _context():
+        results = (
+            query.party_totals()
+            .order_by(desc('constituency_count'))
+        ).all()
+        return dict(results=results)
+
+    table = render_fragment('_fragments/summary_table.html', _context)
+    return render_template('summary.html', table=table)
+
+@blueprint.route('/regions')
+@read_only
+def regions():
+    results = query.regional_summary().all()
+    return render_template('regions.html', results=results)
 
 @blueprint.route('/constituencies')
+@read_only
 def constituencies():
-    results = (
-        query.constituency_winners().order_by(Constituency.name)
-        .options(
-            joinedload(Voting.party)
-        )
-    ).all()
-    return render_template('constituencies.html', results=results)
+    def _context():
+        results = resultset.winners(
+            query.constituency_winner_columns().order_by(Constituency.name))
+        return dict(results=results)
+
+    table = render_fragment('_fragments/constituencies_table.html', _context)
+    return render_template('constituencies.html', table=table)
 
 @blueprint.route('/log')
+@read_only
 def log():
+    try:
+        before = request.args.get('before')
+        before = parse_cursor(before) if before is not None else None
+    except ValueError:
+        abort(400)
+
+    results, next_before = query.log_page(
+        before=before, limit=current_app.config.get('LOG_PAGE_SIZE', 50))
+    return render_template(
+        'log.html', results=results,
+        next_cursor=(
+            format_cursor(*next_before) if next_before is not None else None
+        ))
+
+@blueprint.route('/slow-queries')
+@read_only
+def slow_queries():
+    # The endpoint is passed as "view" since url_for() reserves "endpoint"
+    view = request.args.get('view')
+    slowest_first = request.args.get('order') == 'duration'
     results = (
-        LogEntry.query.order_by(desc(LogEntry.created_at))
+        query.slow_queries(endpoint=view, slowest_first=slowest_first)
+        .limit(current_app.config.get('LOG_PAGE_SIZE', 50))
     ).all()
-    return render_template('log.html', results=results)
+    return render_template(
+        'slow_queries.html', results=results, view=view,
+        slowest_first=slowest_first)
 
 @blueprint.route('/import')
 def import_form():
@@ -53,32 +96,43 @@ def import_results():
     if fobj is None:
         abort(400)
 
-    # Interpret incoming data as UTF-8 text. If this fails, abort with a 400 Bad
-    # Request error.
-    data = fobj.read()
+    # Interpret incoming data as UTF-8 text, decompressing it if necessary. If
+    # this fails, abort with a 400 Bad Request error. The file is read as it is
+    # imported.
+    profile = ImportProfile()
     try:
-        results = data.decode('utf8').strip().splitlines()
-    except UnicodeDecodeError:
+        stream = open_decompressed(
+            fobj.stream, filename=fobj.filename,
+            max_ratio=current_app.config['IMPORT_MAX_COMPRESSION_RATIO'])
+        records, parser = result_records(
+            io.TextIOWrapper(stream, encoding='utf8'),
+            guess_results_format(fobj.filename or ''))
+        diagnostics = get_coordinator().submit(
+            records,
+            suggest_matches=current_app.config['IMPORT_SUGGEST_MATCHES'],
+            parser=parser, profile=profile)
+    except ValueError:
         abort(400)
 
-    diagnostics = model_import_results(results)
-    db.session.commit()
-
     flash('Processed {} line(s) with {} issue(s)'.format(
-        len(results), len(diagnostics)))
+        profile.counts['parse'], len(diagnostics)))
 
     # Redirect to the index
     return redirect(url_for('ui.index'))
 
 @blueprint.route('/export/results')
+@read_only
 def export_results():
-    q = Constituency.query.options(joinedload(Constituency.votings))
-    output = []
-    for con in q:
-        output.append(', '.join(
-            [con.name] + [
-                '{}, {}'.format(v.count, v.party_id)
-                for v in con.votings
-            ]
-        ))
-    return Response('\n'.join(output), mimetype='text/plain')
+    def _render():
+        output = []
+        for r in resultset.votes():
+            output.append(', '.join(
+                [r.name] + [
+                    '{}, {}'.format(count, code)
+                    for count, code in r.votes
+                ]
+            ))
+        return '\n'.join(output)
+
+    return fragment_response(
+        cached_fragment('export_results', _render), 'text/plain')